@@ -0,0 +1,267 @@
+"""
+Admission control in front of Groq and Chromium.
+
+Every LLM call and every browser page takes a slot from a limiter first:
+- "llm": all completions of this worker
+- "llm:<model>": completions of one model (rate limits are per model)
+- "browser": browser pages
+
+Each limiter adapts its limit AIMD style (like TCP congestion control):
+- a call succeeds in about the usual time: the limit grows by 1 per "limit" calls
+- a 429 / 503 / timeout (or Chromium over its memory budget): the limit is cut, at most
+  once per round trip (x0.5)
+- per model limiters only: latency over ADMISSION_LATENCY_TOLERANCE times the unloaded
+  latency cuts the limit too (x0.9). "llm" mixes small and large models and "browser"
+  mixes sites, a slow call there is usually just a different model / site, so they
+  only react to errors
+The limit stays between 1 and the resource's hard cap (GROQ_MAX_CONCURRENCY,
+ADMISSION_MODEL_MAX, BROWSER_MAX_PAGES).
+
+Callers over the limit wait in a FIFO queue for at most ADMISSION_WAIT seconds
+(default 10, browsers twice that). When ADMISSION_QUEUE (default 64) callers are already
+waiting, or the wait runs out, the request is shed right away with 503 and a
+Retry-After estimated from the queue, instead of piling up until everything fails.
+
+Limits, queue depth, in flight calls and wait times are on /stats/admission (and the
+first three as admission_limit / admission_in_flight / admission_queued on /metrics).
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from .metrics import counter, gauge
+
+QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE", "64"))
+WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT", "10"))
+MODEL_MAX = int(os.getenv("ADMISSION_MODEL_MAX", "32"))
+LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "3"))
+# longest Retry-After we send back, whatever the estimate or upstream says
+MAX_RETRY_AFTER = 60
+
+ERROR_BACKOFF = 0.5
+LATENCY_BACKOFF = 0.9
+# samples before latency alone is trusted to cut the limit
+WARMUP_SAMPLES = 20
+# status codes that mean "too much load", from Groq or anything else behind a limiter
+OVERLOAD_STATUS = {429, 503, 529}
+
+ADMISSIONS = counter("admission_total", "Limiter decisions per resource (admitted, queued, shed, timeout)")
+WAIT_TIME = counter("admission_wait_seconds_total", "Seconds spent waiting for a slot per resource")
+
+
+class Overloaded(HTTPException):
+    def __init__(self, resource: str, retry_after: int):
+        retry_after = min(max(int(retry_after), 1), MAX_RETRY_AFTER)
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy ({resource}), try again in {retry_after}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+def is_overload(error: BaseException) -> bool:
+    # shed by another limiter (nested slots), that one already adapted
+    if isinstance(error, Overloaded):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # groq / httpx / playwright timeouts
+    if "Timeout" in type(error).__name__:
+        return True
+    return getattr(error, "status_code", None) in OVERLOAD_STATUS
+
+
+class Ticket:
+    # set .overloaded to report a soft overload signal for a call that otherwise succeeded
+    def __init__(self):
+        self.overloaded = False
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, max_limit: int, initial: Optional[int] = None, wait: float = WAIT_SECONDS,
+                 queue_size: int = QUEUE_SIZE, latency_signal: bool = True):
+        self.name = name
+        # whether slow calls cut the limit, only when the calls are alike
+        self.latency_signal = latency_signal
+        self.max_limit = max(max_limit, 1)
+        self.limit = float(min(initial or self.max_limit, self.max_limit))
+        self.wait = wait
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+        self.samples = 0
+        self.latency = 0.0  # moving average
+        self.baseline: Optional[float] = None  # latency without load, follows the lows
+        self.last_decrease = 0.0
+        self.waits: Deque[float] = deque(maxlen=512)
+
+    @property
+    def capacity(self) -> int:
+        return max(int(self.limit), 1)
+
+    def retry_after(self) -> int:
+        # time for the queue ahead to drain at the current limit
+        per_call = self.latency or 1.0
+        return min(max(math.ceil((len(self.waiters) + 1) * per_call / self.capacity), 1), MAX_RETRY_AFTER)
+
+    def _shed(self, result: str):
+        ADMISSIONS.inc(resource=self.name, result=result)
+        raise Overloaded(self.name, self.retry_after())
+
+    async def acquire(self, deadline: Optional[float] = None):
+        """Takes a slot, raises Overloaded when the queue is full or the wait runs out."""
+        if self.in_flight < self.capacity and not self.waiters:
+            self.in_flight += 1
+            ADMISSIONS.inc(resource=self.name, result="admitted")
+            self.waits.append(0.0)
+            return
+        if len(self.waiters) >= self.queue_size:
+            self._shed("shed")
+
+        timeout = self.wait
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            self._shed("shed")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._discard(future)
+            self._record_wait(started)
+            self._shed("timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as the caller went away
+                self._release_slot()
+            else:
+                self._discard(future)
+            raise
+        ADMISSIONS.inc(resource=self.name, result="queued")
+        self._record_wait(started)
+
+    def _discard(self, future: asyncio.Future):
+        try:
+            self.waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _record_wait(self, started: float):
+        waited = time.monotonic() - started
+        self.waits.append(waited)
+        WAIT_TIME.inc(waited, resource=self.name)
+
+    def _wake(self):
+        # hand free slots to the oldest waiters, the slot is taken on their behalf
+        while self.waiters and self.in_flight < self.capacity:
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def release(self, latency: Optional[float], overloaded: bool):
+        """latency None: the call failed for its own reasons, the limit is left alone."""
+        if latency is not None or overloaded:
+            self._adjust(latency, overloaded)
+        self._release_slot()
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        # one cut per round trip, a burst of 429s is a single signal
+        if now - self.last_decrease < max(self.latency, 1.0):
+            return
+        self.last_decrease = now
+        self.limit = max(self.limit * factor, 1.0)
+
+    def _adjust(self, latency: Optional[float], overloaded: bool):
+        if overloaded:
+            self._decrease(ERROR_BACKOFF)
+            return
+
+        self.samples += 1
+        self.latency = latency if self.samples == 1 else 0.9 * self.latency + 0.1 * latency
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # slowly forget an old minimum (the model / site may just have got slower)
+            self.baseline += (latency - self.baseline) * 0.01
+
+        if self.latency_signal and self.samples > WARMUP_SAMPLES and latency > self.baseline * LATENCY_TOLERANCE:
+            self._decrease(LATENCY_BACKOFF)
+        elif self.in_flight + len(self.waiters) >= self.capacity:
+            # only grow a limit that is actually used
+            self.limit = min(self.limit + 1.0 / self.limit, float(self.max_limit))
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        await self.acquire(deadline)
+        ticket = Ticket()
+        started = time.monotonic()
+        try:
+            yield ticket
+        except BaseException as e:
+            overloaded = is_overload(e)
+            self.release(time.monotonic() - started if overloaded else None, overloaded)
+            raise
+        self.release(time.monotonic() - started, ticket.overloaded)
+
+    def snapshot(self) -> Dict:
+        waits = sorted(self.waits)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(int(len(waits) * p), len(waits) - 1)], 4) if waits else 0.0
+
+        return {
+            "limit": round(self.limit, 2),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "queue_size": self.queue_size,
+            "latency": round(self.latency, 4),
+            "baseline_latency": round(self.baseline or 0.0, 4),
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": round(waits[-1], 4) if waits else 0.0,
+        }
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+
+
+def limiter(name: str, max_limit: int, **options) -> AdaptiveLimiter:
+    # Same name always gives back the same limiter (first caller sets the options)
+    if name not in _limiters:
+        _limiters[name] = AdaptiveLimiter(name, max_limit, **options)
+    return _limiters[name]
+
+
+def limiter_gauge(field: str):
+    return lambda: [({"limiter": name}, l.snapshot()[field]) for name, l in sorted(_limiters.items())]
+
+
+gauge("admission_limit", "Current adaptive limit per limiter", limiter_gauge("limit"))
+gauge("admission_in_flight", "Calls holding a slot per limiter", limiter_gauge("in_flight"))
+gauge("admission_queued", "Callers waiting for a slot per limiter", limiter_gauge("queued"))
+
+
+# Stats route
+async def get_admission_stats():
+    return {name: l.snapshot() for name, l in sorted(_limiters.items())}
@@ -0,0 +1,257 @@
+"""
+Batch versions of /manual-check, /check-raw and /suggestions for catalog ingest.
+
+POST a JSON list of the same items the single endpoint takes. The response is NDJSON
+(one JSON object per line) in completion order, each line tagged with the index of
+its input:
+
+    {"index": 3, "cache": "HIT", "result": {"extracted-text": "..."}}
+
+- at most BATCH_MAX_ITEMS (default 100) items per request, larger bodies get 413
+- identical items are only computed once (every index still gets its line)
+- cached items are sent right away
+- the rest run at most BATCH_CONCURRENCY (default 8) at a time
+- manual / raw checks with short inputs are packed BATCH_PACK_SIZE (default 5) per
+  prompt. If the packed answer can't be split back per item, those items are retried
+  one by one. Suggestions are never packed, one answer already fills the token limit.
+
+Packed answers come from another prompt (PACK_INSTRUCTIONS), another route and JSON
+mode, so they are cached under their own keys (pack_key), never under the keys of the
+single endpoints.
+"""
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .cache import MISSING, cache_key, llm_cache, should_cache, template_version
+from .endpoints import (
+    MANUAL_CHECK_MODEL, MANUAL_CHECK_TEMPERATURE, SUGGESTION_MODEL, SUGGESTION_TEMPERATURE,
+    ManualInput, SuggestionInput,
+    knowledge_version,
+    raw_to_llm, send_to_llm, suggestion_from_llm,
+)
+from .ingredients import screen
+from .llm import chat_completion
+from .model_router import route, route_version
+from .prompts import Prompt, prompts
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", "5"))
+# only inputs shorter than this are packed together
+PACK_MAX_CHARS = int(os.getenv("BATCH_PACK_MAX_CHARS", "600"))
+
+PACK_INSTRUCTIONS = (
+    "\n\nBATCH MODE: you will receive several numbered requests. Evaluate each one on its own, "
+    "exactly as described above. Return ONE JSON object of the form "
+    "{\"results\": [<response for request 1>, <response for request 2>, ...]} "
+    "with exactly one response per request, in the same order.\n\n"
+)
+
+
+PACK_VERSION = template_version(PACK_INSTRUCTIONS)
+
+
+def check_size(items: List):
+    # one request must not queue thousands of completions and hold every admission slot
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch, got {len(items)}")
+
+
+def pack_key(endpoint: str, version: str, payload: Any) -> str:
+    """Cache key of one item answered in a packed prompt."""
+    return cache_key(f"{endpoint}:packed", route_version("manual-check-pack", MANUAL_CHECK_MODEL),
+                     f"{version}:{PACK_VERSION}", payload)
+
+
+async def pack_to_llm(prompt: Prompt, requests: List[str]) -> Optional[List[str]]:
+    """One completion for several small checks, None if the answer doesn't split back cleanly."""
+    numbered = "\n\n".join(f"Request {i + 1}:\n{text}" for i, text in enumerate(requests))
+    completion = await chat_completion(**route("manual-check-pack", prompt, dict(
+        model=MANUAL_CHECK_MODEL,
+        messages=[{'role': 'user', 'content': prompt.text + PACK_INSTRUCTIONS + numbered}],
+        temperature=MANUAL_CHECK_TEMPERATURE,
+        max_completion_tokens=min(512 * len(requests), 4096),
+        top_p=1,
+        stream=False,
+        response_format={'type': 'json_object'},
+        stop=None,
+    )))
+    try:
+        results = json.loads(completion.choices[0].message.content)["results"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not isinstance(results, list) or len(results) != len(requests):
+        return None
+    # same shape as the single endpoint, which returns the model's JSON as text
+    return [json.dumps(result, ensure_ascii=False) for result in results]
+
+
+async def run_batch(
+    endpoint: str,
+    keys: List[str],
+    compute: Callable[[int], Awaitable[Any]],
+    to_body: Callable[[Any], Dict],
+    error_body: Callable[[Exception], Dict],
+    cache_enabled: bool,
+    pack: Optional[Callable[[List[int]], Awaitable[Optional[List[Any]]]]] = None,
+    packable: Callable[[int], bool] = lambda i: False,
+    pack_keys: Optional[List[str]] = None,
+) -> StreamingResponse:
+    # unique key -> every input index asking for it
+    groups: "OrderedDict[str, List[int]]" = OrderedDict()
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+
+    lines: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    emitted = set()
+
+    def emit(key: str, cache: str, body: Dict):
+        emitted.add(key)
+        for index in groups[key]:
+            lines.put_nowait(json.dumps({"index": index, "cache": cache, "result": body}, ensure_ascii=False) + "\n")
+
+    async def run_one(key: str):
+        # first index of the group is the representative input
+        index = groups[key][0]
+        async with semaphore:
+            try:
+                value, status = await llm_cache.get_or_compute(
+                    key, lambda: compute(index), endpoint=endpoint, enabled=cache_enabled
+                )
+                emit(key, status, to_body(value))
+            except Exception as e:
+                emit(key, "MISS", error_body(e))
+
+    def packed_key(key: str) -> str:
+        return pack_keys[groups[key][0]]
+
+    async def run_pack(packed: List[str]):
+        async with semaphore:
+            try:
+                values = await pack([groups[key][0] for key in packed])
+            except Exception:
+                values = None
+        if values is None:
+            # couldn't split the packed answer, do them one by one
+            await asyncio.gather(*(run_one(key) for key in packed))
+            return
+        for key, value in zip(packed, values):
+            if cache_enabled:
+                await llm_cache.set(packed_key(key), value)
+            emit(key, "PACKED", to_body(value))
+
+    async def produce():
+        try:
+            pending = []
+            for key in groups:
+                cached = await llm_cache.get(key) if cache_enabled else MISSING
+                if cached is not MISSING:
+                    emit(key, "HIT", to_body(cached))
+                else:
+                    pending.append(key)
+
+            small = [key for key in pending if pack is not None and pack_keys is not None and packable(groups[key][0])]
+            if cache_enabled:
+                # answered in an earlier pack
+                for key in list(small):
+                    cached = await llm_cache.get(packed_key(key))
+                    if cached is not MISSING:
+                        emit(key, "HIT", to_body(cached))
+                        small.remove(key)
+                        pending.remove(key)
+            single = [key for key in pending if key not in small]
+            jobs = [run_one(key) for key in single]
+            jobs += [run_pack(small[i:i + PACK_SIZE]) for i in range(0, len(small), PACK_SIZE)]
+            await asyncio.gather(*jobs)
+        except Exception as e:
+            # never leave the stream waiting for lines that will not come
+            for key in groups:
+                if key not in emitted:
+                    emit(key, "MISS", error_body(e))
+
+    async def stream():
+        producer = asyncio.ensure_future(produce())
+        try:
+            for _ in range(len(keys)):
+                yield await lines.get()
+        finally:
+            # client went away: stop the work we haven't started yet
+            producer.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# Manual check batch route
+async def manual_check_batch(items: List[ManualInput]):
+    check_size(items)
+    prompt = prompts.get("manual-check")
+    version = knowledge_version(prompt)
+    data = [{'claims': item.claims, 'ingredients': item.ingredients} for item in items]
+    screenings = [screen(d['claims'], d['ingredients']) for d in data]
+
+    async def pack(indexes):
+        requests = [
+            f"Claims: {data[i]['claims']}\nIngredients: {data[i]['ingredients']}\n{screenings[i]['context']}".rstrip()
+            for i in indexes
+        ]
+        return await pack_to_llm(prompt, requests)
+
+    return await run_batch(
+        "manual-check",
+        [cache_key("manual-check", route_version("manual-check", MANUAL_CHECK_MODEL), version, d) for d in data],
+        compute=lambda i: send_to_llm(data[i], prompt, screenings[i]),
+        to_body=lambda result: {"extracted-text": result},
+        error_body=lambda e: {"extracted-text": f"Error: {str(e)}"},
+        cache_enabled=should_cache(MANUAL_CHECK_TEMPERATURE),
+        pack=pack,
+        pack_keys=[pack_key("manual-check", version, d) for d in data],
+        # locally decided items never reach the model, no point packing them
+        packable=lambda i: not screenings[i]['verdict'] and len(data[i]['claims']) + len(data[i]['ingredients']) <= PACK_MAX_CHARS,
+    )
+
+
+# Check raw batch route, body is a list of raw strings
+async def check_raw_batch(items: List[str]):
+    check_size(items)
+    prompt = prompts.get("manual-check")
+    version = prompt.version
+
+    async def pack(indexes):
+        return await pack_to_llm(prompt, [items[i] for i in indexes])
+
+    return await run_batch(
+        "check-raw",
+        [cache_key("check-raw", route_version("check-raw", MANUAL_CHECK_MODEL), version, text) for text in items],
+        compute=lambda i: raw_to_llm(items[i], prompt),
+        to_body=lambda result: {"extracted-text": result},
+        error_body=lambda e: {"extracted-text": f"Error: {str(e)}"},
+        cache_enabled=should_cache(MANUAL_CHECK_TEMPERATURE),
+        pack=pack,
+        pack_keys=[pack_key("check-raw", version, text) for text in items],
+        packable=lambda i: len(items[i]) <= PACK_MAX_CHARS,
+    )
+
+
+# Suggestions batch route
+async def suggestions_batch(items: List[SuggestionInput]):
+    check_size(items)
+    prompt = prompts.get("suggestion")
+    version = knowledge_version(prompt)
+    data = [{'ingredients': item.ingredients, 'claims': item.claims} for item in items]
+
+    return await run_batch(
+        "suggestions",
+        [cache_key("suggestions", route_version("suggestions", SUGGESTION_MODEL), version, d) for d in data],
+        compute=lambda i: suggestion_from_llm(data[i], prompt),
+        to_body=lambda result: {"response": result},
+        error_body=lambda e: {"response": f"Error: {str(e)}"},
+        cache_enabled=should_cache(SUGGESTION_TEMPERATURE),
+    )
@@ -0,0 +1,227 @@
+"""
+Content addressed result cache for LLM verdicts.
+
+Keys are a hash of (endpoint, model, prompt template version, normalized input), so
+the same claims + ingredients sent by many users only pay for one completion, and
+editing a prompt template automatically invalidates its old answers.
+
+Two tiers:
+- in process: LRU with a TTL (always on)
+- SQLite: optional, shared by all uvicorn workers on the machine (LLM_CACHE_DB=path)
+
+Deterministic calls (temperature 0) are cached by default. Sampled calls (suggestions,
+health) only when LLM_CACHE_SAMPLED=1, since the user may expect a new answer.
+
+- LLM_CACHE_TTL: seconds an entry stays valid (default 24h)
+- LLM_CACHE_MAX_ENTRIES: in process LRU size (default 2048)
+- LLM_CACHE_DB_MAX_ENTRIES: rows kept in SQLite (default 50000)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from .metrics import counter
+from .offload import run_io
+from .singleflight import SingleFlight
+from .tracing import span
+
+CACHE_LOOKUPS = counter("llm_cache_lookups_total", "LLM result cache lookups by endpoint and result")
+
+# sentinel for "not in cache", None can be a cached value
+MISSING = object()
+
+
+def normalize_text(value: str) -> str:
+    # Case and whitespace don't change the verdict
+    return re.sub(r'\s+', ' ', value).strip().casefold()
+
+
+def normalize_input(value: Any) -> Any:
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        return {k: normalize_input(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_input(v) for v in value]
+    return value
+
+
+def template_version(template: str) -> str:
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]
+
+
+def cache_key(endpoint: str, model: str, version: str, payload: Any) -> str:
+    raw = json.dumps(
+        [endpoint, model, version, normalize_input(payload)],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class TTLCache:
+    # In process LRU, entries expire after ttl seconds
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return MISSING
+        expires, value = entry
+        if expires < time.time():
+            del self.entries[key]
+            return MISSING
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.entries[key] = (time.time() + (ttl or self.ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self.entries.pop(key, None)
+
+
+class SQLiteCache:
+    # Shared between workers, values are stored as JSON
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.conn.commit()
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return MISSING
+            if row[1] < now:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return MISSING
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + (ttl or self.ttl), now),
+            )
+            self.writes += 1
+            # prune every 100 writes: expired rows first, then least recently used
+            if self.writes % 100 == 0:
+                self.conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+                self.conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self.conn.commit()
+
+    def delete(self, key: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        name: str,
+        db_path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.name = name
+        self.ttl = ttl or float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+        self.memory = TTLCache(max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048")), self.ttl)
+        self.disk = None
+        if db_path:
+            self.disk = SQLiteCache(db_path, int(os.getenv("LLM_CACHE_DB_MAX_ENTRIES", "50000")), self.ttl)
+        # concurrent misses for the same key share one computation
+        self.flights = SingleFlight(name)
+
+    async def get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is MISSING and self.disk is not None:
+            value = await run_io(self.disk.get, key)
+            if value is not MISSING:
+                # promote to the in process tier
+                self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            await run_io(self.disk.set, key, value, ttl)
+
+    async def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            await run_io(self.disk.delete, key)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        endpoint: str,
+        enabled: bool = True,
+    ) -> Tuple[Any, str]:
+        """Returns (value, "HIT" | "MISS" | "BYPASS"). compute() raising means nothing is stored.
+
+        Concurrent calls with the same key (cached or not) await a single compute().
+        """
+        # one span per lookup, named after the result: stage "manual-check.hit", "manual-check.miss"...
+        with span(endpoint, cache=self.name) as lookup:
+            if not enabled:
+                CACHE_LOOKUPS.inc(cache=self.name, endpoint=endpoint, result="BYPASS")
+                lookup.name = f"{endpoint}.bypass"
+                return await self.flights.do(key, compute), "BYPASS"
+
+            value = await self.get(key)
+            if value is not MISSING:
+                CACHE_LOOKUPS.inc(cache=self.name, endpoint=endpoint, result="HIT")
+                lookup.name = f"{endpoint}.hit"
+                return value, "HIT"
+
+            CACHE_LOOKUPS.inc(cache=self.name, endpoint=endpoint, result="MISS")
+            lookup.name = f"{endpoint}.miss"
+
+            async def compute_and_store():
+                value = await compute()
+                await self.set(key, value)
+                return value
+
+            return await self.flights.do(key, compute_and_store), "MISS"
+
+
+def should_cache(temperature: float) -> bool:
+    # temperature 0 gives the same answer every time, anything else is opt-in
+    return temperature == 0 or os.getenv("LLM_CACHE_SAMPLED", "0") == "1"
+
+
+llm_cache = ResultCache("llm", db_path=os.getenv("LLM_CACHE_DB") or None)
@@ -0,0 +1,165 @@
+"""
+Conversation history for /chat.
+
+The frontend sends the whole conversation on every turn. Instead of pasting all of it
+into one message, the history is sent as role tagged messages:
+- the last CHAT_HISTORY_TURNS turns (default 6) verbatim
+- everything older as one rolling summary, written by a small model
+
+Summaries are cached by a hash of the conversation prefix they cover (the hash is
+chained turn by turn), and older turns are folded in CHAT_SUMMARY_EVERY turns at a
+time (default 4): the next turns of a conversation reuse the cached summary and only
+summarize the new turns, if anything. The summary + recent turns are kept within
+CHAT_HISTORY_TOKENS (default 1500), older verbatim turns are summarized first.
+
+previous_convo items can be [question, answer] pairs or [role, text] pairs.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .cache import ResultCache
+from .llm import chat_completion
+from .prompts import account, estimate_tokens, prompts
+from .tracing import span
+
+HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "6"))
+HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+SUMMARY_EVERY = int(os.getenv("CHAT_SUMMARY_EVERY", "4"))
+SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_MAX_TOKENS = 256
+
+ROLES = {
+    "user": "user", "human": "user", "question": "user",
+    "assistant": "assistant", "bot": "assistant", "ai": "assistant", "model": "assistant", "answer": "assistant",
+}
+
+# summaries are deterministic enough to share between users and workers
+summary_cache = ResultCache("chat-summary", db_path=os.getenv("LLM_CACHE_DB"))
+
+Turn = List[Dict[str, str]]
+
+
+def to_turns(previous_convo: List[List[str]]) -> List[Turn]:
+    """Groups the history into turns, a turn starts with a user message."""
+    messages = []
+    for item in previous_convo:
+        if len(item) == 2 and str(item[0]).strip().casefold() in ROLES:
+            messages.append({"role": ROLES[str(item[0]).strip().casefold()], "content": str(item[1])})
+        else:
+            # [question, answer, ...]
+            for i, text in enumerate(item):
+                messages.append({"role": "user" if i % 2 == 0 else "assistant", "content": str(text)})
+
+    turns: List[Turn] = []
+    for message in messages:
+        if not message["content"].strip():
+            continue
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def prefix_hashes(turns: List[Turn]) -> List[str]:
+    # hashes[i] covers turns[:i + 1], each one built on the previous
+    hashes = []
+    previous = ""
+    for turn in turns:
+        previous = hashlib.sha256((previous + json.dumps(turn, sort_keys=True)).encode("utf-8")).hexdigest()
+        hashes.append(previous)
+    return hashes
+
+
+def turn_tokens(turn: Turn) -> int:
+    return sum(estimate_tokens(message["content"]) + 4 for message in turn)
+
+
+def render(turns: List[Turn]) -> str:
+    return "\n".join(f"{message['role']}: {message['content']}" for turn in turns for message in turn)
+
+
+async def fold(summary: str, turns: List[Turn]) -> str:
+    prompt = prompts.get("chat-summary")
+    completion = await chat_completion(**account("chat-summary", prompt, dict(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": prompt.text},
+            {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNext part of the conversation:\n{render(turns)}"},
+        ],
+        temperature=0,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        top_p=1,
+        stream=False,
+        stop=None,
+    )))
+    return completion.choices[0].message.content.strip()
+
+
+async def summarize(turns: List[Turn], hashes: List[str]) -> str:
+    """Summary of all of `turns`, starting from the longest prefix already summarized."""
+    version = prompts.get("chat-summary").version
+    start, previous = 0, ""
+    for i in range(len(turns), 0, -1):
+        cached = await summary_cache.get(f"{version}:{hashes[i - 1]}")
+        if isinstance(cached, str):
+            start, previous = i, cached
+            break
+    if start == len(turns):
+        return previous
+
+    key = f"{version}:{hashes[len(turns) - 1]}"
+    summary, _ = await summary_cache.get_or_compute(key, lambda: fold(previous, turns[start:]), endpoint="chat")
+    return summary
+
+
+def split_point(turns: List[Turn]) -> int:
+    """How many of the oldest turns go into the summary."""
+    older = max(len(turns) - HISTORY_TURNS, 0)
+    # only move the boundary every SUMMARY_EVERY turns, so most requests reuse a summary
+    boundary = older - older % SUMMARY_EVERY
+    budget = HISTORY_TOKENS - (SUMMARY_MAX_TOKENS if boundary or older else 0)
+    while boundary < len(turns) - 1 and sum(turn_tokens(t) for t in turns[boundary:]) > budget:
+        boundary += 1
+    return boundary
+
+
+def clip(turn: Turn, budget: int) -> Turn:
+    # a single turn over the budget, keep the start of each message
+    share = max(budget // max(len(turn), 1), 32)
+    clipped = []
+    for message in turn:
+        words = message["content"].split()
+        while words and estimate_tokens(" ".join(words)) > share:
+            words = words[:int(len(words) * 0.8)]
+        clipped.append({**message, "content": " ".join(words) + " ..."})
+    return clipped
+
+
+async def history_messages(previous_convo: List[List[str]]) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """Role tagged messages for the history, and the summary used (if any)."""
+    turns = to_turns(previous_convo)
+    if not turns:
+        return [], None
+
+    boundary = split_point(turns)
+    recent = turns[boundary:]
+    if turn_tokens(recent[-1]) > HISTORY_TOKENS:
+        recent = [clip(recent[-1], HISTORY_TOKENS)]
+
+    summary = None
+    if boundary:
+        try:
+            with span("chat.summarize", turns=boundary):
+                summary = await summarize(turns[:boundary], prefix_hashes(turns[:boundary]))
+        except Exception as e:
+            # answering without the old turns beats not answering
+            print(f"Chat summary failed, dropping {boundary} old turns: {e}")
+
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    messages += [message for turn in recent for message in turn]
+    return messages, summary
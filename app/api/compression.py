@@ -0,0 +1,176 @@
+"""
+Response compression and ETags.
+
+Pure ASGI middleware, so streamed responses (SSE, NDJSON batches) go through untouched
+and nothing is buffered unless it was already a single body.
+
+For a complete response body:
+- bodies of at least COMPRESS_MIN_SIZE bytes (default 1024) with a text/JSON content type
+  are compressed with brotli (if installed and accepted) or gzip
+- GET responses get a strong ETag (sha256 of the body, or the ETag the handler
+  already set) with the encoding appended, and a matching If-None-Match gets a 304
+- compressed bytes of GET responses are kept per (ETag, encoding), so the Explore
+  dataset is compressed once per version instead of on every hit
+
+Settings (.env):
+- COMPRESS_MIN_SIZE: smallest body worth compressing (default 1024)
+- COMPRESS_GZIP_LEVEL: 1-9 (default 6)
+- COMPRESS_BROTLI_QUALITY: 0-11 (default 5)
+- COMPRESS_CACHE_ENTRIES: compressed GET bodies kept in memory (default 64)
+"""
+
+import gzip
+import hashlib
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .cache import MISSING, TTLCache
+from .metrics import counter
+from .offload import run_cpu
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+CACHE_ENTRIES = int(os.getenv("COMPRESS_CACHE_ENTRIES", "64"))
+
+COMPRESSIBLE = ("application/json", "text/", "application/javascript", "application/xml")
+# these are consumed as they arrive, buffering them would defeat the point
+STREAMED = ("text/event-stream", "application/x-ndjson")
+
+RESPONSES = counter("http_compression_total", "Responses by encoding (identity, gzip, br, not_modified)")
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    # each encoding is a different set of bytes, so it needs its own strong validator
+    if not encoding:
+        return etag
+    return etag[:-1] + "-" + encoding + '"' if etag.endswith('"') else f'"{etag}-{encoding}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressed = TTLCache(max_entries=CACHE_ENTRIES, ttl=3600)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        cacheable = scope["method"] == "GET"
+        encoding = accepted_encoding(request_headers.get("accept-encoding", ""))
+        if_none_match = request_headers.get("if-none-match")
+
+        start = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if headers.get("content-encoding") or content_type.startswith(STREAMED):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # a real stream, send it as is
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            await self.finish(start, message.get("body", b""), cacheable, encoding, if_none_match, send)
+
+        await self.app(scope, receive, wrapped_send)
+
+    async def finish(self, start, body: bytes, cacheable: bool, encoding: Optional[str], if_none_match: Optional[str], send):
+        headers = MutableHeaders(raw=list(start["headers"]))
+        status = start["status"]
+        content_type = headers.get("content-type", "")
+
+        if len(body) < self.minimum_size or not content_type.startswith(COMPRESSIBLE) or status < 200 or status in (204, 304):
+            encoding = None
+        if encoding or len(body) >= self.minimum_size:
+            headers.add_vary_header("Accept-Encoding")
+
+        etag = None
+        if cacheable and status == 200:
+            base = headers.get("etag") or '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            etag = representation_etag(base, encoding)
+            headers["etag"] = etag
+            if if_none_match and etag_matches(if_none_match, etag):
+                RESPONSES.inc(encoding="not_modified")
+                not_modified = [(k, v) for k, v in headers.raw if k.lower() not in (b"content-length", b"content-type")]
+                await send({"type": "http.response.start", "status": 304, "headers": not_modified})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if encoding:
+            body = await self.compressed_body(body, encoding, etag)
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+        RESPONSES.inc(encoding=encoding or "identity")
+
+        await send({"type": "http.response.start", "status": status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
+
+    async def compressed_body(self, body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+        if etag:
+            cached = self.compressed.get(etag)
+            if cached is not MISSING:
+                return cached
+        # large bodies in the cpu pool (zlib / brotli release the GIL)
+        data = await run_cpu(compress, body, encoding, size=len(body))
+        if etag:
+            # only GET bodies, POST answers are rarely repeated byte for byte
+            self.compressed.set(etag, data)
+        return data
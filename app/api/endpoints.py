@@ -1,417 +1,531 @@
-from fastapi import UploadFile, File, HTTPException
-from pydantic import BaseModel, Field, validator
-import os
-import base64
-import requests
-import json
-from .url.url_logic import process_url_request
-
-# Manual check model 
-class ManualInput(BaseModel):
-    claims: str 
-    ingredients: str 
-
-# Suggestion model
-class SuggestionInput(BaseModel):   
-    claims: str
-    ingredients: str
-
-# Health check model
-class HealthCheckInput(BaseModel):
-    age: int = Field(..., description="Age in years")
-    height: float = Field(..., description="Height in centimeters")
-    weight: float = Field(..., description="Weight in kilograms")
-    gender: str = Field(..., description="Gender identity")
-    activity_level: str = Field(..., description="Activity level")
-    medical_conditions: str = Field("", description="Any existing medical conditions")
-    medications: str = Field("", description="Current medications")
-    diet: str = Field("", description="Description of typical diet")
-    sleep: float = Field(..., description="Average hours of sleep per day")
-    stress: int = Field(..., description="Stress level on a scale of 1-10")
-    exercise: str = Field("", description="Description of exercise routine")
-
-# URL request model
-class URLRequest(BaseModel):
-    url: str
-
-# Default route
-async def root():
-    return {"message": "Welcome to the VeriTrust Backend API!"}
-
-# Health check route
-async def health_check():
-    return {"status": "ok"}
-
-# Using Groq's API for OCR
-# Read the prompt template
-def load_prompt_template():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    template_path = os.path.join(current_dir, 'template', 'check-image-prompt.txt')
-    with open(template_path, 'r') as file:
-        return file.read()
-
-# Check Image's Content
-async def check_image(file: UploadFile = File(...)):
-    try:
-        from groq import Groq
-        
-        # Initialize Groq client
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        # Read the file contents
-        contents = await file.read()
-        # Convert image to base64
-        base64_image = base64.b64encode(contents).decode('utf-8')
-        
-        # Load the prompt template
-        prompt = load_prompt_template()
-        
-        # Set up instructions and image
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ]
-        
-        completion = client.chat.completions.create(
-            model="llama-3.2-90b-vision-preview",
-            messages=messages,
-            temperature=0, # 0 creativity
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
-        
-        # Extract content from the response
-        result = completion.choices[0].message.content
-        return {"extracted-text": result}
-        
-    except Exception as e:
-        return {"extracted-text": f"Error: {str(e)}"}
-
-# URL route
-async def check_url(request: URLRequest):
-    try:
-        result = await process_url_request(request.dict())
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-
-# Manual check route
-
-# Load the prompt template
-def load_prompt_Manual():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    template_path = os.path.join(current_dir, 'template', 'manual-check-prompt.txt')
-    with open(template_path, 'r') as file:
-        return file.read()
-
-# Fetch result from the LLM 
-def send_to_llm(data:dict) ->str:
-    try :
-        from groq import Groq 
-        #  initialize Groq client
-
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        # prompt for better result 
-        prompt = load_prompt_Manual()
-
-        messages= [
-            {
-                'role':'user',
-                'content': [
-                    {
-                        'type' : 'text' ,
-                        'text' :prompt
-                    },
-                    {
-                        'type' : 'text' ,
-                        'text' : data['claims']
-                    },
-                    {
-                        'type':'text',
-                        'text' : data['ingredients']
-                    }
-                ]
-            }
-        ]
-
-        completion =  client.chat.completions.create(
-            model= 'llama-3.2-90b-vision-preview',
-            messages=messages,
-            temperature=0,
-            max_completion_tokens=1024,
-            top_p=1 ,
-            stream=False,
-            stop = None
-        )
-
-        result  = completion.choices[0].message.content
-        return result
-
-    except Exception as e :
-        return f"Error : {str(e)}"
-    
-
-async def manual_check(manual_data: ManualInput):
-    try :
-        data = {
-            'claims' : manual_data.claims,
-            'ingredients' : manual_data.ingredients
-        }
-        result = send_to_llm(data)
-        return {"extracted-text": result}
-    except Exception as e:  
-        return {"extracted-text": f"Error: {str(e)}"}
-
-
-# Check Raw 
-# This is used to directly generate the response based on just the string
-# Works exactly like the manual 
-async def check_raw(raw_text: str):
-    try:
-        from groq import Groq
-        
-        # Initialize Groq client
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        # Load the prompt template (using the same as manual check)
-        prompt = load_prompt_Manual()
-        
-        # Set up messages with the raw text
-        messages = [
-            {
-                'role': 'user',
-                'content': [
-                    {
-                        'type': 'text',
-                        'text': prompt
-                    },
-                    {
-                        'type': 'text',
-                        'text': raw_text
-                    }
-                ]
-            }
-        ]
-        
-        completion = client.chat.completions.create(
-            model='llama-3.2-90b-vision-preview',
-            messages=messages,
-            temperature=0,
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=False,
-            stop=None
-        )
-        
-        result = completion.choices[0].message.content
-        return {"extracted-text": result}
-        
-    except Exception as e:
-        return {"extracted-text": f"Error: {str(e)}"}
-
-
-
-# Suggestion route logic starts from here 
-    
-def load_prompt_suggestion():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    template_path = os.path.join(current_dir, 'template', 'suggestion-prompt.txt')
-    with open(template_path, 'r') as file:
-        return file.read()
-
-def suggestion_from_llm(data:dict) ->object:
-    try :
-        from groq import Groq 
-        #  initialize Groq client
-
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        # prompt for better result 
-        prompt = load_prompt_suggestion()
-
-        messages= [
-            {
-                'role':'user',
-                'content': [
-                    {
-                        'type' : 'text' ,
-                        'text' :prompt
-                    },
-                    {
-                        'type' : 'text' ,
-                        'text' : f"Claims: {data['claims']}"
-                    },
-                    {
-                        'type':'text',
-                        'text' : f"Ingredients: {data['ingredients']}"
-                    }
-                ]
-            }
-        ]
-
-        completion =  client.chat.completions.create(
-            model= 'llama-3.3-70b-versatile',
-            messages=messages,
-            temperature=1,
-            max_completion_tokens=1024,
-            top_p=1 ,
-            stream=False,
-            response_format={'type':"json_object"},
-            stop = None
-        )
-
-        result  = completion.choices[0].message.content
-        return result
-
-    except Exception as e :
-        return f"Error : {str(e)}"
-
-
-# suggestion route
-async def suggestions(manual_data: SuggestionInput):
-    try :
-        data = {
-            'ingredients' : manual_data.ingredients,
-            'claims': manual_data.claims
-        }
-        result = suggestion_from_llm(data)
-        return {"response": result}
-    except Exception as e:  
-        return {"response": f"Error: {str(e)}"}
-
-# Check User's health
-async def check_health(health_data: HealthCheckInput):
-    try:
-        from groq import Groq
-        
-        # Initialize Groq client
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        # Load the prompt template
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(current_dir, 'template', 'check-health-prompt.txt')
-        with open(template_path, 'r') as file:
-            prompt = file.read()
-        
-        # Format the health data
-        health_info = (
-            f"Age: {health_data.age}\n"
-            f"Height: {health_data.height} cm\n"
-            f"Weight: {health_data.weight} kg\n"
-            f"Gender: {health_data.gender}\n"
-            f"Activity Level: {health_data.activity_level}\n"
-            f"Medical Conditions: {health_data.medical_conditions}\n"
-            f"Current Medications: {health_data.medications}\n"
-            f"Diet Description: {health_data.diet}\n"
-            f"Sleep Hours: {health_data.sleep}\n"
-            f"Stress Level (1-10): {health_data.stress}\n"
-            f"Exercise Routine: {health_data.exercise}\n"
-        )
-        
-        # Set up messages
-        messages = [
-            {
-                'role': 'user',
-                'content': [
-                    {
-                        'type': 'text',
-                        'text': prompt
-                    },
-                    {
-                        'type': 'text',
-                        'text': health_info
-                    }
-                ]
-            }
-        ]
-        
-        # Call the AI model
-        completion = client.chat.completions.create(
-            model='llama-3.3-70b-versatile',
-            messages=messages,
-            temperature=0.2,
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=False,
-            response_format={'type': 'json_object'},
-            stop=None
-        )
-        
-        # Parse the result
-        result = completion.choices[0].message.content
-        parsed_result = json.loads(result)
-        
-        # Return the parsed JSON directly
-        return parsed_result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Get data from S3
-S3_URL = "https://explore-veritrust.s3.eu-north-1.amazonaws.com/v01/data.json"
-
-async def get_from_s3():
-    try:
-        # Fetch the data from S3
-        response = requests.get(S3_URL)
-        response.raise_for_status()
-        
-        # Parse and return the JSON data
-        data = response.json()
-        return {"data": data}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-
-# Pydantic schema for the chat route
-class Ask(BaseModel):
-    question: str
-    previous_convo: list[list[str]]
-
-# endpoit for /ask
-async def ask_question(request: Ask):
-    try:
-        from groq import Groq
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        completion = client.chat.completions.create(
-            model="gemma2-9b-it",
-            messages=[
-                {"role": "user", "content": "Based on the Previous Conversations held by the users, understand the chat context and generate the result, the previous conversation is an optional field. Please format your response as JSON." },
-                {"role": "user", "content": f"Question: {request.question}"},
-                {"role": "user", "content": f"Previous Conversation: {request.previous_convo}"}
-            ],
-            temperature=1,
-            max_tokens=1024,
-            top_p=1,
-            stream=False, # to get full response at once
-            response_format={"type": "json_object"},
-            stop=None,
-        )
-
-        answer = completion.choices[0].message.content if completion.choices else None
-        if answer:
-            return {"answer": answer}
-        else:
-            raise HTTPException(status_code=500, detail="No response, try again")
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating response: {e}")
-
-        
+from fastapi import UploadFile, File, HTTPException, Request, Response
+from pydantic import BaseModel, Field, validator
+import json
+from typing import List
+from .llm import chat_completion
+from .admission import Overloaded
+from .cache import MISSING, llm_cache, cache_key, should_cache
+from .prompts import Prompt, prompts
+from .model_router import route, route_version
+from .singleflight import SingleFlight
+from .streaming import wants_stream, sse_response
+from .ingredients import get_ingredient_index, screen
+from .chat_history import history_messages
+from .image_pipeline import prepare_image
+from .health_metrics import health_metrics, health_metrics_batch, merge_metrics, metrics_for_prompt
+from .url.url_logic import process_url_request
+
+# Manual check model 
+class ManualInput(BaseModel):
+    claims: str 
+    ingredients: str 
+
+# Suggestion model
+class SuggestionInput(BaseModel):   
+    claims: str
+    ingredients: str
+
+# Health check model
+class HealthCheckInput(BaseModel):
+    age: int = Field(..., description="Age in years")
+    height: float = Field(..., description="Height in centimeters")
+    weight: float = Field(..., description="Weight in kilograms")
+    gender: str = Field(..., description="Gender identity")
+    activity_level: str = Field(..., description="Activity level")
+    medical_conditions: str = Field("", description="Any existing medical conditions")
+    medications: str = Field("", description="Current medications")
+    diet: str = Field("", description="Description of typical diet")
+    sleep: float = Field(..., description="Average hours of sleep per day")
+    stress: int = Field(..., description="Stress level on a scale of 1-10")
+    exercise: str = Field("", description="Description of exercise routine")
+
+# URL request model
+class URLRequest(BaseModel):
+    url: str
+
+# Default route
+async def root():
+    return {"message": "Welcome to the VeriTrust Backend API!"}
+
+# Health check route
+async def health_check():
+    return {"status": "ok"}
+
+# Using Groq's API for OCR
+# the same photo arriving together shares one vision call (llm_cache is single flight)
+IMAGE_MODEL = "llama-3.2-90b-vision-preview"
+
+# Check Image's Content
+async def check_image(response: Response, file: UploadFile = File(...)):
+    # size cap, EXIF strip, downscale and pixel digest (image_pipeline.py)
+    # too large / not an image are client errors, raised as 413 / 415
+    base64_image, digest = await prepare_image(file)
+    try:
+        # the same picture uploaded again reuses the extracted text
+        key = cache_key("check-image", route_version("check-image", IMAGE_MODEL), prompts.get("check-image").version, digest)
+        result, cache_status = await llm_cache.get_or_compute(
+            key,
+            lambda: image_to_llm(base64_image),
+            endpoint="check-image",
+            enabled=should_cache(0),
+        )
+        response.headers["X-Cache"] = cache_status
+        return {"extracted-text": result}
+        
+    # busy: 503 + Retry-After, not an error body
+    except Overloaded:
+        raise
+    except Exception as e:
+        return {"extracted-text": f"Error: {str(e)}"}
+
+async def image_to_llm(base64_image: str) -> str:
+    # Image is already a downscaled, base64 encoded JPEG (encoded in the image pool)
+    # Prompt template, loaded at startup
+    prompt = prompts.get("check-image")
+    
+    # Set up instructions and image
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt.text
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}"
+                    }
+                }
+            ]
+        }
+    ]
+    
+    completion = await chat_completion(**route("check-image", prompt, dict(
+        model=IMAGE_MODEL,
+        messages=messages,
+        temperature=0, # 0 creativity
+        max_completion_tokens=1024,
+        top_p=1,
+        stream=False,
+        stop=None,
+    )))
+    
+    # Extract content from the response
+    return completion.choices[0].message.content
+
+# URL route
+async def check_url(request: URLRequest, response: Response):
+    try:
+        result = await process_url_request(request.dict())
+        if "cache" in result:
+            response.headers["X-Cache"] = result["cache"]
+        return result
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+# Manual check route
+
+MANUAL_CHECK_MODEL = 'llama-3.2-90b-vision-preview'
+MANUAL_CHECK_TEMPERATURE = 0
+
+# Answers depend on the prompt and on the ingredient facts sent with it
+def knowledge_version(prompt: Prompt) -> str:
+    return f"{prompt.version}:{get_ingredient_index().version}"
+
+# Completion arguments, shared by the normal and the streaming (SSE) path
+def manual_check_request(data:dict, prompt: Prompt, context: str = "") -> dict:
+
+    messages= [
+        {
+            'role':'user',
+            'content': [
+                {
+                    'type' : 'text' ,
+                    'text' :prompt.text
+                },
+                {
+                    'type' : 'text' ,
+                    'text' : data['claims']
+                },
+                {
+                    'type':'text',
+                    'text' : data['ingredients']
+                }
+            ]
+        }
+    ]
+    # what the ingredient database already knows about these ingredients
+    if context:
+        messages[0]['content'].append({'type': 'text', 'text': context})
+
+    # nothing known about the ingredients, the model has to judge them on its own
+    return route("manual-check", prompt, dict(
+        model= MANUAL_CHECK_MODEL,
+        messages=messages,
+        temperature=MANUAL_CHECK_TEMPERATURE,
+        max_completion_tokens=1024,
+        top_p=1 ,
+        stream=False,
+        stop = None
+    ), escalate=not context)
+
+# Fetch result from the LLM 
+# Errors are raised (not returned) so they never end up in the cache
+async def send_to_llm(data:dict, prompt: Prompt = None, screening: dict = None) ->str:
+    # prompt for better result 
+    prompt = prompt or prompts.get("manual-check")
+    screening = screening or screen(data['claims'], data['ingredients'])
+    # decided from the ingredient database, no need to ask the model
+    if screening['verdict']:
+        return screening['verdict']
+    completion = await chat_completion(**manual_check_request(data, prompt, screening['context']))
+    result  = completion.choices[0].message.content
+    return result
+    
+
+async def manual_check(manual_data: ManualInput, request: Request, response: Response, stream: bool = False):
+    try :
+        data = {
+            'claims' : manual_data.claims,
+            'ingredients' : manual_data.ingredients
+        }
+        prompt = prompts.get("manual-check")
+        screening = screen(data['claims'], data['ingredients'])
+        if screening['verdict'] and not wants_stream(request, stream):
+            response.headers["X-Cache"] = "LOCAL"
+            return {"extracted-text": screening['verdict']}
+        key = cache_key("manual-check", route_version("manual-check", MANUAL_CHECK_MODEL), knowledge_version(prompt), data)
+        if wants_stream(request, stream):
+            return await sse_response(
+                manual_check_request(data, prompt, screening['context']),
+                parse=lambda text: text,
+                to_body=lambda result: {"extracted-text": result},
+                key=key,
+                cache_enabled=should_cache(MANUAL_CHECK_TEMPERATURE),
+                known=screening['verdict'] or MISSING,
+            )
+        result, cache_status = await llm_cache.get_or_compute(
+            key,
+            lambda: send_to_llm(data, prompt, screening),
+            endpoint="manual-check",
+            enabled=should_cache(MANUAL_CHECK_TEMPERATURE),
+        )
+        response.headers["X-Cache"] = cache_status
+        return {"extracted-text": result}
+    except Overloaded:
+        raise
+    except Exception as e:  
+        return {"extracted-text": f"Error: {str(e)}"}
+
+
+# Check Raw 
+# This is used to directly generate the response based on just the string
+# Works exactly like the manual 
+def raw_check_request(raw_text: str, prompt: Prompt) -> dict:
+    # Set up messages with the raw text
+    messages = [
+        {
+            'role': 'user',
+            'content': [
+                {
+                    'type': 'text',
+                    'text': prompt.text
+                },
+                {
+                    'type': 'text',
+                    'text': raw_text
+                }
+            ]
+        }
+    ]
+    
+    return route("check-raw", prompt, dict(
+        model=MANUAL_CHECK_MODEL,
+        messages=messages,
+        temperature=MANUAL_CHECK_TEMPERATURE,
+        max_completion_tokens=1024,
+        top_p=1,
+        stream=False,
+        stop=None
+    ))
+
+async def raw_to_llm(raw_text: str, prompt: Prompt = None) -> str:
+    # Same prompt template as the manual check
+    prompt = prompt or prompts.get("manual-check")
+    completion = await chat_completion(**raw_check_request(raw_text, prompt))
+    return completion.choices[0].message.content
+
+
+async def check_raw(raw_text: str, request: Request, response: Response, stream: bool = False):
+    try:
+        prompt = prompts.get("manual-check")
+        key = cache_key("check-raw", route_version("check-raw", MANUAL_CHECK_MODEL), prompt.version, raw_text)
+        if wants_stream(request, stream):
+            return await sse_response(
+                raw_check_request(raw_text, prompt),
+                parse=lambda text: text,
+                to_body=lambda result: {"extracted-text": result},
+                key=key,
+                cache_enabled=should_cache(MANUAL_CHECK_TEMPERATURE),
+            )
+        result, cache_status = await llm_cache.get_or_compute(
+            key,
+            lambda: raw_to_llm(raw_text, prompt),
+            endpoint="check-raw",
+            enabled=should_cache(MANUAL_CHECK_TEMPERATURE),
+        )
+        response.headers["X-Cache"] = cache_status
+        return {"extracted-text": result}
+        
+    except Overloaded:
+        raise
+    except Exception as e:
+        return {"extracted-text": f"Error: {str(e)}"}
+
+
+
+# Suggestion route logic starts from here 
+
+SUGGESTION_MODEL = 'llama-3.3-70b-versatile'
+SUGGESTION_TEMPERATURE = 1
+
+def suggestion_request(data:dict, prompt: Prompt, context: str = "") -> dict:
+
+    messages= [
+        {
+            'role':'user',
+            'content': [
+                {
+                    'type' : 'text' ,
+                    'text' :prompt.text
+                },
+                {
+                    'type' : 'text' ,
+                    'text' : f"Claims: {data['claims']}"
+                },
+                {
+                    'type':'text',
+                    'text' : f"Ingredients: {data['ingredients']}"
+                }
+            ]
+        }
+    ]
+    if context:
+        messages[0]['content'].append({'type': 'text', 'text': context})
+
+    return route("suggestions", prompt, dict(
+        model= SUGGESTION_MODEL,
+        messages=messages,
+        temperature=SUGGESTION_TEMPERATURE,
+        max_completion_tokens=1024,
+        top_p=1 ,
+        stream=False,
+        response_format={'type':"json_object"},
+        stop = None
+    ), escalate=not context)
+
+async def suggestion_from_llm(data:dict, prompt: Prompt = None, screening: dict = None) ->object:
+    # prompt for better result 
+    prompt = prompt or prompts.get("suggestion")
+    screening = screening or screen(data['claims'], data['ingredients'])
+    completion = await chat_completion(**suggestion_request(data, prompt, screening['context']))
+    result  = completion.choices[0].message.content
+    return result
+
+
+# suggestion route
+async def suggestions(manual_data: SuggestionInput, request: Request, response: Response, stream: bool = False):
+    try :
+        data = {
+            'ingredients' : manual_data.ingredients,
+            'claims': manual_data.claims
+        }
+        prompt = prompts.get("suggestion")
+        screening = screen(data['claims'], data['ingredients'])
+        key = cache_key("suggestions", route_version("suggestions", SUGGESTION_MODEL), knowledge_version(prompt), data)
+        if wants_stream(request, stream):
+            return await sse_response(
+                suggestion_request(data, prompt, screening['context']),
+                parse=lambda text: text,
+                to_body=lambda result: {"response": result},
+                key=key,
+                cache_enabled=should_cache(SUGGESTION_TEMPERATURE),
+            )
+        result, cache_status = await llm_cache.get_or_compute(
+            key,
+            lambda: suggestion_from_llm(data, prompt, screening),
+            endpoint="suggestions",
+            enabled=should_cache(SUGGESTION_TEMPERATURE),
+        )
+        response.headers["X-Cache"] = cache_status
+        return {"response": result}
+    except Overloaded:
+        raise
+    except Exception as e:  
+        return {"response": f"Error: {str(e)}"}
+
+# Check User's health
+HEALTH_MODEL = 'llama-3.3-70b-versatile'
+HEALTH_TEMPERATURE = 0.2
+
+def health_request(health_data: HealthCheckInput, prompt: Prompt, metrics: dict = None) -> dict:
+    # The numbers are computed locally, the model only writes the narrative
+    metrics = metrics or health_metrics(health_data)
+
+    # Format the health data
+    health_info = (
+        f"Age: {health_data.age}\n"
+        f"Height: {health_data.height} cm\n"
+        f"Weight: {health_data.weight} kg\n"
+        f"Gender: {health_data.gender}\n"
+        f"Activity Level: {health_data.activity_level}\n"
+        f"Medical Conditions: {health_data.medical_conditions}\n"
+        f"Current Medications: {health_data.medications}\n"
+        f"Diet Description: {health_data.diet}\n"
+        f"Sleep Hours: {health_data.sleep}\n"
+        f"Stress Level (1-10): {health_data.stress}\n"
+        f"Exercise Routine: {health_data.exercise}\n"
+        f"\nComputed metrics:\n{metrics_for_prompt(metrics)}\n"
+    )
+    
+    # Set up messages
+    messages = [
+        {
+            'role': 'user',
+            'content': [
+                {
+                    'type': 'text',
+                    'text': prompt.text
+                },
+                {
+                    'type': 'text',
+                    'text': health_info
+                }
+            ]
+        }
+    ]
+    
+    return route("check-health", prompt, dict(
+        model=HEALTH_MODEL,
+        messages=messages,
+        temperature=HEALTH_TEMPERATURE,
+        max_completion_tokens=1024,
+        top_p=1,
+        stream=False,
+        response_format={'type': 'json_object'},
+        stop=None
+    ))
+
+async def health_from_llm(health_data: HealthCheckInput, prompt: Prompt = None, metrics: dict = None) -> dict:
+    # Prompt template, loaded at startup
+    prompt = prompt or prompts.get("check-health")
+
+    # Call the AI model
+    completion = await chat_completion(**health_request(health_data, prompt, metrics))
+    
+    # Parse the result
+    result = completion.choices[0].message.content
+    parsed_result = json.loads(result)
+    return parsed_result
+
+
+async def check_health(health_data: HealthCheckInput, request: Request, response: Response, stream: bool = False):
+    try:
+        prompt = prompts.get("check-health")
+        metrics = health_metrics(health_data)
+        # only the narrative is cached, the numbers are cheaper to recompute
+        key = cache_key("check-health", route_version("check-health", HEALTH_MODEL), prompt.version, health_data.dict())
+        if wants_stream(request, stream):
+            return await sse_response(
+                health_request(health_data, prompt, metrics),
+                parse=json.loads,
+                to_body=lambda narrative: merge_metrics(narrative, metrics),
+                key=key,
+                cache_enabled=should_cache(HEALTH_TEMPERATURE),
+                # the computed fields go out before the first token
+                prelude=[("bmi", metrics["bmi"]), ("risk_flags", metrics["risk_flags"])],
+            )
+        narrative, cache_status = await llm_cache.get_or_compute(
+            key,
+            lambda: health_from_llm(health_data, prompt, metrics),
+            endpoint="check-health",
+            enabled=should_cache(HEALTH_TEMPERATURE),
+        )
+        response.headers["X-Cache"] = cache_status
+
+        # The model's narrative with the computed numbers merged in
+        return merge_metrics(narrative, metrics)
+        
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Computed health numbers only (no LLM), for one or many profiles
+async def check_health_metrics(profiles: List[HealthCheckInput]):
+    return health_metrics_batch(profiles)
+
+# Pydantic schema for the chat route
+class Ask(BaseModel):
+    question: str
+    previous_convo: list[list[str]]
+
+CHAT_MODEL = "gemma2-9b-it"
+
+# the same question with the same history, asked at the same time, shares one completion
+chat_flights = SingleFlight("chat")
+
+# endpoit for /ask
+async def ask_question(request: Ask, http_request: Request, stream: bool = False):
+    try:
+        if wants_stream(http_request, stream):
+            return await sse_response(
+                await chat_request(request),
+                parse=lambda text: text,
+                to_body=lambda answer: {"answer": answer},
+            )
+
+        key = cache_key("chat", route_version("chat", CHAT_MODEL), "", request.dict())
+        completion = await chat_flights.do(key, lambda: chat_to_llm(request))
+
+        answer = completion.choices[0].message.content if completion.choices else None
+        if answer:
+            return {"answer": answer}
+        else:
+            raise HTTPException(status_code=500, detail="No response, try again")
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating response: {e}")
+
+
+CHAT_INSTRUCTIONS = "Based on the Previous Conversations held by the users, understand the chat context and generate the result, the previous conversation is an optional field. Please format your response as JSON."
+
+async def chat_request(request: Ask) -> dict:
+    # recent turns as they were, older ones summarized (chat_history.py)
+    history, _ = await history_messages(request.previous_convo)
+    return route("chat", None, dict(
+        model=CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": CHAT_INSTRUCTIONS},
+            *history,
+            {"role": "user", "content": f"Question: {request.question}"},
+        ],
+        temperature=1,
+        max_tokens=1024,
+        top_p=1,
+        stream=False, # to get full response at once
+        response_format={"type": "json_object"},
+        stop=None,
+    ))
+
+
+async def chat_to_llm(request: Ask):
+    return await chat_completion(**(await chat_request(request)))
@@ -0,0 +1,236 @@
+"""
+Explore dataset, served from memory.
+
+The dataset (data.json on S3) is loaded once when the app starts and refreshed in the
+background every EXPLORE_REFRESH_SECONDS (default 300) with If-None-Match, so an
+unchanged file costs a 304 and nothing else. For testing / offline work point
+EXPLORE_DATA_PATH at a local JSON file instead.
+
+/get-from-s3 without parameters returns {"data": <whole dataset>} like before, from
+bytes serialized once per dataset version. Its ETag is the hash of those bytes, so the
+compression middleware compresses it once per version and answers If-None-Match with 304.
+With parameters it returns one page of products:
+- page / page_size: pagination (page_size max 200)
+- fields: comma separated list of fields to keep per product
+- q: words that must all appear in the product name
+- verdict: exact verdict (case insensitive)
+- min_score / max_score: trustability score range
+Filters use indexes built when the dataset is loaded (name tokens, verdict, sorted scores).
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException, Response
+
+from .cache import TTLCache, MISSING
+from .offload import cpu_pool, run_io
+
+S3_URL = os.getenv("EXPLORE_DATA_URL", "https://explore-veritrust.s3.eu-north-1.amazonaws.com/v01/data.json")
+LOCAL_PATH = os.getenv("EXPLORE_DATA_PATH")
+REFRESH_SECONDS = float(os.getenv("EXPLORE_REFRESH_SECONDS", "300"))
+MAX_PAGE_SIZE = 200
+
+# the dataset's field names are not fixed, these are tried in order (top level, then one level down)
+NAME_FIELDS = ("product_name", "name", "title", "product")
+VERDICT_FIELDS = ("verdict",)
+SCORE_FIELDS = ("trustability_score", "score", "trust_score")
+
+TOKEN = re.compile(r"\w+")
+
+
+def find_field(item: Any, names) -> Any:
+    if not isinstance(item, dict):
+        return None
+    for name in names:
+        value = item.get(name)
+        if value is not None and not isinstance(value, (dict, list)):
+            return value
+    for value in item.values():
+        if isinstance(value, dict):
+            found = find_field(value, names)
+            if found is not None:
+                return found
+    return None
+
+
+def read_json(path: str) -> Any:
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def tokens(text: str) -> List[str]:
+    return TOKEN.findall(text.casefold())
+
+
+class ExploreDataset:
+    # One loaded version of data.json, with its indexes
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.items = self._items(raw)
+        self.full_body = json.dumps({"data": raw}, ensure_ascii=False).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.full_body).hexdigest()[:32] + '"'
+
+        self.name_index: Dict[str, set] = {}
+        self.verdict_index: Dict[str, List[int]] = {}
+        scored = []
+        for i, item in enumerate(self.items):
+            name = find_field(item, NAME_FIELDS)
+            for token in tokens(str(name)) if name is not None else []:
+                self.name_index.setdefault(token, set()).add(i)
+            verdict = find_field(item, VERDICT_FIELDS)
+            if verdict is not None:
+                self.verdict_index.setdefault(str(verdict).casefold(), []).append(i)
+            score = find_field(item, SCORE_FIELDS)
+            try:
+                scored.append((float(score), i))
+            except (TypeError, ValueError):
+                pass
+        scored.sort()
+        self.scores = [score for score, _ in scored]
+        self.score_ids = [i for _, i in scored]
+
+    @staticmethod
+    def _items(raw: Any) -> List:
+        # data.json is either a list of products or an object holding that list
+        if isinstance(raw, list):
+            return raw
+        if isinstance(raw, dict):
+            for value in raw.values():
+                if isinstance(value, list):
+                    return value
+        return []
+
+    def search(self, q: Optional[str], verdict: Optional[str], min_score: Optional[float], max_score: Optional[float]) -> List[int]:
+        matches: Optional[set] = None
+
+        def narrow(ids):
+            nonlocal matches
+            matches = set(ids) if matches is None else matches & set(ids)
+
+        for token in tokens(q or ""):
+            narrow(self.name_index.get(token, ()))
+        if verdict:
+            narrow(self.verdict_index.get(verdict.casefold(), ()))
+        if min_score is not None or max_score is not None:
+            lo = bisect.bisect_left(self.scores, min_score) if min_score is not None else 0
+            hi = bisect.bisect_right(self.scores, max_score) if max_score is not None else len(self.scores)
+            narrow(self.score_ids[lo:hi])
+
+        if matches is None:
+            return list(range(len(self.items)))
+        # keep the dataset's own order
+        return sorted(matches)
+
+
+class ExploreStore:
+    def __init__(self):
+        self.dataset: Optional[ExploreDataset] = None
+        self.etag: Optional[str] = None
+        self.version = 0
+        self.lock = asyncio.Lock()
+        self.refresh_task: Optional[asyncio.Task] = None
+        # serialized pages, cleared whenever a new version is loaded
+        self.pages = TTLCache(max_entries=512, ttl=REFRESH_SECONDS)
+
+    async def _fetch(self) -> Optional[Any]:
+        """New data, or None when it didn't change."""
+        if LOCAL_PATH:
+            return await run_io(read_json, LOCAL_PATH)
+
+        headers = {"If-None-Match": self.etag} if self.etag and self.dataset else {}
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.get(S3_URL, headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        self.etag = response.headers.get("etag")
+        # a few MB of JSON, parsed off the event loop
+        return await cpu_pool.run(json.loads, response.content)
+
+    async def load(self):
+        async with self.lock:
+            raw = await self._fetch()
+            if raw is None:
+                return
+            # index building is CPU work, keep it off the event loop
+            self.dataset = await cpu_pool.run(ExploreDataset, raw)
+            self.version += 1
+            self.pages = TTLCache(max_entries=512, ttl=REFRESH_SECONDS)
+
+    async def get(self) -> ExploreDataset:
+        if self.dataset is None:
+            await self.load()
+        return self.dataset
+
+    async def _refresh_forever(self):
+        while True:
+            await asyncio.sleep(REFRESH_SECONDS)
+            try:
+                await self.load()
+            except Exception as e:
+                # keep serving the version we have
+                print(f"Explore refresh failed: {e}")
+
+    async def start(self):
+        try:
+            await self.load()
+        except Exception as e:
+            # S3 being down must not stop the app, the first request retries
+            print(f"Explore data not loaded at startup: {e}")
+        self.refresh_task = asyncio.ensure_future(self._refresh_forever())
+
+    async def stop(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            self.refresh_task = None
+
+
+explore_store = ExploreStore()
+
+
+# Get Explore data (kept at /get-from-s3 for the frontend)
+async def get_from_s3(
+    page: Optional[int] = None,
+    page_size: int = 50,
+    fields: Optional[str] = None,
+    q: Optional[str] = None,
+    verdict: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+):
+    try:
+        dataset = await explore_store.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # No parameters: the whole dataset, as before
+    if all(v is None for v in (page, fields, q, verdict, min_score, max_score)):
+        return Response(dataset.full_body, media_type="application/json", headers={"ETag": dataset.etag})
+
+    page = max(page or 1, 1)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    key = json.dumps([explore_store.version, page, page_size, fields, q, verdict, min_score, max_score])
+
+    body = explore_store.pages.get(key)
+    if body is MISSING:
+        ids = dataset.search(q, verdict, min_score, max_score)
+        selected = [dataset.items[i] for i in ids[(page - 1) * page_size: page * page_size]]
+        if fields:
+            keep = [f.strip() for f in fields.split(",") if f.strip()]
+            selected = [{f: item.get(f) for f in keep} if isinstance(item, dict) else item for item in selected]
+        body = json.dumps({
+            "data": selected,
+            "page": page,
+            "page_size": page_size,
+            "total": len(ids),
+        }, ensure_ascii=False).encode("utf-8")
+        explore_store.pages.set(key, body)
+
+    return Response(body, media_type="application/json")
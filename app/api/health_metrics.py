@@ -0,0 +1,183 @@
+"""
+Health numbers computed locally for /check-health.
+
+The model is bad at arithmetic and paying tokens for it is pointless, so everything that
+follows from the numbers in HealthCheckInput is computed here and merged into the
+response. The LLM only writes the narrative (assessment, recommendations, ...).
+
+- BMI: weight / height(m)^2 with the WHO adult categories
+- BMR: Mifflin-St Jeor, TDEE = BMR x activity factor
+- sleep and stress bands
+- rule based risk flags, same shape as the model's "health_risks" items
+
+health_metrics_batch() does the same for a list of profiles, column by column.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# (whole words in activity_level, factor), first match wins, so negated and compound
+# forms come before the single words they contain ("inactive", "not very active")
+ACTIVITY_FACTORS = [
+    (re.compile(r"\b(?:not|never|hardly|barely)\s+(?:very|too|that|really|so)\s+active\b"), 1.375),
+    (re.compile(r"\b(?:sedentary|inactive|not\s+active|non[\s-]?active)\b"), 1.2),
+    (re.compile(r"\b(?:extra|extremely|super)\s+active\b|\bathlete\b"), 1.9),
+    (re.compile(r"\b(?:very|highly)\s+active\b"), 1.725),
+    (re.compile(r"\blight(?:ly)?\b"), 1.375),
+    (re.compile(r"\bmoderate(?:ly)?\b"), 1.55),
+    (re.compile(r"\bactive\b"), 1.725),
+]
+DEFAULT_ACTIVITY_FACTOR = 1.375
+
+# (upper bound, category, interpretation)
+BMI_CATEGORIES = [
+    (18.5, "Underweight", "Your BMI is below the healthy range for your height."),
+    (25.0, "Normal weight", "Your BMI is within the healthy range for your height."),
+    (30.0, "Overweight", "Your BMI is above the healthy range for your height."),
+    (float("inf"), "Obese", "Your BMI is well above the healthy range for your height."),
+]
+
+
+def bmi_category(bmi: float) -> tuple:
+    for bound, category, interpretation in BMI_CATEGORIES:
+        if bmi < bound:
+            return category, interpretation
+    return BMI_CATEGORIES[-1][1:]
+
+
+def sleep_band(hours: float) -> str:
+    # adults need 7-9 hours
+    if hours < 6:
+        return "Insufficient"
+    if hours < 7:
+        return "Below recommended"
+    if hours <= 9:
+        return "Recommended"
+    return "Above recommended"
+
+
+def stress_band(level: int) -> str:
+    if level <= 3:
+        return "Low"
+    if level <= 6:
+        return "Moderate"
+    if level <= 8:
+        return "High"
+    return "Very high"
+
+
+def activity_factor(activity_level: str) -> float:
+    level = (activity_level or "").casefold()
+    for pattern, factor in ACTIVITY_FACTORS:
+        if pattern.search(level):
+            return factor
+    return DEFAULT_ACTIVITY_FACTOR
+
+
+def gender_offset(gender: str) -> float:
+    # Mifflin-St Jeor: +5 for men, -161 for women, the midpoint otherwise
+    gender = (gender or "").strip().casefold()
+    if gender in ("male", "m", "man"):
+        return 5.0
+    if gender in ("female", "f", "woman"):
+        return -161.0
+    return -78.0
+
+
+def bmi_values(weights: List[float], heights: List[float]) -> List[Optional[float]]:
+    return [
+        round(w / ((h / 100) ** 2), 1) if h > 0 and w > 0 else None
+        for w, h in zip(weights, heights)
+    ]
+
+
+def bmr_values(weights: List[float], heights: List[float], ages: List[int], genders: List[str]) -> List[float]:
+    return [
+        round(10 * w + 6.25 * h - 5 * a + gender_offset(g))
+        for w, h, a, g in zip(weights, heights, ages, genders)
+    ]
+
+
+def risk_flags(bmi: Optional[float], sleep: float, stress: int, factor: float) -> List[Dict]:
+    flags = []
+    if bmi is not None:
+        if bmi >= 35:
+            flags.append({"risk": "Obesity", "severity": "High", "description": f"A BMI of {bmi} raises the risk of diabetes, hypertension and heart disease."})
+        elif bmi >= 30:
+            flags.append({"risk": "Obesity", "severity": "Medium", "description": f"A BMI of {bmi} raises the risk of diabetes, hypertension and heart disease."})
+        elif bmi >= 25:
+            flags.append({"risk": "Overweight", "severity": "Low", "description": f"A BMI of {bmi} is above the healthy range."})
+        elif bmi < 17:
+            flags.append({"risk": "Underweight", "severity": "High", "description": f"A BMI of {bmi} may mean nutritional deficiency."})
+        elif bmi < 18.5:
+            flags.append({"risk": "Underweight", "severity": "Medium", "description": f"A BMI of {bmi} is below the healthy range."})
+    if sleep < 6:
+        flags.append({"risk": "Sleep deprivation", "severity": "High" if sleep < 5 else "Medium", "description": f"{sleep} hours of sleep is below the 7-9 hours adults need."})
+    elif sleep > 10:
+        flags.append({"risk": "Excessive sleep", "severity": "Low", "description": f"{sleep} hours of sleep a day is more than usual and can point to other issues."})
+    if stress >= 9:
+        flags.append({"risk": "Chronic stress", "severity": "High", "description": f"A stress level of {stress}/10 affects sleep, blood pressure and heart health."})
+    elif stress >= 7:
+        flags.append({"risk": "Chronic stress", "severity": "Medium", "description": f"A stress level of {stress}/10 affects sleep, blood pressure and heart health."})
+    if factor <= 1.2 and bmi is not None and bmi >= 25:
+        flags.append({"risk": "Sedentary lifestyle", "severity": "Medium", "description": "Low activity combined with excess weight adds to cardiovascular risk."})
+    return flags
+
+
+def health_metrics_batch(profiles: List) -> List[Dict]:
+    """Metrics for many HealthCheckInput-like profiles (anything with the same attributes)."""
+    weights = [float(p.weight) for p in profiles]
+    heights = [float(p.height) for p in profiles]
+    ages = [int(p.age) for p in profiles]
+    factors = [activity_factor(p.activity_level) for p in profiles]
+    bmis = bmi_values(weights, heights)
+    bmrs = bmr_values(weights, heights, ages, [p.gender for p in profiles])
+
+    results = []
+    for profile, bmi, bmr, factor in zip(profiles, bmis, bmrs, factors):
+        category, interpretation = bmi_category(bmi) if bmi is not None else (None, None)
+        results.append({
+            "bmi": {"value": bmi, "category": category, "interpretation": interpretation},
+            "bmr": bmr,
+            "tdee": round(bmr * factor),
+            "activity_factor": factor,
+            "sleep": {"hours": profile.sleep, "band": sleep_band(profile.sleep)},
+            "stress": {"level": profile.stress, "band": stress_band(profile.stress)},
+            "risk_flags": risk_flags(bmi, profile.sleep, profile.stress, factor),
+        })
+    return results
+
+
+def health_metrics(profile) -> Dict:
+    return health_metrics_batch([profile])[0]
+
+
+def metrics_for_prompt(metrics: Dict) -> str:
+    # what the model is told, so its narrative agrees with the numbers
+    lines = [
+        f"BMI: {metrics['bmi']['value']} ({metrics['bmi']['category']})",
+        f"BMR: {metrics['bmr']} kcal/day, TDEE: {metrics['tdee']} kcal/day",
+        f"Sleep: {metrics['sleep']['band']}",
+        f"Stress: {metrics['stress']['band']}",
+    ]
+    lines += [f"Flagged risk: {flag['risk']} ({flag['severity']})" for flag in metrics["risk_flags"]]
+    return "\n".join(lines)
+
+
+def merge_metrics(narrative: Dict, metrics: Dict) -> Dict:
+    """Response body: the model's narrative plus the computed fields. Neither input is changed."""
+    if not isinstance(narrative, dict):
+        # the model answered with a list or a bare string, keep it as the assessment
+        narrative = {"general_assessment": narrative} if narrative else {}
+    flagged = {flag["risk"].casefold() for flag in metrics["risk_flags"]}
+    risks = narrative.get("health_risks")
+    extra_risks = [
+        risk for risk in (risks if isinstance(risks, list) else [])
+        if not isinstance(risk, dict) or str(risk.get("risk", "")).casefold() not in flagged
+    ]
+    return {
+        **narrative,
+        "bmi": metrics["bmi"],
+        "health_risks": metrics["risk_flags"] + extra_risks,
+        "metrics": {key: metrics[key] for key in ("bmr", "tdee", "activity_factor", "sleep", "stress")},
+    }
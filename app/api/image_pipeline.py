@@ -0,0 +1,104 @@
+"""
+Image preprocessing for /check-image.
+
+Phone photos are 5-12 MB, the vision model gains nothing past ~1500 px, and sending
+them as base64 is slow and expensive. Every upload goes through:
+1. read in chunks, stopping at IMAGE_MAX_BYTES (413 past it)
+2. decode (formats Pillow knows), 415 if it isn't an image, 413 past the decompression bomb limit
+3. rotate as the EXIF orientation says, then drop EXIF / metadata (location...)
+4. downscale so the longest side is at most IMAGE_MAX_SIDE
+5. re-encode as JPEG at IMAGE_JPEG_QUALITY, base64 encoded for the data URL sent to the model
+6. sha256 of the normalized pixels (after rotation and downscaling): the cache key of the
+   extracted text. The same upload, or the same picture re-saved with other metadata,
+   reuses it. There is no near-duplicate matching: a perceptual hash can't tell two
+   text-heavy labels apart, and a wrong hit would return another product's ingredients
+
+Decoding / resizing / encoding (and the base64 for the model) is CPU work, it runs in
+the "image" offload pool (IMAGE_WORKERS threads, or processes with IMAGE_POOL=process)
+so the event loop keeps serving.
+"""
+
+import base64
+import hashlib
+import io
+import os
+from typing import Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .metrics import counter
+from .offload import pool
+from .tracing import span
+
+MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+POOL_KIND = os.getenv("IMAGE_POOL", "thread")
+READ_CHUNK = 256 * 1024
+
+# a few times the largest phone camera, anything bigger is a decompression bomb
+Image.MAX_IMAGE_PIXELS = 100_000_000
+
+IMAGE_BYTES = counter("image_bytes_total", "Bytes of /check-image uploads before (in) and after (out, base64) preprocessing")
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_BYTES) -> bytes:
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(READ_CHUNK)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+    return bytes(buffer)
+
+
+def pixel_digest(image: Image.Image) -> str:
+    # the decoded pixels, not the file: metadata and container don't change the text
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def preprocess(data: bytes) -> Tuple[str, str]:
+    """(base64 JPEG, pixel digest). Runs in the pool."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        # apply the camera rotation before EXIF is dropped
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        output = io.BytesIO()
+        # no exif= argument, so no metadata is written
+        image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return base64.b64encode(output.getvalue()).decode('ascii'), pixel_digest(image)
+
+
+image_pool = pool("image", WORKERS, POOL_KIND)
+
+
+async def prepare_image(file: UploadFile) -> Tuple[str, str]:
+    """Upload -> (base64 JPEG for the model, pixel digest). Raises 413 / 415 HTTPExceptions."""
+    data = await read_upload(file)
+    if not data:
+        raise HTTPException(status_code=415, detail="Empty upload")
+    try:
+        with span("image.preprocess", bytes=len(data)):
+            jpeg, digest = await image_pool.run(preprocess, data)
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image has too many pixels")
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise HTTPException(status_code=415, detail="Upload is not a supported image")
+    IMAGE_BYTES.inc(len(data), direction="in")
+    IMAGE_BYTES.inc(len(jpeg), direction="out")
+    return jpeg, digest
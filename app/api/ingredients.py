@@ -0,0 +1,324 @@
+"""
+Local ingredient knowledge base, used before /manual-check and /suggestions call the LLM.
+
+The index is loaded once at startup from data/ingredients.json (or INGREDIENTS_DB, a
+file in the same format with as many entries as needed). Each entry has a name,
+synonyms, an optional E-number, allergens, flags (added_sugar, preservative, ...),
+claims it commonly supports and regulatory notes.
+
+Matching an ingredient string, in order:
+1. exact name / synonym after normalization (case, punctuation, percentages)
+2. E-number or INS number ("E621", "INS 621", "621")
+3. the longest known name inside the string ("milk chocolate" -> milk)
+4. fuzzy: trigram index + Dice similarity, for typos ("monosodium glutamte")
+Steps 3 and 4 are skipped for strings that name something else or the absence of an
+ingredient ("coconut milk", "cocoa butter", "sugar alcohol", "sugar free syrup").
+
+screen() uses the matches in two ways:
+- free-from claims ("sugar free", "vegan", ...) contradicted by a listed ingredient.
+  When every claim is one of those and at least one is contradicted by an exact or
+  E-number match, the verdict is decided locally and the LLM is not called. Phrase and
+  fuzzy matches are only guesses, they go to the LLM as "may contradict".
+- otherwise a short "known facts" context is added to the prompt.
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import counter
+from .offload import run_io
+
+SCREENS = counter("ingredient_screen_total", "Pre-screen outcome per request (local, annotated, none)")
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ingredients.json')
+FUZZY_MIN_SIMILARITY = 0.75
+MAX_PHRASE_WORDS = 4
+# part of the index version (and so of the cache keys): bump when the matching rules
+# change, answers decided by the old rules shouldn't be served anymore
+MATCHER_VERSION = "2"
+
+PERCENT = re.compile(r'\d+(?:\.\d+)?\s*%')
+NON_WORD = re.compile(r"[^\w&]+")
+E_NUMBER = re.compile(r'^(?:e|ins)?\s*(\d{3,4}[a-z]?)(?:\s*\(?[ivx]+\)?)?$')
+SPLIT_TOP_LEVEL = re.compile(r'[,;]')
+CLAIM_SPLIT = re.compile(r'[,;.\n]|\band\b|&|\+')
+# a known name inside these is not that ingredient: negations, plant "milks" and butters...
+NOT_THE_INGREDIENT = re.compile(
+    r'\b(?:free|no|non|without|zero)\b'
+    r'|\b(?:coconut|almond|oat|oats|soy|soya|rice|cashew|hazelnut|hemp|pea|plant)\s+(?:milk|mylk|cream|butter|yogurt|yoghurt|curd)\b'
+    r'|\b(?:cocoa|shea|kokum|mango|nut|seed)\s+butter\b'
+    r'|\bsugar\s+alcohols?\b|\bmilk\s+thistle\b|\bcream\s+of\s+tartar\b'
+)
+# how a match was found -> enough to decide a verdict without the LLM
+DECISIVE_MATCHES = {"exact", "e_number"}
+
+# free-from claim -> what contradicts it ("allergen:x" or "flag:y")
+CLAIM_RULES: List[Tuple[str, re.Pattern, List[str]]] = [
+    ("sugar free", re.compile(r'\b(?:sugar[\s-]*free|no (?:added )?sugars?|zero (?:added )?sugar|without (?:added )?sugar)\b'), ["flag:added_sugar"]),
+    ("gluten free", re.compile(r'\bgluten[\s-]*free\b'), ["allergen:gluten"]),
+    ("dairy free", re.compile(r'\b(?:dairy|milk)[\s-]*free\b'), ["allergen:milk"]),
+    ("vegan", re.compile(r'\b(?:vegan|100% plant[\s-]*based|plant[\s-]*based)\b'), ["flag:non_vegan"]),
+    ("vegetarian", re.compile(r'\b(?:vegetarian|pure veg)\b'), ["flag:non_vegetarian"]),
+    ("nut free", re.compile(r'\bnut[\s-]*free\b'), ["allergen:tree_nuts", "allergen:peanuts"]),
+    ("peanut free", re.compile(r'\bpeanut[\s-]*free\b'), ["allergen:peanuts"]),
+    ("egg free", re.compile(r'\begg[\s-]*free\b'), ["allergen:egg"]),
+    ("soy free", re.compile(r'\bsoy[\s-]*free\b'), ["allergen:soy"]),
+    ("no preservatives", re.compile(r'\b(?:no (?:added |artificial )?preservatives?|preservative[\s-]*free)\b'), ["flag:preservative"]),
+    ("no artificial colours", re.compile(r'\bno (?:artificial |added |synthetic )?colou?rs?\b'), ["flag:artificial_color"]),
+    ("no MSG", re.compile(r'\b(?:no (?:added )?msg|msg[\s-]*free)\b'), ["flag:msg"]),
+    ("no palm oil", re.compile(r'\b(?:no palm oil|palm oil[\s-]*free)\b'), ["flag:palm_oil"]),
+    ("no artificial sweeteners", re.compile(r'\bno artificial sweeteners?\b'), ["flag:artificial_sweetener"]),
+    ("no trans fat", re.compile(r'\b(?:no|zero|0\s*g?) trans[\s-]*fats?\b|\btrans[\s-]*fat[\s-]*free\b'), ["flag:trans_fat"]),
+]
+
+
+def normalize(text: str) -> str:
+    text = PERCENT.sub(' ', text.casefold())
+    return ' '.join(NON_WORD.sub(' ', text).split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def split_ingredients(ingredients: str) -> List[str]:
+    """Top level items plus whatever is inside their brackets: "Emulsifier (E322, soy)" -> 3 items."""
+    parts = []
+    depth = 0
+    current = ''
+    for char in ingredients:
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth = max(depth - 1, 0)
+        if depth == 0 and SPLIT_TOP_LEVEL.match(char):
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+
+    items = []
+    for part in parts:
+        outer = re.sub(r'[(\[{].*?[)\]}]', ' ', part)
+        items.append(outer)
+        for inner in re.findall(r'[(\[{](.*?)[)\]}]', part):
+            items.extend(split_ingredients(inner))
+    return [item.strip() for item in items if normalize(item)]
+
+
+class IngredientIndex:
+    def __init__(self, entries: List[Dict], version: str):
+        self.entries = entries
+        self.version = version
+        self.by_name: Dict[str, int] = {}
+        self.by_e_number: Dict[str, int] = {}
+        self.trigram_index: Dict[str, List[int]] = defaultdict(list)
+        # names[i] is (normalized string, entry id, trigram count) behind trigram posting i
+        self.names: List[Tuple[str, int, int]] = []
+
+        for entry_id, entry in enumerate(entries):
+            for name in [entry['name'], *entry.get('synonyms', [])]:
+                key = normalize(name)
+                if not key or key in self.by_name:
+                    continue
+                self.by_name[key] = entry_id
+                name_id = len(self.names)
+                grams = trigrams(key)
+                self.names.append((key, entry_id, len(grams)))
+                for gram in grams:
+                    self.trigram_index[gram].append(name_id)
+            if entry.get('e_number'):
+                self.by_e_number[entry['e_number'].casefold()] = entry_id
+
+    @classmethod
+    def load(cls, path: str) -> "IngredientIndex":
+        with open(path, 'rb') as file:
+            raw = file.read()
+        entries = json.loads(raw)['ingredients']
+        return cls(entries, f"{MATCHER_VERSION}-{hashlib.sha256(raw).hexdigest()[:12]}")
+
+    def _fuzzy(self, key: str) -> Optional[int]:
+        grams = trigrams(key)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for name_id in self.trigram_index.get(gram, ()):
+                shared[name_id] += 1
+        best, best_score = None, FUZZY_MIN_SIMILARITY
+        for name_id, count in shared.items():
+            _, entry_id, name_grams = self.names[name_id]
+            score = 2 * count / (len(grams) + name_grams)
+            if score >= best_score:
+                best, best_score = entry_id, score
+        return best
+
+    def _e_number(self, key: str) -> Optional[Dict]:
+        found = E_NUMBER.match(key)
+        entry_id = self.by_e_number.get('e' + found.group(1)) if found else None
+        return self.entries[entry_id] if entry_id is not None else None
+
+    def match(self, text: str) -> Optional[Tuple[Dict, str]]:
+        """(entry, how) for one ingredient string, how is exact / e_number / phrase / fuzzy."""
+        key = normalize(text)
+        if not key:
+            return None
+        if key in self.by_name:
+            return self.entries[self.by_name[key]], "exact"
+
+        entry = self._e_number(key)
+        if entry is not None:
+            return entry, "e_number"
+
+        if NOT_THE_INGREDIENT.search(key):
+            return None
+
+        words = key.split()
+        for size in range(min(len(words), MAX_PHRASE_WORDS), 0, -1):
+            for start in range(len(words) - size + 1):
+                phrase = ' '.join(words[start:start + size])
+                if phrase in self.by_name:
+                    return self.entries[self.by_name[phrase]], "phrase"
+                entry = self._e_number(phrase) if size == 1 else None
+                if entry is not None:
+                    return entry, "e_number"
+
+        # short strings match too many names by accident
+        if len(key) >= 5:
+            entry_id = self._fuzzy(key)
+            if entry_id is not None:
+                return self.entries[entry_id], "fuzzy"
+        return None
+
+    def annotate(self, ingredients: str) -> List[Dict]:
+        annotations = []
+        for item in split_ingredients(ingredients):
+            found = self.match(item)
+            entry, how = found if found else (None, None)
+            annotations.append({
+                "input": item,
+                "match": entry['name'] if entry else None,
+                "how": how,
+                "e_number": entry.get('e_number') if entry else None,
+                "allergens": entry.get('allergens', []) if entry else [],
+                "flags": entry.get('flags', []) if entry else [],
+                "supports": entry.get('supports', []) if entry else [],
+                "regulatory": entry.get('regulatory', []) if entry else [],
+            })
+        return annotations
+
+
+_index: Optional[IngredientIndex] = None
+
+
+# Called from the app lifespan on startup
+async def init_ingredient_index() -> IngredientIndex:
+    global _index
+    if _index is None:
+        _index = await run_io(IngredientIndex.load, os.getenv("INGREDIENTS_DB", DEFAULT_DB))
+    return _index
+
+
+def get_ingredient_index() -> IngredientIndex:
+    # Lazily load the index if the lifespan did not run (e.g. scripts)
+    global _index
+    if _index is None:
+        _index = IngredientIndex.load(os.getenv("INGREDIENTS_DB", DEFAULT_DB))
+    return _index
+
+
+def check_claims(claims: str, annotations: List[Dict]) -> Tuple[List[Dict], bool]:
+    """Free-from claims with the ingredients contradicting them, and whether every claim was one of those.
+
+    contradicted_by only has exact / E-number matches, phrase and fuzzy ones are in
+    possibly_contradicted_by.
+    """
+    checks = []
+    all_known = True
+    for segment in CLAIM_SPLIT.split(claims.casefold()):
+        segment = segment.strip()
+        if not normalize(segment):
+            continue
+        rules = [(label, contradicted_by) for label, pattern, contradicted_by in CLAIM_RULES if pattern.search(segment)]
+        if not rules:
+            all_known = False
+        for label, contradicted_by in rules:
+            offenders = [
+                a for a in annotations
+                if any(f"allergen:{x}" in contradicted_by for x in a["allergens"])
+                or any(f"flag:{x}" in contradicted_by for x in a["flags"])
+            ]
+            checks.append({
+                "claim": label,
+                "contradicted_by": list(dict.fromkeys(a["match"] for a in offenders if a["how"] in DECISIVE_MATCHES)),
+                "possibly_contradicted_by": list(dict.fromkeys(
+                    f"{a['input']} ({a['match']}?)" for a in offenders if a["how"] not in DECISIVE_MATCHES
+                )),
+            })
+    return checks, all_known and bool(checks)
+
+
+def local_verdict(checks: List[Dict]) -> Optional[str]:
+    # same JSON the manual check prompt asks the model for
+    contradicted = [check for check in checks if check["contradicted_by"]]
+    if not contradicted:
+        return None
+    explanation = " ".join(
+        f"The product claims '{check['claim']}' but lists {', '.join(check['contradicted_by'])}."
+        for check in contradicted
+    )
+    consistent = [
+        check["claim"] for check in checks
+        if not check["contradicted_by"] and not check["possibly_contradicted_by"]
+    ]
+    if consistent:
+        explanation += f" The other claims ({', '.join(consistent)}) are consistent with the listed ingredients."
+    first = contradicted[0]
+    return json.dumps({
+        "verdict": "misleading",
+        "why": f"Claims '{first['claim']}' but contains {first['contradicted_by'][0]}",
+        "detailed_explanation": explanation,
+        "trustability_score": 10 if len(contradicted) == len(checks) else 25,
+    })
+
+
+def facts_context(annotations: List[Dict], checks: List[Dict]) -> str:
+    lines = []
+    for a in annotations:
+        facts = [*(f"allergen: {x}" for x in a["allergens"]), *(x.replace('_', ' ') for x in a["flags"])]
+        facts += [f"supports: {', '.join(a['supports'])}"] if a["supports"] else []
+        facts += a["regulatory"]
+        facts = [fact for fact in facts if normalize(fact) != normalize(a["match"] or "")]
+        if not a["match"] or not facts:
+            continue
+        if a["how"] in DECISIVE_MATCHES:
+            name = a["match"] if normalize(a["input"]) == normalize(a["match"]) else f"{a['input']} = {a['match']}"
+        else:
+            name = f"{a['input']} (probably {a['match']}, partial match)"
+        lines.append(f"- {name}: {'; '.join(facts)}")
+    lines += [
+        f"- claim '{check['claim']}' is contradicted by {', '.join(check['contradicted_by'])}"
+        for check in checks if check["contradicted_by"]
+    ]
+    lines += [
+        f"- claim '{check['claim']}' may be contradicted by {', '.join(check['possibly_contradicted_by'])}, "
+        f"check whether these really are that ingredient"
+        for check in checks if check["possibly_contradicted_by"]
+    ]
+    if not lines:
+        return ""
+    return "Known ingredient facts (from our database, trust these):\n" + "\n".join(dict.fromkeys(lines))
+
+
+def screen(claims: str, ingredients: str) -> Dict:
+    """{"annotations", "checks", "verdict" (local answer or None), "context" (extra prompt text)}"""
+    annotations = get_ingredient_index().annotate(ingredients or "")
+    checks, all_known = check_claims(claims or "", annotations)
+    verdict = local_verdict(checks) if all_known else None
+    context = "" if verdict else facts_context(annotations, checks)
+    SCREENS.inc(outcome="local" if verdict else ("annotated" if context else "none"))
+    return {"annotations": annotations, "checks": checks, "verdict": verdict, "context": context}
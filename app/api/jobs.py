@@ -0,0 +1,473 @@
+"""
+Asynchronous jobs for slow endpoints (/extract-url).
+
+A synchronous /extract-url can take over a minute (browser timeouts + AI calls), longer
+than serverless and client timeouts allow. POST /extract-url/jobs instead returns a job
+id right away (202). The result is then either polled at GET /jobs/{id} or POSTed to the
+callback_url given with the job. POST /extract-url keeps working as before.
+
+Jobs are stored in SQLite (JOBS_DB), so queued jobs and results survive a restart, and
+every uvicorn worker on the machine shares the same queue:
+- JOBS_WORKERS jobs run at a time per process (default 4, 0 = only accept jobs and let
+  another process sharing JOBS_DB run them)
+- higher priority first (0-9, default 5). Within a priority, the client served least
+  recently goes first, so one client submitting a whole catalog doesn't hold up the
+  others, and a client never has more than JOBS_CLIENT_CONCURRENCY (default 2) running
+- clients are told apart by their IP address. X-Client-Id is only used with
+  JOBS_TRUST_CLIENT_ID=1, behind a gateway that sets it (a caller could otherwise pick
+  a new id per job and get around the per-client limits)
+- JOBS_QUEUE_LIMIT (default 1000) queued jobs in total, JOBS_CLIENT_QUEUE_LIMIT (default
+  100) per client, 429 past them
+- a running job holds a lease of JOBS_LEASE_SECONDS (default 300). If its process dies,
+  the job is queued again once the lease expires, up to JOBS_MAX_ATTEMPTS (default 2) runs
+- a run that raises or returns {"status": "error", ...} (how process_url_request reports
+  failures) is retried the same way, then the job is marked failed
+- finished jobs are kept JOBS_RESULT_TTL seconds (default 24h)
+
+Callbacks are retried JOBS_CALLBACK_RETRIES times (default 3) with backoff. With
+JOBS_CALLBACK_SECRET set, the body is signed: X-Signature: sha256=<hex HMAC of the body>.
+Callback URLs on private / loopback / link-local addresses are refused
+(JOBS_ALLOW_PRIVATE_CALLBACKS=1 allows them, for development). The host name is resolved
+again before every delivery, every address it resolves to must be public, and the
+request goes to the checked address (so a name can't be switched to 127.0.0.1 or
+169.254.169.254 after the check).
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import httpx
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel, Field
+
+from .admission import Overloaded
+from .metrics import counter
+from .offload import run_io
+from .url.url_logic import process_url_request
+
+DB_PATH = os.getenv("JOBS_DB", "/tmp/veritrust-jobs.sqlite3")
+WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+CLIENT_CONCURRENCY = int(os.getenv("JOBS_CLIENT_CONCURRENCY", "2"))
+QUEUE_LIMIT = int(os.getenv("JOBS_QUEUE_LIMIT", "1000"))
+CLIENT_QUEUE_LIMIT = int(os.getenv("JOBS_CLIENT_QUEUE_LIMIT", "100"))
+LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "2"))
+RESULT_TTL = float(os.getenv("JOBS_RESULT_TTL", str(24 * 3600)))
+CALLBACK_RETRIES = int(os.getenv("JOBS_CALLBACK_RETRIES", "3"))
+CALLBACK_SECRET = os.getenv("JOBS_CALLBACK_SECRET")
+ALLOW_PRIVATE_CALLBACKS = os.getenv("JOBS_ALLOW_PRIVATE_CALLBACKS") == "1"
+TRUST_CLIENT_ID = os.getenv("JOBS_TRUST_CLIENT_ID") == "1"
+# how often idle workers look for jobs queued by other processes / expired leases
+POLL_SECONDS = 1.0
+PRUNE_SECONDS = 600
+
+JOBS = counter("jobs_total", "Async jobs by kind and outcome")
+CALLBACKS = counter("job_callbacks_total", "Job result callbacks by outcome")
+
+# kind -> coroutine taking the job payload, returning the result
+HANDLERS: Dict[str, Callable[[Dict], Awaitable[Any]]] = {
+    "extract-url": process_url_request,
+}
+
+
+class JobStore:
+    # SQLite calls are blocking, JobQueue runs them in a thread
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, client TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, callback_url TEXT, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, lease_until REAL, "
+            "created REAL NOT NULL, started REAL, finished REAL, callback_status TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, status)")
+        # when each client last had a job started, for the round robin between clients
+        self.conn.execute("CREATE TABLE IF NOT EXISTS job_clients (client TEXT PRIMARY KEY, served REAL NOT NULL)")
+
+    def add(self, kind: str, client: str, priority: int, payload: Dict, callback_url: Optional[str]) -> Optional[str]:
+        """New job id, None if the queue (or the client's share of it) is full."""
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued, mine = self.conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(client = ?), 0) FROM jobs WHERE status = 'queued'", (client,)
+                ).fetchone()
+                if queued >= QUEUE_LIMIT or mine >= CLIENT_QUEUE_LIMIT:
+                    self.conn.execute("ROLLBACK")
+                    return None
+                self.conn.execute(
+                    "INSERT INTO jobs (id, kind, client, priority, payload, callback_url, status, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                    (job_id, kind, client, priority, json.dumps(payload), callback_url, time.time()),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self, owner: str) -> Optional[Dict]:
+        """Takes the next job: priority, then least recently served client, then oldest."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # leases of dead workers: run again, or give up after MAX_ATTEMPTS
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker lost', finished = ?, owner = NULL "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, MAX_ATTEMPTS),
+                )
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL WHERE status = 'running' AND lease_until < ?",
+                    (now,),
+                )
+                row = self.conn.execute(
+                    "SELECT j.* FROM jobs j LEFT JOIN job_clients c ON c.client = j.client "
+                    "WHERE j.status = 'queued' AND "
+                    "(SELECT COUNT(*) FROM jobs r WHERE r.client = j.client AND r.status = 'running') < ? "
+                    "ORDER BY j.priority DESC, COALESCE(c.served, 0), j.created LIMIT 1",
+                    (CLIENT_CONCURRENCY,),
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, started = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (owner, now + LEASE_SECONDS, now, row["id"]),
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO job_clients (client, served) VALUES (?, ?)", (row["client"], now)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return {**dict(row), "status": "running", "attempts": row["attempts"] + 1}
+
+    def finish(self, job_id: str, owner: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        with self.lock:
+            # a job whose lease expired may be running somewhere else now, its result wins
+            updated = self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, owner = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, owner),
+            ).rowcount
+        return updated == 1
+
+    def requeue(self, job_id: str, owner: str, error: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, owner = NULL WHERE id = ? AND owner = ?",
+                (error, job_id, owner),
+            )
+
+    def release(self, owner: str):
+        # graceful shutdown: give the running jobs back, that run doesn't count as an attempt
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, attempts = attempts - 1 "
+                "WHERE owner = ? AND status = 'running'",
+                (owner,),
+            )
+
+    def release_one(self, job_id: str, owner: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, attempts = attempts - 1 "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (job_id, owner),
+            )
+
+    def set_callback_status(self, job_id: str, status: str):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["status"] == "queued":
+                job["position"] = self.conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                    "(priority > ? OR (priority = ? AND created < ?))",
+                    (job["priority"], job["priority"], job["created"]),
+                ).fetchone()[0]
+        return job
+
+    def prune(self):
+        cutoff = time.time() - RESULT_TTL
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (cutoff,))
+            self.conn.execute(
+                "DELETE FROM job_clients WHERE served < ? AND client NOT IN (SELECT client FROM jobs)", (cutoff,)
+            )
+
+
+def check_callback_url(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise HTTPException(status_code=422, detail="callback_url must be an http(s) URL")
+    if ALLOW_PRIVATE_CALLBACKS:
+        return
+    host = parsed.hostname
+    if host == "localhost" or host.endswith(".localhost") or host.endswith(".internal"):
+        raise HTTPException(status_code=422, detail="callback_url can't point to a private address")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        # a name, resolved and checked before each delivery (pinned_callback)
+        return
+    if not address.is_global:
+        raise HTTPException(status_code=422, detail="callback_url can't point to a private address")
+
+
+class CallbackRefused(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    pass
+
+
+async def pinned_callback(url: str) -> Tuple[str, Dict[str, str], Dict[str, str]]:
+    """(URL with the checked IP in place of the host, Host header, request extensions)."""
+    parsed = urlparse(url)
+    host = parsed.hostname
+    if ALLOW_PRIVATE_CALLBACKS:
+        return url, {}, {}
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise CallbackRefused(f"can't resolve {host}: {e}")
+    # scope ids (fe80::1%eth0) aren't part of the address
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    if not addresses or any(not address.is_global for address in addresses):
+        raise CallbackRefused(f"{host} resolves to a private address")
+    address = addresses[0]
+    netloc = f"[{address}]" if address.version == 6 else str(address)
+    if parsed.port:
+        netloc += f":{parsed.port}"
+    host_header = host if not parsed.port else f"{host}:{parsed.port}"
+    # TLS still checks the certificate against the name
+    return urlunparse(parsed._replace(netloc=netloc)), {"Host": host_header}, {"sni_hostname": host}
+
+
+class JobQueue:
+    def __init__(self, path: str = DB_PATH, workers: int = WORKERS):
+        self.path = path
+        self.workers = workers
+        self.store: Optional[JobStore] = None
+        # identifies this process's leases
+        self.owner = uuid.uuid4().hex
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+        self.callback_tasks = set()
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        self.store = await run_io(JobStore, self.path)
+        self.http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0), follow_redirects=False)
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        if self.workers:
+            self.tasks.append(asyncio.ensure_future(self._prune_forever()))
+
+    async def stop(self):
+        for task in self.tasks + list(self.callback_tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.callback_tasks, return_exceptions=True)
+        self.tasks = []
+        if self.store is not None:
+            await run_io(self.store.release, self.owner)
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def submit(self, kind: str, client: str, priority: int, payload: Dict, callback_url: Optional[str]) -> str:
+        job_id = await run_io(self.store.add, kind, client, priority, payload, callback_url)
+        if job_id is None:
+            JOBS.inc(kind=kind, status="rejected")
+            raise HTTPException(status_code=429, detail="Too many queued jobs, try again later",
+                                headers={"Retry-After": "30"})
+        JOBS.inc(kind=kind, status="queued")
+        self.wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await run_io(self.store.get, job_id)
+
+    async def _work(self):
+        while True:
+            try:
+                job = await run_io(self.store.claim, self.owner)
+            except sqlite3.OperationalError as e:
+                # database locked by another process for too long
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # a new job might be waiting for the next free worker
+            self.wakeup.set()
+            await self._run(job)
+
+    async def _run(self, job: Dict):
+        kind = job["kind"]
+        handler = HANDLERS.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind {kind}")
+            result = await handler(json.loads(job["payload"]))
+            # the handlers report most failures as a result instead of raising
+            if isinstance(result, dict) and result.get("status") == "error":
+                raise JobFailed(str(result.get("content") or "error"))
+        except asyncio.CancelledError:
+            raise
+        except Overloaded as e:
+            # not the job's fault, it goes back to the queue without using up an attempt
+            JOBS.inc(kind=kind, status="deferred")
+            await run_io(self.store.release_one, job["id"], self.owner)
+            await asyncio.sleep(e.retry_after)
+            return
+        except Exception as e:
+            if job["attempts"] < MAX_ATTEMPTS and handler is not None:
+                JOBS.inc(kind=kind, status="retried")
+                await run_io(self.store.requeue, job["id"], self.owner, str(e))
+                return
+            status, result, error = "failed", None, str(e)
+        else:
+            status, error = "done", None
+
+        JOBS.inc(kind=kind, status=status)
+        if await run_io(self.store.finish, job["id"], self.owner, status, result, error):
+            if job["callback_url"]:
+                task = asyncio.ensure_future(self._callback(job["id"], job["callback_url"]))
+                self.callback_tasks.add(task)
+                task.add_done_callback(self.callback_tasks.discard)
+
+    async def _callback(self, job_id: str, url: str):
+        view = job_view(await self.get(job_id))
+        view.pop("callback", None)
+        body = json.dumps(view).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if CALLBACK_SECRET:
+            signature = hmac.new(CALLBACK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={signature}"
+
+        outcome = "failed"
+        for attempt in range(CALLBACK_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(2 ** (2 * attempt - 1))  # 2s, 8s, 32s
+            try:
+                target, host_header, extensions = await pinned_callback(url)
+                response = await self.http_client.post(
+                    target, content=body, headers={**headers, **host_header}, extensions=extensions
+                )
+                if response.status_code < 300:
+                    outcome = "delivered"
+                    break
+                outcome = f"failed: HTTP {response.status_code}"
+                # the receiver rejected it, sending it again won't help
+                if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    break
+            except CallbackRefused as e:
+                outcome = f"refused: {e}"
+                break
+            except httpx.HTTPError as e:
+                outcome = f"failed: {type(e).__name__}"
+        CALLBACKS.inc(status="delivered" if outcome == "delivered" else "failed")
+        await run_io(self.store.set_callback_status, job_id, outcome)
+
+    async def _prune_forever(self):
+        while True:
+            await asyncio.sleep(PRUNE_SECONDS)
+            try:
+                await run_io(self.store.prune)
+            except sqlite3.Error as e:
+                print(f"Job prune failed: {e}")
+
+
+job_queue = JobQueue()
+
+
+def job_view(job: Dict) -> Dict:
+    view = {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+    }
+    if job["status"] == "queued":
+        view["position"] = job.get("position")
+    if job["status"] == "done":
+        view["result"] = json.loads(job["result"])
+    if job["error"]:
+        view["error"] = job["error"]
+    if job["callback_url"]:
+        view["callback"] = job["callback_status"] or "pending"
+    return view
+
+
+class URLJobInput(BaseModel):
+    url: str
+    callback_url: Optional[str] = None
+    priority: int = Field(5, ge=0, le=9, description="0-9, higher runs first")
+
+
+def client_id(request: Request) -> str:
+    # the header is chosen by the caller, only a gateway in front of us can vouch for it
+    if TRUST_CLIENT_ID and request.headers.get("x-client-id"):
+        return request.headers["x-client-id"]
+    return request.client.host if request.client else "unknown"
+
+
+# Queue an /extract-url job
+async def submit_url_job(job: URLJobInput, request: Request, response: Response):
+    if job.callback_url:
+        check_callback_url(job.callback_url)
+    job_id = await job_queue.submit(
+        "extract-url", client_id(request), job.priority, {"url": job.url}, job.callback_url
+    )
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"id": job_id, "status": "queued", "poll": f"/jobs/{job_id}"}
+
+
+# Job status / result
+async def get_job(job_id: str, response: Response):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (or expired)")
+    if job["status"] in ("queued", "running"):
+        response.headers["Retry-After"] = "2"
+    return job_view(job)
@@ -0,0 +1,162 @@
+"""
+Shared LLM client.
+
+One AsyncGroq client is created when the app starts and closed when it shuts down.
+It sits on a single httpx connection pool (keep-alive), so the TLS handshake to
+Groq is paid once per connection instead of once per request.
+Every endpoint goes through chat_completion() (or stream_chat_completion() for SSE),
+which is non blocking, so one slow completion no longer stalls the whole event loop.
+
+Settings (.env):
+- GROQ_MAX_CONCURRENCY: how many completions can be in flight at once (default 64)
+- GROQ_MAX_CONNECTIONS: size of the http connection pool (default 100)
+- GROQ_KEEPALIVE_CONNECTIONS: idle connections kept alive (default 20)
+- GROQ_TIMEOUT: seconds before a completion is abandoned (default 60)
+- GROQ_BASE_URL: another Groq compatible server, read by the SDK (the benchmarks in
+  bench/ point it at a local fake)
+
+Each completion is a "groq.chat" span (tracing.py): duration per model and the prompt /
+completion tokens Groq reports end up on /metrics.
+
+Completions also go through the adaptive limiters in admission.py (all models, then
+per model), which queue or shed calls with 503 when Groq slows down or rate limits.
+
+Around that, resilience.py retries 429 / 5xx / timeouts (honoring Retry-After), hedges
+slow calls, breaks the circuit of a failing model and falls back to another model.
+chat_completion(deadline=seconds) bounds the whole call, retries included. Each attempt
+takes its own slot and is its own span.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from groq import AsyncGroq
+
+from .admission import MODEL_MAX, limiter
+from .resilience import call
+from .tracing import llm_span, record_usage
+
+
+class LLMClient:
+    def __init__(self):
+        self.max_concurrency = int(os.getenv("GROQ_MAX_CONCURRENCY", "64"))
+        timeout = float(os.getenv("GROQ_TIMEOUT", "60"))
+
+        # pooled http client, reused by every completion
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("GROQ_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("GROQ_KEEPALIVE_CONNECTIONS", "20")),
+            ),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+        )
+        self.client = AsyncGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            http_client=self.http_client,
+            # retries are done by resilience.py, with backoff and fallbacks
+            max_retries=0,
+        )
+        # caps the number of completions in flight from this worker
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        # the adaptive limit stays under that cap, cut on errors only (the per model limiters
+        # in admitted() react to latency)
+        self.limiter = limiter("llm", self.max_concurrency, latency_signal=False)
+
+    @asynccontextmanager
+    async def admitted(self, model: str):
+        # per model first, so a busy model doesn't hold slots the others could use
+        async with limiter(f"llm:{model}", min(MODEL_MAX, self.max_concurrency)).slot():
+            async with self.limiter.slot():
+                async with self.semaphore:
+                    yield
+
+    async def chat_completion(self, deadline: Optional[float] = None, **kwargs):
+        return await call(self.attempt, kwargs, deadline)
+
+    async def attempt(self, kwargs: dict, kind: str):
+        # one try, on the model resilience.py picked
+        async with self.admitted(kwargs.get("model")):
+            # the span starts once admitted, waiting for a slot is on /stats/admission
+            with llm_span(kwargs.get("model"), attempt=kind) as span:
+                completion = await self.client.chat.completions.create(**kwargs)
+                record_usage(span, getattr(completion, "usage", None))
+                return completion
+
+    async def stream_chat_completion(self, deadline: Optional[float] = None, **kwargs):
+        # retried / failed over until the first token, not hedged; after that errors go to the caller
+        pieces, first = await call(self.open_stream, kwargs, deadline, hedge=False)
+        try:
+            if first is not None:
+                yield first
+                async for piece in pieces:
+                    yield piece
+        finally:
+            await pieces.aclose()
+
+    async def open_stream(self, kwargs: dict, kind: str):
+        pieces = self.stream_attempt(kwargs, kind)
+        try:
+            return pieces, await pieces.__anext__()
+        except StopAsyncIteration:
+            return pieces, None
+
+    async def stream_attempt(self, kwargs: dict, kind: str):
+        # the slot is held until the whole completion has been streamed
+        async with self.admitted(kwargs.get("model")):
+            with llm_span(kwargs.get("model"), attempt=kind, stream=True) as span:
+                started = time.perf_counter()
+                stream = await self.client.chat.completions.create(**{**kwargs, "stream": True})
+                async for chunk in stream:
+                    # Groq sends the usage with the last chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    record_usage(span, getattr(x_groq, "usage", None))
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if "first_token_seconds" not in span.attributes:
+                            span.set(first_token_seconds=round(time.perf_counter() - started, 4))
+                        yield chunk.choices[0].delta.content
+
+    async def close(self):
+        await self.client.close()
+        await self.http_client.aclose()
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+# Called from the app lifespan on startup
+async def init_llm_client() -> LLMClient:
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+# Called from the app lifespan on shutdown
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
+
+
+def get_llm_client() -> LLMClient:
+    # Lazily create the client if the lifespan did not run (e.g. scripts)
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+# Every Groq call in the app goes through here
+async def chat_completion(**kwargs):
+    return await get_llm_client().chat_completion(**kwargs)
+
+
+# Same as chat_completion, but yields the text as it is generated
+async def stream_chat_completion(**kwargs):
+    async for piece in get_llm_client().stream_chat_completion(**kwargs):
+        yield piece
@@ -0,0 +1,191 @@
+"""
+In-process metrics for the hot paths (which tier served a request, cache hits, latencies...).
+
+Metrics are keyed by a name plus a set of labels, and are cheap enough to leave on:
+- counters: incrementing one is a dict update
+- histograms: observing a value is a bisect over fixed buckets plus a dict update
+- gauges: a callback read when the metrics are served, nothing on the hot path
+
+The current values are served as JSON on /stats and in the Prometheus text format on
+/metrics (counters as <name>, histograms as <name>_bucket / _sum / _count).
+"""
+
+import bisect
+import math
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from fastapi.responses import PlainTextResponse
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# seconds, from a cache hit to a slow browser page
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.values: Dict[LabelKey, float] = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] += amount
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [{"labels": dict(key), "value": value} for key, value in self.values.items()]
+
+    def samples(self) -> Iterable[Tuple[str, LabelKey, float]]:
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+
+class Histogram:
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (last one is +Inf), sum, count]
+        self.values: Dict[LabelKey, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _entries(self) -> List[Tuple[LabelKey, List[int], float, int]]:
+        with self.lock:
+            return [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+
+    def snapshot(self) -> list:
+        result = []
+        for key, counts, total, count in self._entries():
+            result.append({
+                "labels": dict(key),
+                "count": count,
+                "sum": round(total, 6),
+                "p50": self.quantile(counts, count, 0.5),
+                "p95": self.quantile(counts, count, 0.95),
+                "p99": self.quantile(counts, count, 0.99),
+            })
+        return result
+
+    def quantile(self, counts: List[int], count: int, q: float) -> float:
+        # upper bound of the bucket holding the q-th value (what Prometheus would interpolate from)
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound if bound != math.inf else self.buckets[-1]
+        return self.buckets[-1]
+
+    def samples(self) -> Iterable[Tuple[str, LabelKey, float]]:
+        for key, counts, total, count in self._entries():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                yield f"{self.name}_bucket", key + (("le", le),), cumulative
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, count
+
+
+class Gauge:
+    # collect() returns [(labels dict, value)], read only when metrics are served
+    def __init__(self, name: str, description: str, collect: Callable[[], List[Tuple[Dict, float]]]):
+        self.name = name
+        self.description = description
+        self.collect = collect
+
+    def snapshot(self) -> list:
+        return [{"labels": labels, "value": value} for labels, value in self.collect()]
+
+    def samples(self) -> Iterable[Tuple[str, LabelKey, float]]:
+        for labels, value in self.collect():
+            yield self.name, label_key(labels), value
+
+
+_counters: Dict[str, Counter] = {}
+_histograms: Dict[str, Histogram] = {}
+_gauges: Dict[str, Gauge] = {}
+
+
+def counter(name: str, description: str = "") -> Counter:
+    # Same name always gives back the same counter, so modules can declare them at import time
+    if name not in _counters:
+        _counters[name] = Counter(name, description)
+    return _counters[name]
+
+
+def histogram(name: str, description: str = "", buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    if name not in _histograms:
+        _histograms[name] = Histogram(name, description, buckets)
+    return _histograms[name]
+
+
+def gauge(name: str, description: str, collect: Callable[[], List[Tuple[Dict, float]]]) -> Gauge:
+    if name not in _gauges:
+        _gauges[name] = Gauge(name, description, collect)
+    return _gauges[name]
+
+
+def snapshot() -> Dict:
+    result = {name: c.snapshot() for name, c in _counters.items()}
+    result.update((name, h.snapshot()) for name, h in _histograms.items())
+    result.update((name, g.snapshot()) for name, g in _gauges.items())
+    return result
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render_prometheus() -> str:
+    lines = []
+    for kind, metrics in (("counter", _counters), ("histogram", _histograms), ("gauge", _gauges)):
+        for name, metric in sorted(metrics.items()):
+            if metric.description:
+                lines.append(f"# HELP {name} {escape(metric.description)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, key, value in metric.samples():
+                labels = ",".join(f'{k}="{escape(v)}"' for k, v in key)
+                lines.append(f"{sample_name}{{{labels}}} {format_value(value)}" if labels
+                             else f"{sample_name} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Stats route
+async def get_stats():
+    return snapshot()
+
+
+# Prometheus scrape route
+async def get_metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
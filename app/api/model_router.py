@@ -0,0 +1,222 @@
+"""
+Picks the Groq model of each completion from a routing config.
+
+The config (data/model_routes.json, or the file in MODEL_ROUTES) has:
+- models: context window, JSON mode / image support and price per million tokens
+  (input, output) of each model
+- tasks: per endpoint, tiers from the smallest to the largest model. A tier takes the
+  requests whose input (the tokens after the prompt template) fits its max_input_tokens,
+  the last tier takes the rest. Optional latency_budget (seconds) and max_error_rate
+  (the defaults section sets them for every task)
+
+For every request of a task, route():
+1. drops the models that can't serve it: no JSON mode when response_format asks for it,
+   no image support when a message has an image, or prompt + answer over the context
+2. takes the first tier the input fits in, one tier higher when the caller flags the input
+   as ambiguous (escalate=True, e.g. ingredients the database knows nothing about)
+3. moves on to a larger tier (then a smaller one) while the chosen model is unhealthy:
+   open circuit breaker, recent error rate over max_error_rate or p95 latency over
+   latency_budget (resilience.py keeps these per model)
+
+Tasks that are not in the config keep the model their request was built with.
+
+Decisions are counted in llm_route_total (task, model, reason: size, escalated, context,
+unhealthy, fixed) and set on the current span. /stats/routing shows the config version,
+the last ROUTER_DECISIONS decisions (default 200, with the estimated input tokens and
+the most the call can cost) and the cost of the tokens Groq reported per model.
+
+The config version is part of the LLM cache keys (route_version), so changing a route
+doesn't serve answers of the old models.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .metrics import counter
+from .prompts import Prompt, account, split_tokens
+from .resilience import OPEN, breaker, model_stats
+from .tracing import LLM_TOKENS, current_span
+
+DEFAULT_ROUTES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'model_routes.json')
+ROUTES_PATH = os.getenv("MODEL_ROUTES", DEFAULT_ROUTES)
+DECISIONS_KEPT = int(os.getenv("ROUTER_DECISIONS", "200"))
+# the smallest context of the current Groq models, for a model missing from the config
+DEFAULT_CONTEXT = 8192
+
+ROUTES = counter("llm_route_total", "Model chosen per task and why (size, escalated, context, unhealthy, fixed)")
+
+
+def load_routes(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        routes = json.load(f)
+    models = routes.get("models", {})
+    for task, route in routes.get("tasks", {}).items():
+        if not route.get("tiers"):
+            raise ValueError(f"Route for {task} has no tiers")
+        for tier in route["tiers"]:
+            if tier["model"] not in models:
+                raise ValueError(f"Route for {task} uses {tier['model']}, which is not in models")
+    return routes
+
+
+# a broken config stops the startup instead of failing requests
+_routes = load_routes(ROUTES_PATH)
+_decisions: Deque[Dict] = deque(maxlen=DECISIONS_KEPT)
+
+
+def _version(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+ROUTES_VERSION = _version(_routes)
+
+
+def route_version(task: str, default_model: str) -> str:
+    """Cache key part for a task: its route (the models it can pick), or the fixed model."""
+    route = _routes["tasks"].get(task)
+    if route is None:
+        return default_model
+    return f"route:{_version([route, {t['model']: _routes['models'][t['model']] for t in route['tiers']}])}"
+
+
+def model_context(model: str) -> int:
+    return _routes["models"].get(model, {}).get("context", DEFAULT_CONTEXT)
+
+
+def route_context(task: str, default_model: str) -> int:
+    """Context window a request of the task can count on, whichever tier the router picks."""
+    route = _routes["tasks"].get(task)
+    if route is None:
+        return model_context(default_model)
+    return min(model_context(tier["model"]) for tier in route["tiers"])
+
+
+def needs_json(request: Dict) -> bool:
+    return (request.get("response_format") or {}).get("type") == "json_object"
+
+
+def needs_vision(request: Dict) -> bool:
+    for message in request["messages"]:
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def completion_tokens(request: Dict) -> int:
+    return request.get("max_completion_tokens") or request.get("max_tokens") or 1024
+
+
+def max_cost(model: str, prompt_tokens: int, answer_tokens: int) -> Optional[float]:
+    prices = _routes["models"].get(model, {}).get("cost_per_million")
+    if not prices:
+        return None
+    return round((prompt_tokens * prices[0] + answer_tokens * prices[1]) / 1e6, 6)
+
+
+def unhealthy(model: str, route: Dict) -> Optional[str]:
+    """Why the model should be avoided right now, None if it is fine."""
+    if breaker(model).state == OPEN:
+        return "circuit open"
+    stats = model_stats(model)
+    max_error_rate = route.get("max_error_rate", _routes.get("defaults", {}).get("max_error_rate"))
+    error_rate = stats.error_rate()
+    if max_error_rate is not None and error_rate is not None and error_rate > max_error_rate:
+        return f"error rate {error_rate:.2f}"
+    latency_budget = route.get("latency_budget", _routes.get("defaults", {}).get("latency_budget"))
+    p95 = stats.p95()
+    if latency_budget is not None and p95 is not None and p95 > latency_budget:
+        return f"p95 {p95:.1f}s"
+    return None
+
+
+def choose(route: Dict, request: Dict, template_tokens: int, input_tokens: int,
+           escalate: bool) -> Tuple[int, str, List[str]]:
+    """(tier index, reason, skipped models) for one request."""
+    models = _routes["models"]
+    answer_tokens = completion_tokens(request)
+    json_mode, vision = needs_json(request), needs_vision(request)
+    tiers = route["tiers"]
+    skipped = []
+
+    usable = []
+    for index, tier in enumerate(tiers):
+        model = models[tier["model"]]
+        if (json_mode and not model.get("json")) or (vision and not model.get("vision")):
+            continue
+        if template_tokens + input_tokens + answer_tokens > model_context(tier["model"]):
+            skipped.append(f"{tier['model']}: context")
+            continue
+        usable.append(index)
+    if not usable:
+        # nothing fits, the largest model gets its chance (and the fallbacks after it)
+        return len(tiers) - 1, "context", skipped
+
+    by_size = next((i for i in usable if input_tokens <= tiers[i].get("max_input_tokens", float("inf"))), usable[-1])
+    reason = "context" if skipped and by_size == usable[0] and usable[0] > 0 else "size"
+    position = usable.index(by_size)
+    if escalate and position + 1 < len(usable):
+        position += 1
+        reason = "escalated"
+
+    # the chosen tier, then larger ones, then smaller ones
+    for index in usable[position:] + usable[:position][::-1]:
+        why = unhealthy(tiers[index]["model"], route)
+        if why is None:
+            return index, reason if index == usable[position] else "unhealthy", skipped
+        skipped.append(f"{tiers[index]['model']}: {why}")
+    # all unhealthy: keep the choice, the breakers and fallbacks (resilience.py) take over
+    return usable[position], reason, skipped
+
+
+def route(task: str, prompt: Optional[Prompt], request: Dict, escalate: bool = False) -> Dict:
+    """Sets the model of a completion request for its task, returns the request (accounted like account())."""
+    tokens = split_tokens(prompt, request)
+    template_tokens, input_tokens = tokens
+    config = _routes["tasks"].get(task)
+    if config is None:
+        ROUTES.inc(task=task, model=request["model"], reason="fixed")
+        return account(task, prompt, request, tokens)
+
+    tier, reason, skipped = choose(config, request, template_tokens, input_tokens, escalate)
+    model = config["tiers"][tier]["model"]
+    request["model"] = model
+    ROUTES.inc(task=task, model=model, reason=reason)
+    _decisions.append({
+        "at": round(time.time(), 3),
+        "task": task,
+        "model": model,
+        "tier": tier,
+        "reason": reason,
+        "input_tokens": input_tokens,
+        "template_tokens": template_tokens,
+        "skipped": skipped,
+        "max_cost_usd": max_cost(model, template_tokens + input_tokens, completion_tokens(request)),
+    })
+    stage = current_span()
+    if stage is not None:
+        stage.set(route_task=task, route_model=model, route_reason=reason, input_tokens=input_tokens)
+    return account(task, prompt, request, tokens)
+
+
+# Stats route
+async def get_routing_stats():
+    cost: Dict[str, float] = {}
+    for sample in LLM_TOKENS.snapshot():
+        model, kind = sample["labels"].get("model"), sample["labels"].get("kind")
+        prices = _routes["models"].get(model, {}).get("cost_per_million")
+        if prices:
+            price = prices[0] if kind == "prompt" else prices[1]
+            cost[model] = round(cost.get(model, 0.0) + sample["value"] * price / 1e6, 6)
+    return {
+        "config": ROUTES_PATH,
+        "version": ROUTES_VERSION,
+        "tasks": {task: [tier["model"] for tier in r["tiers"]] for task, r in _routes["tasks"].items()},
+        "decisions": ROUTES.snapshot(),
+        "cost_usd": cost,
+        "recent": list(_decisions),
+    }
@@ -0,0 +1,190 @@
+"""
+Keeps blocking work off the event loop, and catches what still blocks it.
+
+Sized pools, created on first use and closed on shutdown:
+- "io": sync I/O (SQLite caches and job store, local files), OFFLOAD_IO_WORKERS threads
+  (default 16). It is also the loop's default executor, so asyncio.to_thread and
+  libraries calling run_in_executor(None, ...) share it instead of another pool
+- "cpu": CPU work that releases the GIL (zlib / brotli, hashing), OFFLOAD_CPU_WORKERS
+  threads (default: the CPU count)
+- pools for one kind of work, e.g. "image" (image_pipeline.py, threads or processes)
+
+    data = await run_cpu(compress, body, encoding, size=len(body))
+
+The hop to a thread costs ~50us, so run_cpu(..., size=n) runs inline below
+OFFLOAD_INLINE_BYTES (default 64 KB). Pure Python work holding the GIL gains nothing in a
+thread, it belongs in a process pool (or in smaller pieces between awaits).
+
+Per pool: calls (offload_total), time queued before a worker picked the call up
+(offload_wait_seconds, grows when the pool is too small) and calls in flight
+(offload_pending).
+
+Stall detector: a heartbeat task sleeps LOOP_MONITOR_INTERVAL seconds (default 0.05,
+0 turns it off) and measures how late it wakes up. Lateness goes to
+event_loop_lag_seconds, and past LOOP_STALL_THRESHOLD_MS (default 100) it counts in
+event_loop_stalls_total, so a change that blocks the loop again shows up on /metrics.
+With LOOP_STALL_DEBUG=1 a watchdog thread also prints the stack of the loop thread
+while it is blocked, which points at the offending call.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from .metrics import counter, gauge, histogram
+
+IO_WORKERS = int(os.getenv("OFFLOAD_IO_WORKERS", "16"))
+CPU_WORKERS = int(os.getenv("OFFLOAD_CPU_WORKERS", str(os.cpu_count() or 1)))
+INLINE_BYTES = int(os.getenv("OFFLOAD_INLINE_BYTES", str(64 * 1024)))
+MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05"))
+STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "100")) / 1000
+STALL_DEBUG = os.getenv("LOOP_STALL_DEBUG", "0") == "1"
+
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+OFFLOADS = counter("offload_total", "Calls run in an offload pool")
+OFFLOAD_WAIT = histogram("offload_wait_seconds", "Time an offloaded call waited for a worker", LAG_BUCKETS)
+LOOP_LAG = histogram("event_loop_lag_seconds", "How late the event loop ran the heartbeat", LAG_BUCKETS)
+LOOP_STALLS = counter("event_loop_stalls_total", "Heartbeats late by more than LOOP_STALL_THRESHOLD_MS")
+
+
+def _timed(fn, args):
+    # runs in the worker, the wall clock start tells how long the call was queued
+    return time.time(), fn(*args)
+
+
+class Pool:
+    def __init__(self, name: str, workers: int, kind: str = "thread"):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.kind = kind
+        self.executor: Optional[Executor] = None
+        self.pending = 0
+
+    def get_executor(self) -> Executor:
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self.executor
+
+    async def run(self, fn, *args):
+        submitted = time.time()
+        self.pending += 1
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(self.get_executor(), _timed, fn, args)
+        finally:
+            self.pending -= 1
+        OFFLOADS.inc(pool=self.name)
+        OFFLOAD_WAIT.observe(max(started - submitted, 0.0), pool=self.name)
+        return result
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+_pools: Dict[str, Pool] = {}
+
+
+def pool(name: str, workers: int, kind: str = "thread") -> Pool:
+    # Same name always gives back the same pool (first caller sets the size)
+    if name not in _pools:
+        _pools[name] = Pool(name, workers, kind)
+    return _pools[name]
+
+
+io_pool = pool("io", IO_WORKERS)
+cpu_pool = pool("cpu", CPU_WORKERS)
+
+gauge("offload_pending", "Offloaded calls queued or running per pool",
+      lambda: [({"pool": name}, p.pending) for name, p in sorted(_pools.items())])
+
+
+async def run_io(fn, *args):
+    return await io_pool.run(fn, *args)
+
+
+async def run_cpu(fn, *args, size: Optional[int] = None):
+    if size is not None and size < INLINE_BYTES:
+        return fn(*args)
+    return await cpu_pool.run(fn, *args)
+
+
+class LoopMonitor:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.loop_thread = 0
+        # when the heartbeat last went to sleep
+        self.beat = 0.0
+
+    def start(self):
+        if MONITOR_INTERVAL <= 0 or self.task is not None:
+            return
+        self.loop_thread = threading.get_ident()
+        self.beat = time.perf_counter()
+        self.stopped.clear()
+        self.task = asyncio.ensure_future(self._heartbeat())
+        if STALL_DEBUG:
+            self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            self.beat = time.perf_counter()
+            await asyncio.sleep(MONITOR_INTERVAL)
+            lag = max(time.perf_counter() - self.beat - MONITOR_INTERVAL, 0.0)
+            LOOP_LAG.observe(lag)
+            if lag >= STALL_THRESHOLD:
+                LOOP_STALLS.inc()
+                if STALL_DEBUG:
+                    print(f"Event loop stalled for {lag * 1000:.0f} ms")
+
+    def _watch(self):
+        # one stack per stall, taken while the loop is still stuck
+        reported = None
+        while not self.stopped.wait(STALL_THRESHOLD / 4):
+            beat = self.beat
+            blocked = time.perf_counter() - beat - MONITOR_INTERVAL
+            if blocked < STALL_THRESHOLD or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is not None:
+                stack = "".join(traceback.format_stack(frame))
+                print(f"Event loop blocked for {blocked * 1000:.0f} ms so far, loop thread is at:\n{stack}")
+
+
+loop_monitor = LoopMonitor()
+
+
+# Called from the app lifespan on startup
+async def init_offload():
+    asyncio.get_running_loop().set_default_executor(io_pool.get_executor())
+    loop_monitor.start()
+
+
+# Called from the app lifespan on shutdown, before the browser pool: forked workers
+# (IMAGE_POOL=process) hold copies of the playwright driver's pipes, which keeps it from
+# exiting. The io pool is the loop's default executor, the loop shuts it down last.
+async def close_offload():
+    loop_monitor.stop()
+    for p in _pools.values():
+        if p is not io_pool:
+            p.close()
@@ -0,0 +1,156 @@
+"""
+Prompt templates, loaded once.
+
+Every template is read and validated when the app starts (a missing, empty or broken
+template stops the startup instead of failing the first request), so requests never
+touch the filesystem. Each template has:
+- version: hash of its content, used in the LLM cache keys
+- tokens: local estimate of its token count
+
+account() estimates how many tokens of a completion request are template and how many
+are the user's input (prompt_tokens_total on /stats, printed when PROMPTS_LOG_TOKENS=1).
+
+Set PROMPTS_HOT_RELOAD=1 in development to pick up edited templates without a restart
+(files are checked at most once a second).
+"""
+
+import os
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+from .cache import template_version
+from .metrics import counter
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (path relative to app/api, words the template must contain)
+TEMPLATES = {
+    "check-image": ("template/check-image-prompt.txt", ()),
+    "manual-check": ("template/manual-check-prompt.txt", ()),
+    # json_object responses need "json" somewhere in the prompt (Groq rejects them otherwise)
+    "suggestion": ("template/suggestion-prompt.txt", ("json",)),
+    "check-health": ("template/check-health-prompt.txt", ("json",)),
+    "url": ("url/urlPrompt.txt", ()),
+    "url-parse": ("url/parsePrompt.txt", ()),
+    "chat-summary": ("template/chat-summary-prompt.txt", ()),
+}
+
+HOT_RELOAD = os.getenv("PROMPTS_HOT_RELOAD") == "1"
+LOG_TOKENS = os.getenv("PROMPTS_LOG_TOKENS") == "1"
+RELOAD_CHECK_SECONDS = 1.0
+
+PROMPT_TOKENS = counter("prompt_tokens_total", "Estimated tokens sent per endpoint, template vs user input")
+
+# words, numbers and single punctuation marks, roughly how BPE tokenizers split text
+TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    # about 4 characters per token for long words, 3 digits per token for numbers
+    tokens = 0
+    for piece in TOKEN_PIECES.findall(text):
+        if piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            tokens += max(1, (len(piece) + 3) // 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+class Prompt:
+    def __init__(self, name: str, path: str, text: str, mtime: float):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        self.version = template_version(text)
+        self.tokens = estimate_tokens(text)
+
+
+class PromptRegistry:
+    def __init__(self, templates: Dict = TEMPLATES):
+        self.templates = templates
+        self.prompts: Dict[str, Prompt] = {}
+        self.checked_at = 0.0
+
+    def _read(self, name: str) -> Prompt:
+        relative_path, required = self.templates[name]
+        path = os.path.join(API_DIR, relative_path)
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        if not text.strip():
+            raise ValueError(f"Prompt template {name} ({relative_path}) is empty")
+        for word in required:
+            if word not in text.casefold():
+                raise ValueError(f"Prompt template {name} ({relative_path}) must mention '{word}'")
+        return Prompt(name, path, text, os.path.getmtime(path))
+
+    def load_all(self):
+        prompts = {name: self._read(name) for name in self.templates}
+        self.prompts = prompts
+        self.checked_at = time.monotonic()
+        for prompt in prompts.values():
+            print(f"Prompt {prompt.name}: version {prompt.version}, ~{prompt.tokens} tokens")
+
+    def _reload_changed(self):
+        now = time.monotonic()
+        if now - self.checked_at < RELOAD_CHECK_SECONDS:
+            return
+        self.checked_at = now
+        for name, prompt in list(self.prompts.items()):
+            try:
+                if os.path.getmtime(prompt.path) != prompt.mtime:
+                    self.prompts[name] = self._read(name)
+                    print(f"Prompt {name} reloaded: version {self.prompts[name].version}")
+            except (OSError, ValueError) as e:
+                # keep the last good version while the file is being edited
+                print(f"Prompt {name} not reloaded: {e}")
+
+    def get(self, name: str) -> Prompt:
+        if not self.prompts:
+            self.load_all()
+        elif HOT_RELOAD:
+            self._reload_changed()
+        return self.prompts[name]
+
+
+prompts = PromptRegistry()
+
+
+# Called from the app lifespan on startup
+def init_prompts():
+    prompts.load_all()
+
+
+def message_text(messages) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+def split_tokens(prompt: Optional[Prompt], request: dict) -> Tuple[int, int]:
+    """(template tokens, input tokens) of a completion request."""
+    text = message_text(request["messages"])
+    template_tokens = prompt.tokens if prompt else 0
+    if prompt and prompt.text in text:
+        # the template was counted once when it was loaded, only the input is new
+        return template_tokens, estimate_tokens(text.replace(prompt.text, "", 1))
+    return template_tokens, max(estimate_tokens(text) - template_tokens, 0)
+
+
+def account(endpoint: str, prompt: Optional[Prompt], request: dict, tokens: Optional[Tuple[int, int]] = None) -> dict:
+    """Records the template / input token split of a completion request, returns the request unchanged."""
+    template_tokens, input_tokens = tokens or split_tokens(prompt, request)
+    PROMPT_TOKENS.inc(template_tokens, endpoint=endpoint, part="template")
+    PROMPT_TOKENS.inc(input_tokens, endpoint=endpoint, part="input")
+    if LOG_TOKENS:
+        version = f"{prompt.name}@{prompt.version}" if prompt else "no template"
+        print(f"[tokens] {endpoint}: template {template_tokens} ({version}), input {input_tokens}")
+    return request
@@ -0,0 +1,358 @@
+"""
+Retries, hedging, circuit breaking and model fallback for Groq calls.
+
+Every completion (llm.py) goes through call():
+1. Deadline: the whole call, retries included, gets LLM_DEADLINE seconds (default 90,
+   chat_completion(deadline=...) overrides it per call). Each attempt keeps the
+   GROQ_TIMEOUT of the http client.
+2. Retries: 429, 5xx, timeouts and connection errors are retried up to LLM_RETRIES times
+   (default 2) with full jitter backoff (LLM_RETRY_BASE * 2^n, at most LLM_RETRY_MAX
+   seconds). A Retry-After from Groq is honored instead, capped at LLM_RETRY_MAX (and
+   at 60s in the Retry-After of our own 503), unless it is past the deadline.
+   The SDK's own retries are off, so nothing is retried twice.
+3. Hedging: once a model has LLM_HEDGE_MIN_SAMPLES latencies, an attempt still running
+   after that model's p95 gets a second, identical request; the first answer wins and the
+   other one is cancelled. Hedges are paid from a budget (each call adds
+   LLM_HEDGE_RATIO, default 0.1, a hedge costs 1), so a slow Groq never doubles the load.
+   Streams are not hedged.
+4. Circuit breaker per model: LLM_BREAKER_FAILURES (default 5) failed attempts in a row
+   open it for LLM_BREAKER_COOLDOWN seconds (default 30), then a single probe decides if
+   it closes again. A decommissioned / unknown model opens it for an hour right away.
+5. Fallback: when a model's breaker is open or its retries ran out, the call moves on to
+   the next model of its LLM_FALLBACKS chain ("model=fallback,..."; by default the
+   decommissioned mixtral, llama 3.2 vision preview and gemma2 go to current models).
+
+If every model failed that way the caller gets Overloaded (503 + Retry-After) instead of
+an error string. Other errors (bad request, auth...) are raised as before.
+
+Each attempt is counted in llm_attempts_total (model, kind first / retry / hedge, outcome)
+and is its own groq.chat span; fallbacks in llm_fallbacks_total, breaker states on
+/metrics as llm_breaker_state (0 closed, 1 half open, 2 open) and on /stats/llm.
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from .admission import MAX_RETRY_AFTER, Overloaded, OVERLOAD_STATUS
+from .metrics import counter, gauge
+
+DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))
+RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", "8"))
+HEDGE_RATIO = float(os.getenv("LLM_HEDGE_RATIO", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# a model that is gone won't come back in 30 seconds
+UNAVAILABLE_COOLDOWN = 3600.0
+DEFAULT_FALLBACKS = (
+    "mixtral-8x7b-32768=llama-3.3-70b-versatile,"
+    "llama-3.2-90b-vision-preview=meta-llama/llama-4-scout-17b-16e-instruct,"
+    "gemma2-9b-it=llama-3.1-8b-instant"
+)
+LATENCY_WINDOW = 200
+HEDGE_BUDGET_MAX = 10.0
+
+ATTEMPTS = counter("llm_attempts_total", "Groq attempts by model, kind (first, retry, hedge) and outcome")
+FALLBACKS = counter("llm_fallbacks_total", "Calls answered by a fallback model (from, to)")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+def parse_fallbacks(value: str) -> Dict[str, str]:
+    fallbacks = {}
+    for pair in value.split(","):
+        model, _, fallback = pair.partition("=")
+        if model.strip() and fallback.strip():
+            fallbacks[model.strip()] = fallback.strip()
+    return fallbacks
+
+
+FALLBACKS_BY_MODEL = parse_fallbacks(os.getenv("LLM_FALLBACKS", DEFAULT_FALLBACKS))
+
+
+def candidates(model: str) -> List[str]:
+    # the model, then its fallback chain (cycles are cut)
+    chain = [model]
+    while FALLBACKS_BY_MODEL.get(chain[-1]) and FALLBACKS_BY_MODEL[chain[-1]] not in chain:
+        chain.append(FALLBACKS_BY_MODEL[chain[-1]])
+    return chain
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_unavailable(error: BaseException) -> bool:
+    # decommissioned or unknown model, retrying won't help but another model might
+    if status_of(error) not in (400, 404):
+        return False
+    message = str(error).lower()
+    return "decommissioned" in message or "model_not_found" in message or "does not exist" in message
+
+
+def is_retryable(error: BaseException) -> bool:
+    # shed by our own admission control: already waited, the caller answers 503
+    if isinstance(error, Overloaded):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # groq / httpx timeouts and connection errors
+    if "Timeout" in type(error).__name__ or "Connection" in type(error).__name__:
+        return True
+    status = status_of(error)
+    return status is not None and (status in OVERLOAD_STATUS or status >= 500)
+
+
+def retry_after(error: Optional[BaseException]) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # an HTTP date, rare enough to fall back to our own backoff
+        pass
+    return None
+
+
+def backoff(retry: int, error: BaseException) -> float:
+    delay = retry_after(error)
+    if delay is not None:
+        # one huge header must not eat the whole deadline
+        return min(max(delay, 0.0), RETRY_MAX)
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** retry))
+
+
+class CircuitBreaker:
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probe_started = 0.0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.probe_started = now
+            return True
+        # half open: one probe at a time (a probe that never came back is replaced)
+        if self.state == HALF_OPEN and now - self.probe_started >= self.cooldown:
+            self.probe_started = now
+            return True
+        return False
+
+    def success(self):
+        if self.state != CLOSED:
+            print(f"Circuit for {self.model} closed")
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self, unavailable: bool = False):
+        self.failures += 1
+        if unavailable or self.state == HALF_OPEN or self.failures >= BREAKER_FAILURES:
+            if self.state != OPEN:
+                reason = "model unavailable" if unavailable else f"{self.failures} failures"
+                print(f"Circuit for {self.model} opened ({reason})")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.cooldown = UNAVAILABLE_COOLDOWN if unavailable else BREAKER_COOLDOWN
+
+    def retry_in(self) -> int:
+        if self.state != OPEN:
+            return 1
+        return max(1, math.ceil(self.cooldown - (time.monotonic() - self.opened_at)))
+
+
+class ModelStats:
+    # recent latencies (for the hedge delay), outcomes (for the router, model_router.py)
+    # and the hedge budget of one model
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=LATENCY_WINDOW)
+        self.hedge_budget = 0.0
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+
+    def outcome(self, ok: bool):
+        self.outcomes.append(ok)
+
+    def error_rate(self) -> Optional[float]:
+        if len(self.outcomes) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def hedge_delay(self) -> Optional[float]:
+        # every call earns a fraction of a hedge
+        self.hedge_budget = min(self.hedge_budget + HEDGE_RATIO, HEDGE_BUDGET_MAX)
+        return self.p95() if HEDGE_RATIO > 0 else None
+
+    def take_hedge(self) -> bool:
+        if self.hedge_budget < 1:
+            return False
+        self.hedge_budget -= 1
+        return True
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_stats: Dict[str, ModelStats] = {}
+
+
+def breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(model)
+    return _breakers[model]
+
+
+def model_stats(model: str) -> ModelStats:
+    if model not in _stats:
+        _stats[model] = ModelStats()
+    return _stats[model]
+
+
+gauge("llm_breaker_state", "Circuit breaker per model (0 closed, 1 half open, 2 open)",
+      lambda: [({"model": m}, (CLOSED, HALF_OPEN, OPEN).index(b.state)) for m, b in sorted(_breakers.items())])
+
+
+Attempt = Callable[[Dict, str], Awaitable[Any]]
+
+
+async def timed(attempt: Attempt, kwargs: Dict, kind: str, observe: bool = True) -> Any:
+    started = time.monotonic()
+    try:
+        result = await attempt(kwargs, kind)
+    except asyncio.CancelledError:
+        ATTEMPTS.inc(model=kwargs["model"], kind=kind, outcome="cancelled")
+        raise
+    except Exception as e:
+        ATTEMPTS.inc(model=kwargs["model"], kind=kind, outcome="error")
+        # the model's fault, not a bad request or our own admission control
+        if is_retryable(e) or is_unavailable(e):
+            model_stats(kwargs["model"]).outcome(False)
+        raise
+    ATTEMPTS.inc(model=kwargs["model"], kind=kind, outcome="ok")
+    stats = model_stats(kwargs["model"])
+    stats.outcome(True)
+    if observe:
+        stats.observe(time.monotonic() - started)
+    return result
+
+
+async def hedged(attempt: Attempt, kwargs: Dict, kind: str, hedge: bool) -> Any:
+    stats = model_stats(kwargs["model"])
+    if not hedge:
+        # streams: time to the first token, not comparable with whole completions
+        return await timed(attempt, kwargs, kind, observe=False)
+    delay = stats.hedge_delay()
+    if delay is None:
+        return await timed(attempt, kwargs, kind)
+
+    first = asyncio.ensure_future(timed(attempt, kwargs, kind))
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and stats.take_hedge():
+            tasks.append(asyncio.ensure_future(timed(attempt, kwargs, "hedge")))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        # the slower one is not needed anymore (cancel is a no-op once done)
+        for task in tasks:
+            task.cancel()
+
+
+async def with_retries(attempt: Attempt, kwargs: Dict, circuit: CircuitBreaker, deadline: float, hedge: bool) -> Any:
+    for retry in range(RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        try:
+            result = await asyncio.wait_for(
+                hedged(attempt, kwargs, "first" if retry == 0 else "retry", hedge), remaining)
+        except Exception as e:
+            if is_unavailable(e):
+                circuit.failure(unavailable=True)
+                raise
+            if not is_retryable(e):
+                raise
+            circuit.failure()
+            delay = backoff(retry, e)
+            # out of retries, out of time, or the model is out: the fallback's turn
+            if retry == RETRIES or circuit.state == OPEN or time.monotonic() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            circuit.success()
+            return result
+
+
+async def call(attempt: Attempt, kwargs: Dict, deadline: Optional[float] = None, hedge: bool = True) -> Any:
+    """attempt(kwargs, kind) once per try, with retries, hedging, breakers and fallbacks."""
+    model = kwargs.get("model")
+    deadline = time.monotonic() + (deadline or DEADLINE)
+    last_error: Optional[BaseException] = None
+    retry_in = 1
+    for candidate in candidates(model):
+        circuit = breaker(candidate)
+        if not circuit.allow():
+            ATTEMPTS.inc(model=candidate, kind="first", outcome="breaker_open")
+            retry_in = max(retry_in, circuit.retry_in())
+            continue
+        try:
+            result = await with_retries(attempt, {**kwargs, "model": candidate}, circuit, deadline, hedge)
+        except Exception as e:
+            if not (is_retryable(e) or is_unavailable(e)):
+                raise
+            last_error = e
+            retry_in = max(retry_in, min(math.ceil(retry_after(e) or 1), MAX_RETRY_AFTER))
+            continue
+        if candidate != model:
+            FALLBACKS.inc(**{"from": model, "to": candidate})
+        return result
+
+    if last_error is not None:
+        print(f"Groq call for {model} failed on every model: {type(last_error).__name__}: {last_error}")
+    raise Overloaded(f"groq:{model}", retry_in)
+
+
+# Stats route
+async def get_llm_stats():
+    return {
+        model: {
+            "state": circuit.state,
+            "failures": circuit.failures,
+            "retry_in": circuit.retry_in(),
+            "fallbacks": candidates(model)[1:],
+            "hedge_delay": model_stats(model).p95(),
+            "error_rate": model_stats(model).error_rate(),
+        }
+        for model, circuit in sorted(_breakers.items())
+    }
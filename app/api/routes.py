@@ -1,34 +1,64 @@
-from fastapi import APIRouter, UploadFile, File
-from .endpoints import root, health_check, check_image, check_url,manual_check, check_raw ,suggestions, check_health, get_from_s3, ask_question
-
-app_router = APIRouter()
-
-# Default route
-app_router.get("/")(root)
-
-# Health check route
-app_router.get("/health")(health_check)
-
-# Check Image's Content
-app_router.post("/check-image")(check_image)
-
-# Check URL
-app_router.post("/extract-url")(check_url)
-
-# Manual check route 
-app_router.post("/manual-check")(manual_check)
-
-# Check Raw
-app_router.post("/check-raw")(check_raw)
-
-# Suggestions route
-app_router.post("/suggestions")(suggestions)
-
-# Check User's health
-app_router.post("/check-health")(check_health)
-
-# Get Explore data from S3
-app_router.get("/get-from-s3")(get_from_s3)
-
-# Chat route
-app_router.post("/chat")(ask_question)
\ No newline at end of file
+from fastapi import APIRouter, UploadFile, File
+from .metrics import get_stats, get_metrics
+from .admission import get_admission_stats
+from .resilience import get_llm_stats
+from .model_router import get_routing_stats
+from .batch import manual_check_batch, check_raw_batch, suggestions_batch
+from .explore import get_from_s3
+from .jobs import submit_url_job, get_job
+from .endpoints import root, health_check, check_image, check_url,manual_check, check_raw ,suggestions, check_health, check_health_metrics, ask_question
+
+app_router = APIRouter()
+
+# Default route
+app_router.get("/")(root)
+
+# Health check route
+app_router.get("/health")(health_check)
+
+# Check Image's Content
+app_router.post("/check-image")(check_image)
+
+# Check URL
+app_router.post("/extract-url")(check_url)
+app_router.post("/extract-url/jobs")(submit_url_job)
+
+# Async job status / result
+app_router.get("/jobs/{job_id}")(get_job)
+
+# Manual check route 
+app_router.post("/manual-check")(manual_check)
+app_router.post("/manual-check/batch")(manual_check_batch)
+
+# Check Raw
+app_router.post("/check-raw")(check_raw)
+app_router.post("/check-raw/batch")(check_raw_batch)
+
+# Suggestions route
+app_router.post("/suggestions")(suggestions)
+app_router.post("/suggestions/batch")(suggestions_batch)
+
+# Check User's health
+app_router.post("/check-health")(check_health)
+app_router.post("/check-health/metrics")(check_health_metrics)
+
+# Get Explore data from S3
+app_router.get("/get-from-s3")(get_from_s3)
+
+# Chat route
+app_router.post("/chat")(ask_question)
+
+# Hot path counters
+app_router.get("/stats")(get_stats)
+
+# Prometheus scrape endpoint (counters, latency histograms per stage / route / model)
+app_router.get("/metrics")(get_metrics)
+
+# Limits, queue depth and wait times of the admission control
+app_router.get("/stats/admission")(get_admission_stats)
+
+# Circuit breakers, fallbacks and hedge delays per model
+app_router.get("/stats/llm")(get_llm_stats)
+
+# Model routing config, decisions and estimated cost per model
+app_router.get("/stats/routing")(get_routing_stats)
@@ -0,0 +1,48 @@
+"""
+Request coalescing (single flight).
+
+When a product goes viral we get bursts of identical requests in the same second.
+Instead of each one launching its own browser / LLM call, the first request for a
+key starts the work as a task and every concurrent request with the same key awaits
+that same task.
+
+The shared task is shielded: if one waiter is cancelled (client disconnected) the
+work keeps going for the others. Once the task is done the key is forgotten, so
+later requests start fresh (caching is the cache's job, not ours).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from .metrics import counter
+
+COALESCED = counter("singleflight_requests_total", "Requests that started (leader) or joined (follower) shared work")
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        # mark the exception as retrieved when every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            COALESCED.inc(flight=self.name, role="leader")
+        else:
+            COALESCED.inc(flight=self.name, role="follower")
+
+        # cancelling this waiter must not cancel the shared work
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self.tasks)
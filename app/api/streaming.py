@@ -0,0 +1,151 @@
+"""
+Server-Sent Events for the long LLM endpoints.
+
+Opt-in per request, with either `?stream=true` or `Accept: text/event-stream`.
+Without it the endpoints keep returning the usual JSON body.
+
+Events sent on the stream:
+- token: {"text": "..."}             every piece of the completion as Groq sends it
+- field: {"key": "...", "value": ...} a top level JSON field as soon as it is complete
+                                      (e.g. "verdict" or "trustability_score")
+- done:  the same body the non streaming endpoint would have returned
+- error: {"detail": "..."}
+"""
+
+import json
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from .cache import MISSING, llm_cache
+from .llm import stream_chat_completion
+from .admission import Overloaded
+
+
+def wants_stream(request: Request, stream: bool = False) -> bool:
+    return stream or "text/event-stream" in request.headers.get("accept", "")
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class IncrementalJSONFields:
+    """Fed the completion piece by piece, returns top level (key, value) pairs once they are complete."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.key_start: Optional[int] = None
+        self.key: Optional[str] = None
+        self.value_start: Optional[int] = None
+        self.finished = False
+
+    def _emit(self, fields: List[Tuple[str, Any]], end: int):
+        if self.key is not None and self.value_start is not None:
+            try:
+                fields.append((self.key, json.loads(self.buffer[self.value_start:end])))
+            except ValueError:
+                pass
+        self.key = None
+        self.value_start = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self.buffer += text
+        fields = []
+        while self.pos < len(self.buffer) and not self.finished:
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.key = json.loads(self.buffer[self.key_start:self.pos + 1])
+                        self.key_start = None
+            elif char == '"':
+                self.in_string = True
+                # a string at the top level, before the colon, is a key
+                if self.depth == 1 and self.value_start is None:
+                    self.key_start = self.pos
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self._emit(fields, self.pos)
+                    self.finished = True
+            elif char == ':' and self.depth == 1 and self.value_start is None and self.key is not None:
+                self.value_start = self.pos + 1
+            elif char == ',' and self.depth == 1:
+                self._emit(fields, self.pos)
+            self.pos += 1
+        return fields
+
+
+async def sse_response(
+    completion_kwargs: dict,
+    parse: Callable[[str], Any],
+    to_body: Callable[[Any], Any],
+    key: Optional[str] = None,
+    cache_enabled: bool = False,
+    prelude: Optional[List[Tuple[str, Any]]] = None,
+    known: Any = MISSING,
+) -> StreamingResponse:
+    """Streams a completion as SSE.
+
+    parse(text) turns the full completion into the value we cache (text or parsed JSON),
+    to_body(value) turns that into the normal response body for the final "done" event.
+    prelude fields (already known without the model) are sent as "field" events first.
+    known is a full answer decided locally, sent like a cache hit.
+    """
+    if known is not MISSING:
+        cached, status = known, "LOCAL"
+    else:
+        cached = await llm_cache.get(key) if key and cache_enabled else MISSING
+        status = "HIT" if cached is not MISSING else ("MISS" if cache_enabled else "BYPASS")
+
+    async def events():
+        fields = IncrementalJSONFields()
+        for field, value in prelude or []:
+            yield sse_event("field", {"key": field, "value": value})
+
+        if cached is not MISSING:
+            text = cached if isinstance(cached, str) else json.dumps(cached)
+            for field, value in fields.feed(text):
+                yield sse_event("field", {"key": field, "value": value})
+            yield sse_event("done", to_body(cached))
+            return
+
+        parts = []
+        try:
+            async for piece in stream_chat_completion(**completion_kwargs):
+                parts.append(piece)
+                yield sse_event("token", {"text": piece})
+                for field, value in fields.feed(piece):
+                    yield sse_event("field", {"key": field, "value": value})
+
+            value = parse("".join(parts))
+            if key and cache_enabled:
+                await llm_cache.set(key, value)
+            yield sse_event("done", to_body(value))
+        except Overloaded as e:
+            # headers are already sent, the client gets the Retry-After in the event
+            yield sse_event("error", {"detail": e.detail, "retry_after": e.retry_after})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    headers = {
+        "Cache-Control": "no-cache",
+        # don't let proxies buffer the stream
+        "X-Accel-Buffering": "no",
+    }
+    if key or known is not MISSING:
+        headers["X-Cache"] = status
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
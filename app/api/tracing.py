@@ -0,0 +1,265 @@
+"""
+Timing spans for the hot paths.
+
+    with span("url.fetch_static", url=url) as s:
+        page = await fetch_static(url)
+        s.set(chars=len(page["content"]))
+
+Every span is observed in the stage_duration_seconds histogram (stage, outcome), so
+/metrics shows where the time of a slow /extract-url went: browser launch, page.goto,
+the content wait, the DOM scrape, the AI call, the AI parse fallback... LLM calls also
+go to llm_request_duration_seconds (model, outcome) and llm_tokens_total (model, kind),
+and each HTTP request to http_request_duration_seconds (route, method, status).
+
+Spans nest through a context variable: the request span (TracingMiddleware) is the root,
+and the stages and LLM calls under it share its trace id (an incoming W3C traceparent
+header is continued).
+
+Trace export is off unless TRACE_EXPORT_URL is set, e.g. a local OpenTelemetry
+collector (http://localhost:4318/v1/traces). Finished traces are then sent in OTLP/JSON
+batches every TRACE_EXPORT_INTERVAL seconds (default 2) from a background task, with
+TRACE_SAMPLE_RATE (default 1.0) of the requests kept. The buffer holds at most
+TRACE_BUFFER spans (default 10000), beyond that spans are dropped rather than slowing
+requests down. Without export a span costs two clock reads and a histogram update.
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+from .metrics import counter, histogram
+
+EXPORT_URL = os.getenv("TRACE_EXPORT_URL")
+EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+BUFFER_SIZE = int(os.getenv("TRACE_BUFFER", "10000"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "veritrust-backend")
+EXPORT_BATCH = 512
+
+STAGES = histogram("stage_duration_seconds", "Time per stage of a request (see tracing.py)")
+HTTP_REQUESTS = histogram("http_request_duration_seconds", "Time per HTTP request by route")
+LLM_REQUESTS = histogram("llm_request_duration_seconds", "Time per Groq completion by model")
+LLM_TOKENS = counter("llm_tokens_total", "Tokens reported by Groq by model and kind (prompt, completion)")
+SPANS_DROPPED = counter("trace_spans_dropped_total", "Spans not exported because the buffer was full or the export failed")
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_finished: Deque[dict] = deque()
+
+
+def new_id(bytes_: int) -> str:
+    return f"{random.getrandbits(bytes_ * 8):0{bytes_ * 2}x}"
+
+
+class Span:
+    __slots__ = ("name", "attributes", "parent", "trace_id", "span_id", "sampled", "kind",
+                 "start", "start_wall", "outcome", "token")
+
+    def __init__(self, name: str, kind: int = INTERNAL, trace_id: Optional[str] = None,
+                 parent_id: Optional[str] = None, **attributes):
+        parent = _current.get()
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        if parent is not None:
+            self.trace_id, self.parent, self.sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            self.trace_id = trace_id or new_id(16)
+            self.parent = parent_id
+            self.sampled = EXPORT_URL is not None and random.random() < SAMPLE_RATE
+        self.span_id = new_id(8) if self.sampled else ""
+        self.outcome = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.token = _current.set(self)
+        self.start = time.perf_counter()
+        self.start_wall = time.time_ns()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        duration = time.perf_counter() - self.start
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # entered in another task (a stream opened under wait_for, then read by the
+            # request), there is nothing to undo in this one
+            pass
+        if error_type is not None and self.outcome == "ok":
+            # the client going away is not an error of this stage
+            self.outcome = "cancelled" if issubclass(error_type, asyncio.CancelledError) else "error"
+            if self.outcome == "error":
+                self.attributes["error"] = f"{error_type.__name__}: {error}"[:300]
+        self.record(duration)
+        if self.sampled:
+            self.export(duration)
+        return False
+
+    def record(self, duration: float):
+        STAGES.observe(duration, stage=self.name, outcome=self.outcome)
+
+    def export(self, duration: float):
+        if len(_finished) >= BUFFER_SIZE:
+            SPANS_DROPPED.inc(reason="buffer_full")
+            return
+        _finished.append({
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_wall),
+            "endTimeUnixNano": str(self.start_wall + int(duration * 1e9)),
+            "attributes": [otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.attributes.get("error", "")} if self.outcome == "error" else {"code": 1},
+        })
+
+
+class LLMSpan(Span):
+    __slots__ = ()
+
+    def record(self, duration: float):
+        model = self.attributes.get("model", "unknown")
+        LLM_REQUESTS.observe(duration, model=model, outcome=self.outcome)
+        for kind in ("prompt", "completion"):
+            tokens = self.attributes.get(f"{kind}_tokens")
+            if tokens:
+                LLM_TOKENS.inc(tokens, model=model, kind=kind)
+
+
+class RequestSpan(Span):
+    __slots__ = ()
+
+    def record(self, duration: float):
+        # requests have their own histogram, stage_duration_seconds is for the stages
+        pass
+
+
+def span(name: str, **attributes) -> Span:
+    return Span(name, **attributes)
+
+
+def llm_span(model: str, **attributes) -> LLMSpan:
+    return LLMSpan("groq.chat", kind=CLIENT, model=model, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def record_usage(target: Span, usage: Any):
+    # usage object of a Groq completion (or the x_groq usage of the last stream chunk)
+    if usage is None:
+        return
+    target.set(
+        prompt_tokens=getattr(usage, "prompt_tokens", None),
+        completion_tokens=getattr(usage, "completion_tokens", None),
+    )
+
+
+def otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def parse_traceparent(header: Optional[str]):
+    # 00-<32 hex trace id>-<16 hex parent id>-<flags>
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+class TracingMiddleware:
+    """Root span and http_request_duration_seconds for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        with RequestSpan(scope["method"], kind=SERVER, trace_id=trace_id, parent_id=parent_id) as request_span:
+            try:
+                await self.app(scope, receive, send_status)
+            finally:
+                # the route template, not the path (/jobs/{job_id}, not one series per job)
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                request_span.name = f"{scope['method']} {route}"
+                request_span.set(**{"http.route": route, "http.status_code": status})
+                HTTP_REQUESTS.observe(time.perf_counter() - started, route=route, method=scope["method"], status=status)
+
+
+class TraceExporter:
+    # Sends finished spans to TRACE_EXPORT_URL in the background
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if EXPORT_URL and self.task is None:
+            self.client = httpx.AsyncClient(timeout=httpx.Timeout(5.0))
+            self.task = asyncio.ensure_future(self._export_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            # whatever is left, best effort
+            await self.flush()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def flush(self):
+        while _finished and self.client is not None:
+            batch = [_finished.popleft() for _ in range(min(len(_finished), EXPORT_BATCH))]
+            body = {"resourceSpans": [{
+                "resource": {"attributes": [otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": "veritrust"}, "spans": batch}],
+            }]}
+            try:
+                response = await self.client.post(EXPORT_URL, json=body)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                SPANS_DROPPED.inc(len(batch), reason="export_failed")
+                print(f"Trace export failed, {len(batch)} spans dropped: {e}")
+                return
+
+    async def _export_forever(self):
+        while True:
+            await asyncio.sleep(EXPORT_INTERVAL)
+            await self.flush()
+
+
+trace_exporter = TraceExporter()
@@ -0,0 +1,232 @@
+"""
+Warm Chromium pool for /extract-url.
+
+Launching Chromium costs seconds and hundreds of MB per request, so instead we keep
+a small number of browsers running for the lifetime of the app and hand out
+isolated contexts (one context + one page per request, so cookies and storage never
+leak between requests).
+
+- BROWSER_POOL_SIZE: number of browsers kept warm (default 1)
+- BROWSER_MAX_PAGES: max pages open at the same time across the pool (default 8)
+- BROWSER_RECYCLE_PAGES: restart a browser after it served this many pages (default 200)
+- BROWSER_RECYCLE_RSS_MB: restart a browser when the Chromium processes use more memory than this (default 1024)
+- BROWSER_MAX_BROWSERS: browsers alive at once, retired ones still finishing their pages
+  included (default BROWSER_POOL_SIZE + 1)
+
+A retired browser keeps running until its open pages are done. Only one browser is
+retired for memory at a time, and no replacement is launched past BROWSER_MAX_BROWSERS
+(new pages share the draining browsers instead), so memory pressure can't multiply the
+Chromium processes.
+
+Pages are handed out through the "browser" adaptive limiter (admission.py, up to
+BROWSER_MAX_PAGES): it backs off when pages time out or Chromium goes over its memory
+budget, and sheds requests with 503 once too many are waiting.
+
+Crashed browsers are detected through the "disconnected" event and relaunched on the
+next request.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import psutil
+from playwright.async_api import async_playwright, Browser, Page, Playwright
+
+from ..admission import WAIT_SECONDS, limiter
+from ..tracing import span
+
+BROWSER_ARGS = [
+    '--disable-gpu',
+    '--disable-dev-shm-usage',
+    '--disable-setuid-sandbox',
+    '--no-sandbox',
+]
+
+# using custom headers to avoid being blocked by the website like amazon or flipkart
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+}
+
+
+class PooledBrowser:
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.pages_served = 0
+        self.active_pages = 0
+        self.retiring = False
+        self.crashed = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, *_):
+        self.crashed = True
+
+    @property
+    def usable(self) -> bool:
+        return not (self.retiring or self.crashed) and self.browser.is_connected()
+
+
+class BrowserPool:
+    def __init__(self):
+        self.size = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+        self.max_pages = int(os.getenv("BROWSER_MAX_PAGES", "8"))
+        self.recycle_pages = int(os.getenv("BROWSER_RECYCLE_PAGES", "200"))
+        self.recycle_rss = int(os.getenv("BROWSER_RECYCLE_RSS_MB", "1024")) * 1024 * 1024
+        self.max_browsers = max(int(os.getenv("BROWSER_MAX_BROWSERS", str(self.size + 1))), self.size, 1)
+
+        self.playwright: Optional[Playwright] = None
+        self.browsers: List[PooledBrowser] = []
+        self.page_slots = asyncio.Semaphore(self.max_pages)
+        # pages wait longer than LLM calls, a browser page is most of an /extract-url request
+        # sites load at very different speeds, only errors and the memory budget cut the limit
+        self.limiter = limiter("browser", self.max_pages, wait=WAIT_SECONDS * 2, latency_signal=False)
+        self.last_rss = 0
+        self.lock = asyncio.Lock()
+        self.next_index = 0
+
+    async def start(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+
+    async def warm_up(self):
+        # Launch the browsers up front so the first request doesn't pay for it
+        async with self.lock:
+            await self.start()
+            while len(self.browsers) < self.size:
+                self.browsers.append(await self._launch())
+
+    async def stop(self):
+        async with self.lock:
+            for pooled in self.browsers:
+                await self._close_browser(pooled)
+            self.browsers = []
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
+
+    async def _launch(self) -> PooledBrowser:
+        with span("browser.launch"):
+            browser = await self.playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+        return PooledBrowser(browser)
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception:
+            # already dead (crashed), nothing to clean up
+            pass
+
+    def _chromium_rss(self) -> int:
+        # Chromium runs as (grand)children of this worker through the playwright driver
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                if 'chrom' in child.name().lower():
+                    total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    async def _acquire_browser(self) -> PooledBrowser:
+        async with self.lock:
+            await self.start()
+
+            # drop crashed browsers and close retired ones once they are idle
+            for pooled in list(self.browsers):
+                if pooled.crashed or (pooled.retiring and pooled.active_pages == 0):
+                    self.browsers.remove(pooled)
+                    await self._close_browser(pooled)
+
+            # shared memory threshold, retire the busiest browser so it gets restarted.
+            # Not while another one is still draining, its memory is only freed once it closes
+            self.last_rss = self._chromium_rss() if self.browsers else 0
+            usable = [b for b in self.browsers if b.usable]
+            draining = any(b.retiring for b in self.browsers)
+            if self.last_rss > self.recycle_rss and usable and not draining:
+                busiest = max(usable, key=lambda b: b.pages_served)
+                busiest.retiring = True
+                usable.remove(busiest)
+                if busiest.active_pages == 0:
+                    self.browsers.remove(busiest)
+                    await self._close_browser(busiest)
+
+            while len(usable) < self.size and len(self.browsers) < self.max_browsers:
+                pooled = await self._launch()
+                self.browsers.append(pooled)
+                usable.append(pooled)
+            if not usable:
+                # every slot taken by draining browsers: the newest one serves this page too,
+                # so the older ones still drain and free a slot
+                usable = [b for b in self.browsers if b.browser.is_connected()][-1:]
+            if not usable:
+                pooled = await self._launch()
+                self.browsers.append(pooled)
+                usable.append(pooled)
+
+            # round robin over the warm browsers
+            pooled = usable[self.next_index % len(usable)]
+            self.next_index += 1
+            pooled.active_pages += 1
+            pooled.pages_served += 1
+            if pooled.pages_served >= self.recycle_pages:
+                pooled.retiring = True
+            return pooled
+
+    async def _release_browser(self, pooled: PooledBrowser):
+        async with self.lock:
+            pooled.active_pages -= 1
+            if pooled.retiring and pooled.active_pages == 0 and pooled in self.browsers:
+                self.browsers.remove(pooled)
+                await self._close_browser(pooled)
+
+    @asynccontextmanager
+    async def page(self):
+        # Hands out a fresh page in its own context, closed when the block exits
+        async with self.limiter.slot() as ticket, self.page_slots:
+            with span("browser.acquire"):
+                pooled = await self._acquire_browser()
+            context = None
+            try:
+                with span("browser.new_page"):
+                    context = await pooled.browser.new_context(**CONTEXT_OPTIONS)
+                    page: Page = await context.new_page()
+                yield page
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+                await self._release_browser(pooled)
+            # memory pressure counts as overload even when the page loaded fine
+            ticket.overloaded = self.last_rss > self.recycle_rss
+
+
+_browser_pool: Optional[BrowserPool] = None
+
+
+# Called from the app lifespan on startup
+async def init_browser_pool() -> BrowserPool:
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool()
+        await _browser_pool.warm_up()
+    return _browser_pool
+
+
+# Called from the app lifespan on shutdown
+async def close_browser_pool():
+    global _browser_pool
+    if _browser_pool is not None:
+        await _browser_pool.stop()
+        _browser_pool = None
+
+
+def get_browser_pool() -> BrowserPool:
+    # Lazily create the pool if the lifespan did not run (e.g. scripts)
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool()
+    return _browser_pool
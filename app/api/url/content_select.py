@@ -0,0 +1,146 @@
+# Picks which part of a long product page goes to the AI.
+#
+# Cutting the text at 4000 characters often dropped the ingredients (they tend to be far
+# down the page), and the model then had to guess them (ai_generated: true).
+# Instead the page is split into segments, each segment is scored (ingredients /
+# contains / nutrition / allergens / words of the title score high, cart / cookies /
+# reviews boilerplate scores low, neighbours of a good segment get some of its score
+# since the list often comes right after its heading), and the best segments are packed
+# into a token budget, kept in page order.
+#
+# - URL_CONTENT_TOKENS: content budget per AI call (default 1500), never more than what
+#   the context leaves after the prompt and the answer. The context is the smallest one
+#   of the models the router can pick for extract-url (model_router.py), so the page
+#   fits whichever tier serves it
+# - URL_MAP_REDUCE=1: for very long pages, up to URL_MAP_CHUNKS (default 3) budgets of
+#   relevant content are extracted in parallel and merged (see url_logic.py)
+
+import os
+import re
+from typing import List, Tuple
+
+from ..prompts import estimate_tokens
+
+CONTENT_TOKENS = int(os.getenv("URL_CONTENT_TOKENS", "1500"))
+MAP_REDUCE = os.getenv("URL_MAP_REDUCE") == "1"
+MAP_CHUNKS = int(os.getenv("URL_MAP_CHUNKS", "3"))
+
+# message wrapper, title line, ...
+OVERHEAD_TOKENS = 100
+
+SEGMENT_CHARS = 300
+SEPARATOR = " ... "
+
+SENTENCE_END = re.compile(r'(?<=[.!?|•·])\s+')
+KEYWORDS = [
+    (re.compile(r'\bingredients?\b', re.I), 10.0),
+    (re.compile(r'\b(?:contains|may contain|allergens?|allergy)\b', re.I), 5.0),
+    (re.compile(r'\b(?:nutrition(?:al)?|per 100 ?g|energy|protein|carbohydrates?|sugars?|sodium|fat)\b', re.I), 2.0),
+    (re.compile(r'\b(?:INS|E)\s?\d{3}\b'), 3.0),
+    (re.compile(r'\b(?:made with|made from|composition|product description|about this item)\b', re.I), 2.0),
+]
+BOILERPLATE = re.compile(
+    r'\b(?:add to cart|buy now|sign in|log ?in|cookies?|privacy|return policy|delivery|customer reviews?|'
+    r'rating|wishlist|sponsored|frequently bought|shipping|emi|offers?|coupon|seller)\b',
+    re.I,
+)
+NEIGHBOUR_SHARE = 0.5
+WORD = re.compile(r'\w{3,}')
+
+
+def split_segments(content: str, size: int = SEGMENT_CHARS) -> List[str]:
+    """Sentence-ish pieces merged up to about `size` characters (longer sentences are cut)."""
+    segments = []
+    current = ''
+    for sentence in SENTENCE_END.split(content):
+        while len(sentence) > size * 2:
+            # one huge run of text (lists without punctuation), cut at a space
+            cut = sentence.rfind(' ', 0, size) if ' ' in sentence[:size] else size
+            segments.append((current + ' ' + sentence[:cut]).strip())
+            current, sentence = '', sentence[cut:].strip()
+        if current and len(current) + len(sentence) > size:
+            segments.append(current)
+            current = ''
+        current = (current + ' ' + sentence).strip()
+    if current:
+        segments.append(current)
+    return segments
+
+
+def score_segments(segments: List[str], title: str = None) -> List[float]:
+    title_words = {word.casefold() for word in WORD.findall(title or '')}
+    scores = []
+    for position, segment in enumerate(segments):
+        score = sum(weight for pattern, weight in KEYWORDS if pattern.search(segment))
+        words = {word.casefold() for word in WORD.findall(segment)}
+        score += 1.5 * len(title_words & words)
+        score -= 2.0 * len(BOILERPLATE.findall(segment))
+        # the top of the page usually describes the product
+        if position < 3:
+            score += 1.0
+        scores.append(score)
+
+    # an ingredients heading is often its own segment with the list right after it
+    boosted = list(scores)
+    for i, score in enumerate(scores):
+        if score > 0:
+            for j in (i - 1, i + 1):
+                if 0 <= j < len(scores):
+                    boosted[j] += NEIGHBOUR_SHARE * score
+    return boosted
+
+
+def content_budget(context: int, prompt_tokens: int, completion_tokens: int) -> int:
+    room = context - prompt_tokens - completion_tokens - OVERHEAD_TOKENS
+    return max(min(CONTENT_TOKENS, room), 0)
+
+
+def pack(segments: List[str], scores: List[float], budget: int, skip: set = frozenset()) -> Tuple[str, set]:
+    """Best segments that fit the budget, joined in page order. Returns (text, indexes used)."""
+    separator_tokens = estimate_tokens(SEPARATOR)
+    chosen = set()
+    used = 0
+    for i in sorted(range(len(segments)), key=lambda i: (-scores[i], i)):
+        if i in skip:
+            continue
+        tokens = estimate_tokens(segments[i]) + separator_tokens
+        if used + tokens > budget:
+            continue
+        chosen.add(i)
+        used += tokens
+
+    parts = []
+    previous = None
+    for i in sorted(chosen):
+        if previous is not None:
+            # mark the gaps so the model doesn't read two far apart pieces as one sentence
+            parts.append(' ' if i == previous + 1 else SEPARATOR)
+        parts.append(segments[i])
+        previous = i
+    return ''.join(parts), chosen
+
+
+def select_content(content: str, title: str, budget: int) -> str:
+    if estimate_tokens(content) <= budget:
+        return content
+    segments = split_segments(content)
+    text, _ = pack(segments, score_segments(segments, title), budget)
+    return text
+
+
+def select_chunks(content: str, title: str, budget: int, chunks: int = MAP_CHUNKS) -> List[str]:
+    """Up to `chunks` budgets of the most relevant content, best first (for map-reduce)."""
+    if estimate_tokens(content) <= budget:
+        return [content]
+    segments = split_segments(content)
+    scores = score_segments(segments, title)
+    selected = []
+    used = set()
+    for _ in range(chunks):
+        text, chosen = pack(segments, scores, budget, skip=used)
+        # nothing relevant left, don't pay for a call on boilerplate
+        if not chosen or max(scores[i] for i in chosen) <= 0:
+            break
+        selected.append(text)
+        used |= chosen
+    return selected or [select_content(content, title, budget)]
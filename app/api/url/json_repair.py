@@ -0,0 +1,132 @@
+# Local parsing of the AI's product JSON, so a slightly broken answer doesn't cost a second LLM call.
+#
+# Tiers (counted in json_parse_tier_total):
+# 1. "direct": the text (minus code fences / chatter) is valid JSON
+# 2. "repaired": fixed locally (python literals, single quotes, trailing commas, smart quotes)
+# 3. "llm": local repair failed, parse_with_ai (parsePrompt.txt) fixed it
+# 4. "failed": nothing worked, the raw response is returned
+#
+# Whatever parses is validated against the product_info schema below. Near misses are coerced
+# instead of failing (and costing the repair call): a null title, ingredients as one string.
+
+import ast
+import json
+import re
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError, validator
+
+from ..metrics import counter
+
+PARSE_TIERS = counter("json_parse_tier_total", "Which stage turned the AI output into product JSON")
+
+FENCE = re.compile(r'```(?:json|JSON|python)?\s*(.*?)```', re.DOTALL)
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+# a quoted string (left alone) or a bare JSON literal
+JSON_LITERAL = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|\b(true|false|null)\b')
+PYTHON_LITERALS = {'true': 'True', 'false': 'False', 'null': 'None'}
+
+
+# Schema of the "product_info" object (see the frontend notes in url_logic.py)
+class ProductInfo(BaseModel):
+    title: Optional[str] = None
+    ingredients: Optional[List[str]] = None
+    ai_generated: bool = False
+
+    @validator('ingredients', pre=True)
+    def split_ingredients(cls, value):
+        # "oats, dates, salt" instead of a list
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(',') if item.strip()] or None
+        return value
+
+
+class ProductResult(BaseModel):
+    product_info: ProductInfo
+
+
+def strip_fences(text: str) -> str:
+    match = FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def first_json_object(text: str) -> Optional[str]:
+    # First balanced {...}, braces inside strings don't count
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char in ('"', "'"):
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _loads_repaired(candidate: str) -> Optional[Dict]:
+    candidate = TRAILING_COMMA.sub(r'\1', candidate.translate(SMART_QUOTES))
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    # python style dicts: single quotes, True / False / None (literal_eval never runs code)
+    try:
+        value = ast.literal_eval(JSON_LITERAL.sub(lambda m: m.group(1) or PYTHON_LITERALS[m.group(2)], candidate))
+        return value if isinstance(value, dict) else None
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _validate(data) -> Optional[Dict]:
+    if not isinstance(data, dict):
+        return None
+    # the model sometimes drops the wrapper and returns the product fields directly
+    if 'product_info' not in data and 'title' in data:
+        data = {'product_info': data}
+    try:
+        return ProductResult(**data).dict()
+    except (ValidationError, TypeError):
+        return None
+
+
+def parse_product_json(text: str, count: bool = True) -> Optional[Dict]:
+    """{"product_info": {...}} parsed and validated locally, or None if it needs the AI.
+
+    count=False for the answer of the repair prompt, its caller counts it as "llm".
+    """
+    if not text:
+        return None
+    candidate = first_json_object(strip_fences(text))
+    if candidate is None:
+        return None
+
+    try:
+        data = _validate(json.loads(candidate))
+        if data is not None:
+            if count:
+                PARSE_TIERS.inc(tier="direct")
+            return data
+    except ValueError:
+        pass
+
+    data = _validate(_loads_repaired(candidate))
+    if data is not None and count:
+        PARSE_TIERS.inc(tier="repaired")
+    return data
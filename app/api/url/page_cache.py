@@ -0,0 +1,129 @@
+"""
+Cache for /extract-url, keyed by a normalized product URL.
+
+The same product gets shared with dozens of different tracking params, so before
+looking anything up we normalize the URL:
+- https:// when the scheme is missing (a pasted www.amazon.in/dp/...)
+- lowercase host, drop the fragment and the click ids (utm_*, gclid, fbclid, msclkid)
+- Amazon: any /dp/<ASIN> or /gp/product/<ASIN> URL becomes https://www.amazon.<tld>/dp/<ASIN>,
+  other Amazon URLs lose Amazon's own tracking params (ref, tag, th, psc, ...)
+- Flipkart: only the pid param is kept (https://www.flipkart.com/<slug>/p/<itm>?pid=<PID>),
+  other Flipkart URLs lose Flipkart's tracking params (otracker, lid, fm, ...)
+
+Shop specific params stay on other sites, where ?store= or ?th=1 can be a different
+page. Short links (amzn.in/d/...) are kept as they are, they aren't resolved here.
+
+For each URL we keep the cleaned page text (plus ETag / Last-Modified when it came
+from the static path) and the final product_info.
+- fresher than URL_CACHE_TTL (default 1h): served directly
+- older, but within URL_CACHE_STALE (default 24h more): served directly while a
+  background refresh runs (stale-while-revalidate)
+- older than that: extracted again before answering
+
+URL_CACHE_DB (optional) shares the cache between workers through SQLite.
+"""
+
+import os
+import re
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from ..cache import MISSING, ResultCache
+
+FRESH_TTL = float(os.getenv("URL_CACHE_TTL", "3600"))
+STALE_TTL = float(os.getenv("URL_CACHE_STALE", str(24 * 3600)))
+
+# tracking on every site
+TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid'}
+TRACKING_PREFIXES = ('utm_',)
+# only tracking on the shop that sets them
+SHOP_TRACKING_PARAMS = {
+    'amazon': {
+        'ref', 'ref_', 'tag', 'psc', 'th', 'smid', 'sr', 'qid', 'keywords', 'crid', 'sprefix',
+        'dib', 'dib_tag', 'content-id', '_encoding', 'spla', 'store',
+    },
+    'flipkart': {
+        'otracker', 'otracker1', 'lid', 'marketplace', 'srno', 'iid', 'ssid', 'fm', 'ppt', 'ppn',
+        'spotlighttagid', 'affid', 'affextparam1', 'affextparam2',
+    },
+}
+SHOP_TRACKING_PREFIXES = {'amazon': ('pf_rd_', 'pd_rd_'), 'flipkart': ()}
+
+# the Amazon storefronts, amazon.<anything else> is just another site
+AMAZON_HOST = re.compile(
+    r'^(?:www\.|m\.)?amazon\.(com|in|co\.uk|de|fr|it|es|nl|se|pl|com\.be|ca|com\.mx|com\.br|'
+    r'com\.au|co\.jp|cn|sg|ae|sa|eg|com\.tr)$'
+)
+AMAZON_ASIN = re.compile(r'/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})(?:[/?]|$)', re.IGNORECASE)
+HAS_SCHEME = re.compile(r'^[a-z][a-z0-9+.-]*://', re.IGNORECASE)
+
+
+def shop_of(host: str) -> Optional[str]:
+    if AMAZON_HOST.match(host):
+        return 'amazon'
+    if host == 'flipkart.com' or host.endswith('.flipkart.com'):
+        return 'flipkart'
+    return None
+
+
+def _is_tracking(param: str, shop: Optional[str]) -> bool:
+    param = param.lower()
+    if param in TRACKING_PARAMS or param.startswith(TRACKING_PREFIXES):
+        return True
+    return shop is not None and (param in SHOP_TRACKING_PARAMS[shop] or param.startswith(SHOP_TRACKING_PREFIXES[shop]))
+
+
+def normalize_url(url: str) -> str:
+    url = url.strip()
+    # "www.amazon.in/dp/..." pasted without a scheme would parse as a path
+    if not HAS_SCHEME.match(url):
+        url = 'https://' + url.lstrip('/')
+    parsed = urlparse(url)
+    scheme = (parsed.scheme or 'https').lower()
+    host = (parsed.hostname or '').lower()
+    path = parsed.path or '/'
+
+    shop = shop_of(host)
+
+    # amazon.in, amazon.com ... -> canonical /dp/<ASIN>
+    if shop == 'amazon':
+        match = AMAZON_ASIN.search(path)
+        if match:
+            tld = AMAZON_HOST.match(host).group(1)
+            return f"https://www.amazon.{tld}/dp/{match.group(1).upper()}"
+
+    query = parse_qsl(parsed.query, keep_blank_values=False)
+
+    # flipkart pages are identified by pid, everything else in the query is tracking
+    if shop == 'flipkart':
+        pid = dict(query).get('pid')
+        if pid:
+            return urlunparse(('https', 'www.flipkart.com', path, '', urlencode({'pid': pid}), ''))
+
+    netloc = host if not parsed.port else f"{host}:{parsed.port}"
+    query = sorted((k, v) for k, v in query if not _is_tracking(k, shop))
+    return urlunparse((scheme, netloc, path, '', urlencode(query), ''))
+
+
+class PageCache:
+    def __init__(self):
+        self.store = ResultCache(
+            "extract-url",
+            db_path=os.getenv("URL_CACHE_DB") or None,
+            ttl=FRESH_TTL + STALE_TTL,
+            max_entries=int(os.getenv("URL_CACHE_MAX_ENTRIES", "1024")),
+        )
+
+    async def get(self, url: str) -> Optional[Dict]:
+        """Cached {"page", "result", "fetched_at"} for a normalized URL, with a "fresh" flag."""
+        entry = await self.store.get(url)
+        if entry is MISSING:
+            return None
+        return {**entry, "fresh": time.time() - entry["fetched_at"] < FRESH_TTL}
+
+    async def set(self, url: str, page: Dict, result: Optional[Dict]):
+        await self.store.set(url, {"page": page, "result": result, "fetched_at": time.time()})
+
+
+page_cache = PageCache()
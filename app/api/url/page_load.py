@@ -0,0 +1,124 @@
+"""
+Page loading helpers for the Playwright path of /extract-url.
+
+1. Request blocking (block_heavy_resources):
+   We only read the text of the page, so images, media, fonts, stylesheets and
+   ad/analytics scripts are aborted before they are downloaded.
+   Extra hosts can be added with URL_BLOCKED_HOSTS (comma separated).
+
+2. Waiting for "enough content" (wait_for_content):
+   Instead of always waiting for the full "load" event (which can take up to 60s on
+   Amazon / Flipkart), URL_WAIT_STRATEGY picks how long we wait:
+   - "content" (default): stop as soon as a product title / ingredients section shows
+     up, or when the page text stops growing
+   - "load": the old behaviour, wait for the load event
+   - "domcontentloaded": don't wait at all after navigation
+   URL_CONTENT_WAIT_MS caps the "content" wait (default 15000). A client side redirect
+   destroys the page's JS context mid poll, we just poll the new page until the deadline.
+"""
+
+import asyncio
+import os
+from urllib.parse import urlparse
+
+from playwright.async_api import Error as PlaywrightError, Page, Route
+
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+
+BLOCKED_HOSTS = {
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "amazon-adsystem.com",
+    "facebook.net",
+    "connect.facebook.net",
+    "scorecardresearch.com",
+    "hotjar.com",
+    "clarity.ms",
+    "criteo.com",
+    "taboola.com",
+    "outbrain.com",
+    "adnxs.com",
+}
+BLOCKED_HOSTS.update(h.strip() for h in os.getenv("URL_BLOCKED_HOSTS", "").split(",") if h.strip())
+
+# Selectors that mean the part we care about is already on the page
+CONTENT_SELECTORS = [
+    "#productTitle",          # amazon
+    "#ingredients_feature_div",
+    "#important-information",
+    "span.B_NuCI",            # flipkart (old layout)
+    "h1 span.VU-ZEz",         # flipkart
+    "h1",
+]
+CONTENT_KEYWORDS = ["ingredients", "contains", "nutrition"]
+
+WAIT_STRATEGY = os.getenv("URL_WAIT_STRATEGY", "content")
+CONTENT_WAIT_MS = int(os.getenv("URL_CONTENT_WAIT_MS", "15000"))
+POLL_INTERVAL = 0.25
+# number of polls with the same text length before we call the page stable
+STABLE_POLLS = 4
+
+
+def is_blocked_host(host: str) -> bool:
+    host = host.lower()
+    return any(host == blocked or host.endswith("." + blocked) for blocked in BLOCKED_HOSTS)
+
+
+async def block_heavy_resources(route: Route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or is_blocked_host(urlparse(request.url).hostname or ""):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def prepare_page(page: Page):
+    await page.route("**/*", block_heavy_resources)
+
+
+async def wait_for_content(page: Page, strategy: str = None):
+    strategy = strategy or WAIT_STRATEGY
+
+    if strategy == "load":
+        await page.wait_for_load_state("load", timeout=60000)
+        return
+    if strategy == "domcontentloaded":
+        return
+
+    # "content": poll until we see the product, or the text stops growing
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CONTENT_WAIT_MS / 1000
+    last_length = -1
+    stable = 0
+    while loop.time() < deadline:
+        try:
+            state = await page.evaluate('''([selectors, keywords]) => {
+                const text = document.body ? document.body.innerText : '';
+                const lower = text.toLowerCase();
+                const hasTitle = selectors.some(s => document.querySelector(s));
+                const hasKeyword = keywords.some(k => lower.includes(k));
+                return {length: text.length, found: hasTitle && hasKeyword};
+            }''', [CONTENT_SELECTORS, CONTENT_KEYWORDS])
+        except PlaywrightError:
+            # "Execution context was destroyed": the page navigated, keep waiting for the new one
+            if page.is_closed():
+                raise
+            stable, last_length = 0, -1
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+
+        if state["found"]:
+            return
+
+        if state["length"] == last_length and state["length"] > 0:
+            stable += 1
+            if stable >= STABLE_POLLS:
+                return
+        else:
+            stable = 0
+            last_length = state["length"]
+
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,240 @@
+"""
+Fast path for /extract-url: plain HTTP GET + streaming HTML-to-text.
+
+A lot of product pages render the title and ingredients on the server, so we
+don't need Chromium for them. We download the HTML (streamed, capped in size) and
+feed it chunk by chunk to an HTMLParser that drops the same elements as the
+JS cleanup in url_logic.py (scripts, styles, media, header/footer/nav, ads...).
+
+If the text we get is too short (JS rendered page, bot wall, ...) the caller falls
+back to the browser. The decision is remembered per domain (DomainTierCache) so a
+domain that needs JS skips the probe next time. A learned decision is not extended by
+later requests, it expires after URL_TIER_TTL and the domain is probed again. A domain
+learned as static moves to the browser after URL_TIER_MISSES static pages in a row that
+were too short or had no product in them.
+
+- URL_STATIC_MIN_CHARS: minimum text length to accept the static result (default 1500)
+- URL_STATIC_MAX_BYTES: stop reading the HTML after this many bytes (default 3MB)
+- URL_JS_DOMAINS / URL_STATIC_DOMAINS: comma separated domains forced to one tier
+- URL_TIER_TTL: seconds a learned per-domain decision is kept (default 6h)
+- URL_TIER_MISSES: failed static pages before a static domain goes to the browser (default 2)
+"""
+
+import codecs
+import os
+import re
+import time
+from html.parser import HTMLParser
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from .browser_pool import CONTEXT_OPTIONS
+
+MIN_TEXT_CHARS = int(os.getenv("URL_STATIC_MIN_CHARS", "1500"))
+MAX_HTML_BYTES = int(os.getenv("URL_STATIC_MAX_BYTES", str(3 * 1024 * 1024)))
+TIER_TTL = float(os.getenv("URL_TIER_TTL", str(6 * 3600)))
+TIER_MISSES = int(os.getenv("URL_TIER_MISSES", "2"))
+
+JS_DOMAINS = {d.strip() for d in os.getenv("URL_JS_DOMAINS", "").split(",") if d.strip()}
+STATIC_DOMAINS = {d.strip() for d in os.getenv("URL_STATIC_DOMAINS", "").split(",") if d.strip()}
+
+# Same removal rules as the page.evaluate script in url_logic.py
+REMOVED_TAGS = {
+    'script', 'style', 'svg', 'video', 'audio', 'iframe', 'canvas', 'noscript',
+    'header', 'footer', 'nav', 'button', 'select', 'template',
+}
+# void elements have no content, nothing to skip
+VOID_TAGS = {'img', 'input', 'br', 'hr', 'meta', 'link', 'source', 'wbr', 'area', 'base', 'col', 'embed', 'param', 'track'}
+REMOVED_ROLES = {'banner', 'navigation', 'complementary'}
+REMOVED_CLASSES = {'advertisement'}
+# block level tags, they separate words like innerText does
+BLOCK_TAGS = {'p', 'div', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'section', 'article',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'dd', 'dt'}
+
+
+class TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title_parts = []
+        self.in_title = False
+        # element being skipped and how deep we are inside it
+        self.skip_tag: Optional[str] = None
+        self.skip_depth = 0
+
+    def _is_removed(self, tag, attrs) -> bool:
+        if tag in REMOVED_TAGS:
+            return True
+        attrs = dict(attrs)
+        if attrs.get('role') in REMOVED_ROLES:
+            return True
+        classes = set((attrs.get('class') or '').split())
+        return bool(classes & REMOVED_CLASSES)
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_tag is not None:
+            if tag == self.skip_tag:
+                self.skip_depth += 1
+            return
+        if tag == 'title':
+            self.in_title = True
+            return
+        if tag in VOID_TAGS:
+            if tag == 'br':
+                self.parts.append(' ')
+            return
+        if self._is_removed(tag, attrs):
+            self.skip_tag = tag
+            self.skip_depth = 1
+            return
+        if tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if self.skip_tag is not None:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+                if self.skip_depth == 0:
+                    self.skip_tag = None
+            return
+        if tag == 'title':
+            self.in_title = False
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+        elif self.skip_tag is None:
+            self.parts.append(data)
+
+    @property
+    def text(self) -> str:
+        return re.sub(r'\s+', ' ', ''.join(self.parts)).strip()
+
+    @property
+    def title(self) -> str:
+        return re.sub(r'\s+', ' ', ''.join(self.title_parts)).strip()
+
+
+def domain_of(url: str) -> str:
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class DomainTierCache:
+    # Remembers, per domain, whether the static path was good enough last time
+    def __init__(self, ttl: float = TIER_TTL):
+        self.ttl = ttl
+        # domain -> (tier, expires, misses since the last good page)
+        self.entries: Dict[str, tuple] = {}
+
+    def get(self, domain: str) -> Optional[str]:
+        for forced, tier in ((JS_DOMAINS, 'browser'), (STATIC_DOMAINS, 'static')):
+            if any(domain == d or domain.endswith('.' + d) for d in forced):
+                return tier
+        entry = self.entries.get(domain)
+        if entry is None:
+            return None
+        tier, expires, _ = entry
+        if expires < time.monotonic():
+            del self.entries[domain]
+            return None
+        return tier
+
+    def set(self, domain: str, tier: str):
+        entry = self.entries.get(domain)
+        if entry is not None and entry[0] == tier and entry[1] >= time.monotonic():
+            # confirmed, but the decision still expires on time so the domain gets re-probed
+            self.entries[domain] = (tier, entry[1], 0)
+            return
+        self.entries[domain] = (tier, time.monotonic() + self.ttl, 0)
+
+    def miss(self, domain: str):
+        # a static domain gave a page that was too short or had no product in it
+        entry = self.entries.get(domain)
+        if entry is None or entry[0] != 'static':
+            return
+        tier, expires, misses = entry
+        if misses + 1 >= TIER_MISSES:
+            print(f"{domain}: static pages stopped working, using the browser")
+            self.entries[domain] = ('browser', time.monotonic() + self.ttl, 0)
+        else:
+            self.entries[domain] = (tier, expires, misses + 1)
+
+
+domain_tiers = DomainTierCache()
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(10.0),
+            headers={
+                'User-Agent': CONTEXT_OPTIONS['user_agent'],
+                'Accept': 'text/html,application/xhtml+xml',
+                'Accept-Language': 'en-IN,en;q=0.9',
+            },
+        )
+    return _http_client
+
+
+# Called from the app lifespan on shutdown
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def fetch_static(url: str, etag: str = None, last_modified: str = None) -> Optional[Dict]:
+    """Returns {"title", "content", "etag", "last_modified"} or None if the page needs the browser.
+
+    With etag / last_modified the request is conditional, and {"not_modified": True}
+    is returned when the server answers 304.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        async with get_http_client().stream('GET', url, headers=headers) as response:
+            if response.status_code == 304 and headers:
+                return {"not_modified": True}
+            if response.status_code != 200:
+                return None
+            if 'html' not in response.headers.get('content-type', ''):
+                return None
+
+            parser = TextExtractor()
+            # the limit is in bytes, so count them before decoding
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+            received = 0
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if received >= MAX_HTML_BYTES:
+                    break
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+
+            content = parser.text
+            if len(content) < MIN_TEXT_CHARS:
+                return None
+
+            return {
+                "title": parser.title,
+                "content": content,
+                "etag": response.headers.get('etag'),
+                "last_modified": response.headers.get('last-modified'),
+            }
+    except (httpx.HTTPError, UnicodeDecodeError, LookupError):
+        return None
@@ -3,39 +3,84 @@ FLOW LOGIC:
 
 1. URL Check (process_url_request):
    We check if we actually got a URL to work with. If not, we let the user know 
-   they need to provide one. If we have a URL, we pass it along to get its content.
+   they need to provide one. If we have a URL, we normalize it (tracking params,
+   Amazon ASIN / Flipkart pid) and answer from the page cache when we can (page_cache.py).
+   Stale entries are answered right away and refreshed in the background, using
+   ETag / Last-Modified when the page came from the static path.
+   Identical URLs requested at the same time share a single extraction (singleflight.py).
 
 2. Getting the Content (extract_url_content):
-   - Use a headless browser (browser without GUI) because:
+   - First try a plain HTTP GET (static_fetch.py). Many product pages render the title
+     and ingredients on the server, so we don't need a browser for them.
+     The response reports which one was used in "tier" ("static" or "browser")
+   - If the text is too short (or we learned the domain needs JS), use a headless browser (browser without GUI) because:
      a) Many modern websites use JavaScript to load content dynamically
      b) Simple HTTP requests can't execute JavaScript or render dynamic content
      c) Headless browser can fully render the page like a real browser
      d) It's more efficient as we don't need to display anything visually
      e) Works well with Vercel's serverless environment
+   - Browsers are kept warm in a pool (browser_pool.py), each request only gets a fresh context + page
    - Load the webpage while pretending to be a normal browser (so websites don't block us)
+   - Skip downloading images, fonts, styles and trackers, and stop waiting as soon as
+     the product content is on the page (page_load.py)
    - Grab the page title and all the text
    - Clean up the content by removing stuff we don't need (images, scripts, ads, etc.)
-   - Keep the content under 4000 characters (Groq has limits)
+   - Keep the most relevant parts of the text (ingredients, nutrition, the title...)
+     within the model's token budget instead of cutting at 4000 characters (content_select.py).
+     Very long pages can optionally be extracted in parallel chunks and merged (URL_MAP_REDUCE=1)
    - Send the cleaned content to our AI for analysis
 
 3. AI Processing (process_with_ai):
    Now we ask our AI to help:
    - Load our custom instructions (from urlPrompt.txt)
-   - Send everything to our AI (GROQ's Mixtral model)
+   - Send everything to our AI through the shared async client (llm.py). The model comes
+     from the router (model_router.py): llama-3.1-8b-instant for short pages, and
+     llama-3.3-70b-versatile for long ones or pages that never mention ingredients
    - Keep the AI focused (low temperature setting = more precise answers)[Hallucination means the AI will start thinking it's a human and stop following instructions]
    - Turn that into a JSON object
 
-4. Backup Plan (parseJson.py):
+4. Backup Plan (json_repair.py, then parseJson.py):
    If the AI's response is messy(not in proper JSON format):
-   - We have another AI take a look with stricter instructions
+   - First we repair it locally (code fences, quotes, trailing commas) and validate it
+     against the product_info schema. This covers most cases without another AI call
+   - Only if that fails, we have another AI take a look with stricter instructions
    - If that doesn't work either, we will just return the raw response
+
+Each step above is a timing span (tracing.py), "url.fetch_static", "browser.goto",
+"url.process_with_ai"... so /metrics shows which stage a slow request spent its time in.
 """
 
 from typing import Dict, Optional
-import os
-from groq import Groq
-from playwright.async_api import async_playwright
+import asyncio
+import re
+from .browser_pool import get_browser_pool
+from .page_load import prepare_page, wait_for_content
+from .static_fetch import fetch_static, domain_of, domain_tiers
+from .page_cache import normalize_url, page_cache
+from ..metrics import counter
+from ..tracing import span
+from ..admission import Overloaded
+from ..singleflight import SingleFlight
 from .parseJson import parse_with_ai
+from .json_repair import parse_product_json, PARSE_TIERS
+from ..llm import chat_completion
+from ..model_router import route, route_context
+from ..prompts import estimate_tokens, prompts
+from .content_select import MAP_REDUCE, content_budget, select_chunks, select_content
+
+TIER_REQUESTS = counter("url_extract_tier_total", "Which extractor served /extract-url")
+REVALIDATIONS = counter("url_revalidations_total", "Conditional requests made to refresh a cached page")
+SELECTIONS = counter("url_content_selection_total", "How the page text was fitted into the AI budget")
+REFRESHES = counter("url_background_refresh_total", "Background refreshes of stale cached pages by result (done, shed, failed)")
+
+URL_MODEL = "mixtral-8x7b-32768"
+URL_COMPLETION_TOKENS = 1024
+# a page that never says "ingredients" is harder to read, the router sends it to a larger model
+INGREDIENTS_MENTIONED = re.compile(r'\bingredients?\b', re.I)
+
+# concurrent requests for the same URL share one extraction
+url_flights = SingleFlight("extract-url")
+refresh_flights = SingleFlight("extract-url-refresh")
 
 async def process_url_request(request_data: Dict) -> Dict:
     url = request_data.get('url')
@@ -46,120 +91,248 @@ async def process_url_request(request_data: Dict) -> Dict:
             "content": "No URL provided in request"
         }
     
-    return await extract_url_content(url)
+    url = normalize_url(url)
+    return await url_flights.do(url, lambda: extract_with_cache(url))
+
+# Cached results first (see page_cache.py), stale ones are refreshed in the background
+async def extract_with_cache(url: str) -> Dict:
+    with span("url.cache_lookup") as lookup:
+        entry = await page_cache.get(url)
+        lookup.set(cache="MISS" if entry is None or entry["result"] is None
+                   else "HIT" if entry["fresh"] else "STALE")
+
+    if entry is not None and entry["result"] is not None:
+        if entry["fresh"]:
+            return {**entry["result"], "cache": "HIT"}
+        # stale: answer now, refresh for the next request
+        schedule_refresh(url, entry)
+        return {**entry["result"], "cache": "STALE"}
+
+    result = await extract_url_content(url, previous=entry)
+    return {**result, "cache": "MISS"}
+
+# keeps a reference to background refreshes so they are not garbage collected
+_refresh_tasks = set()
+
+def schedule_refresh(url: str, entry: Dict):
+    task = asyncio.ensure_future(refresh_flights.do(url, lambda: extract_url_content(url, previous=entry)))
+    _refresh_tasks.add(task)
+    task.add_done_callback(refresh_done)
+
+def refresh_done(task: asyncio.Task):
+    _refresh_tasks.discard(task)
+    if task.cancelled():
+        return
+    # shed under load: the stale entry is served until a later request refreshes it
+    error = task.exception()
+    REFRESHES.inc(result="done" if error is None else "shed" if isinstance(error, Overloaded) else "failed")
+
+def empty_extraction(result: Dict) -> bool:
+    # the AI answered, but found no ingredients on the page (AI errors don't count)
+    if result.get("status") == "not_parsed":
+        return True
+    info = result.get("product_info") or {}
+    return result.get("status") == "success" and (not info.get("ingredients") or bool(info.get("ai_generated")))
+
+# Fast path first, headless browser only when the page needs it
+async def fetch_page(url: str, previous: Optional[Dict] = None) -> Dict:
+    """Returns {"title", "content", "etag", "last_modified", "tier"}, raises if the browser fails."""
+    domain = domain_of(url)
+    page = None
+    tier = "static"
+
+    # we have a validator from last time, ask the site if anything changed
+    old_page = previous["page"] if previous else None
+    if old_page and (old_page.get("etag") or old_page.get("last_modified")):
+        with span("url.revalidate") as revalidate:
+            page = await fetch_static(url, etag=old_page.get("etag"), last_modified=old_page.get("last_modified"))
+            result = "failed" if page is None else "not_modified" if page.get("not_modified") else "modified"
+            revalidate.set(result=result)
+        REVALIDATIONS.inc(result=result)
+        if result == "not_modified":
+            return old_page
 
-# using playwright's headless feature
-async def extract_url_content(url: str) -> Dict[str, Optional[str]]:
+    # skip the probe for domains we already know need JS
+    learned = domain_tiers.get(domain)
+    if page is None and learned != "browser":
+        with span("url.fetch_static") as static:
+            page = await fetch_static(url)
+            static.set(usable=page is not None)
+
+    if page is None:
+        tier = "browser"
+        with span("url.browser"):
+            page = await fetch_with_browser(url)
+        if page["content"] and learned is None:
+            # the static probe was not enough, go straight to the browser next time
+            domain_tiers.set(domain, "browser")
+        elif page["content"] and learned == "static":
+            domain_tiers.miss(domain)
+    else:
+        domain_tiers.set(domain, "static")
+
+    TIER_REQUESTS.inc(tier=tier)
+    return {**page, "tier": tier}
+
+async def extract_url_content(url: str, previous: Optional[Dict] = None) -> Dict[str, Optional[str]]:
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=True,
-                args=[
-                    '--disable-gpu',
-                    '--disable-dev-shm-usage',
-                    '--disable-setuid-sandbox',
-                    '--no-sandbox',
-                ]
-            )
-            
-            # using custom headers to avoid being blocked by the website like amazon or flipkart 
-            context = await browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
-            )
-            
-            page = await context.new_page()
-            
-            try:
-                # waiting for 60 secs to load the page
-                await page.goto(url, timeout=60000, wait_until="domcontentloaded")
-                await page.wait_for_load_state("load", timeout=60000)
-                
-                # Get title/Claim
-                title = await page.title()
-                
-                # Get all text content from the page
-                page_content = await page.evaluate('''() => {
-                    // Function to remove unwanted elements
-                    function removeElements(selectors) {
-                        selectors.forEach(selector => {
-                            document.querySelectorAll(selector).forEach(el => el.remove());
-                        });
-                    }
-                    
-                    // Remove all non-text elements
-                    removeElements([
-                        'script',
-                        'style',
-                        'img',
-                        'svg',
-                        'video',
-                        'audio',
-                        'iframe',
-                        'canvas',
-                        'noscript',
-                        'header',
-                        'footer',
-                        'nav',
-                        '.advertisement',
-                        '[role="banner"]',
-                        '[role="navigation"]',
-                        '[role="complementary"]',
-                        'button',
-                        'select',
-                        'input'
-                    ]);
-                    
-                    // Get text content and clean it
-                    let text = document.body.innerText;
-                    
-                    // Remove extra whitespace and normalize
-                    text = text.replace(/\\s+/g, ' ').trim();
-                    
-                    return text;
-                }''')
-                
-                if page_content:
-                    # The GROQ's mixtral has a limit of 5000 tokens
-                    # Limit content to 4000 characters (keeping 1000 in reserve for prompt and overhead)
-                    if len(page_content) > 4000:
-                        page_content = page_content[:4000]
-                    return await process_with_ai(page_content, title)
-                
-                return {
-                    "status": "error",
-                    "content": "No content found on the page."
-                }
-                
-            except Exception as e:
-                return {
-                    "status": "error",
-                    "content": f"Error extracting content: {str(e)}"
-                }
-            finally:
-                # Closing the browser and context
-                await context.close()
-                await browser.close()
-                
+        try:
+            page = await fetch_page(url, previous)
+        except Overloaded:
+            # shed by admission control, the caller answers 503 (nothing is cached)
+            raise
+        except Exception as e:
+            return {
+                "status": "error",
+                "content": f"Error extracting content: {str(e)}"
+            }
+
+        page_content = page["content"]
+        if not page_content:
+            return {
+                "status": "error",
+                "content": "No content found on the page."
+            }
+
+        # same text as last time, the previous answer still holds
+        if previous and previous["result"] is not None and previous["page"]["content"] == page_content:
+            result = previous["result"]
+        else:
+            # Only the relevant part of the page, sized for the model (content_select.py)
+            budget = content_budget(route_context("extract-url", URL_MODEL), prompts.get("url").tokens, URL_COMPLETION_TOKENS)
+            if estimate_tokens(page_content) <= budget:
+                SELECTIONS.inc(mode="full")
+                result = await process_with_ai(page_content, page["title"])
+            elif MAP_REDUCE:
+                with span("url.map_reduce"):
+                    result = await map_reduce_with_ai(page_content, page["title"], budget)
+            else:
+                SELECTIONS.inc(mode="selected")
+                with span("url.select_content", chars=len(page_content)):
+                    selected = select_content(page_content, page["title"], budget)
+                result = await process_with_ai(selected, page["title"])
+            result["tier"] = page["tier"]
+            if page["tier"] == "static" and empty_extraction(result):
+                # enough text, but not the product (bot wall, consent page, JS rendered list...)
+                domain_tiers.miss(domain_of(url))
+
+        # the page text is worth keeping even if the AI step failed, only good answers are reused
+        await page_cache.set(url, page, result if result.get("status") == "success" else None)
+        return result
+
+    except Overloaded:
+        raise
     except Exception as e:
         return {
             "status": "error",
             "content": f"Error processing content: {str(e)}"
         }
 
-# load prompt
-def load_url_prompt():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    template_path = os.path.join(current_dir, 'urlPrompt.txt')
-    with open(template_path, 'r') as file:
-        return file.read()
+# using playwright's headless feature (browsers come from the warm pool, see browser_pool.py)
+async def fetch_with_browser(url: str) -> Dict[str, str]:
+    async with get_browser_pool().page() as page:
+        # block images, fonts, styles and trackers before they are downloaded
+        await prepare_page(page)
+
+        # waiting for 60 secs to load the page
+        with span("browser.goto"):
+            await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+        # then only as long as it takes for the product content to show up
+        with span("browser.wait_content"):
+            await wait_for_content(page)
+
+        # Get title/Claim
+        title = await page.title()
+
+        # Get all text content from the page
+        with span("browser.scrape"):
+            page_content = await page.evaluate(SCRAPE_SCRIPT)
+
+    # The page is handed back to the pool before the (slow) AI call
+    return {"title": title, "content": page_content}
+
+SCRAPE_SCRIPT = '''() => {
+            // Function to remove unwanted elements
+            function removeElements(selectors) {
+                selectors.forEach(selector => {
+                    document.querySelectorAll(selector).forEach(el => el.remove());
+                });
+            }
+            
+            // Remove all non-text elements
+            removeElements([
+                'script',
+                'style',
+                'img',
+                'svg',
+                'video',
+                'audio',
+                'iframe',
+                'canvas',
+                'noscript',
+                'header',
+                'footer',
+                'nav',
+                '.advertisement',
+                '[role="banner"]',
+                '[role="navigation"]',
+                '[role="complementary"]',
+                'button',
+                'select',
+                'input'
+            ]);
+            
+            // Get text content and clean it
+            let text = document.body.innerText;
+            
+            // Remove extra whitespace and normalize
+            text = text.replace(/\\s+/g, ' ').trim();
+            
+            return text;
+        }'''
+
+# Long pages: the best chunks are extracted in parallel, then merged
+async def map_reduce_with_ai(content: str, title: str, budget: int) -> Dict:
+    chunks = select_chunks(content, title, budget)
+    if len(chunks) == 1:
+        SELECTIONS.inc(mode="selected")
+        return await process_with_ai(chunks[0], title)
+
+    SELECTIONS.inc(mode="map_reduce")
+    results = await asyncio.gather(*(process_with_ai(chunk, title) for chunk in chunks))
+    found = [r for r in results if r.get("status") == "success"]
+    if not found:
+        return results[0]
+
+    # ingredients read from the page beat guessed ones, then the longer list, then the more relevant chunk
+    def rank(item):
+        index, result = item
+        info = result["product_info"]
+        return (not info.get("ai_generated"), len(info.get("ingredients") or []), -index)
+
+    best = max(enumerate(found), key=rank)[1]
+    # the title from the most relevant chunk that has one
+    title = next((r["product_info"]["title"] for r in found if r["product_info"].get("title")), None)
+    return {**best, "product_info": {**best["product_info"], "title": title}}
 
 
 async def process_with_ai(content: str, title: str = None) -> Dict:
+    with span("url.process_with_ai", chars=len(content)) as stage:
+        result = await _process_with_ai(content, title)
+        if result["status"] == "success" and not result["product_info"].get("title") and title:
+            # the model gave no title, the page has one
+            result["product_info"]["title"] = title
+        stage.set(status=result["status"])
+        if result["status"] == "error":
+            # errors come back as a result, not an exception
+            stage.outcome = "error"
+            stage.set(error=result["content"][:300])
+        return result
+
+async def _process_with_ai(content: str, title: str = None) -> Dict:
     # making request to groq
     try:
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        prompt = load_url_prompt()
+        prompt = prompts.get("url")
         
         # Preparing content for the ai
         full_content = f"""
@@ -172,42 +345,47 @@ async def process_with_ai(content: str, title: str = None) -> Dict:
         messages = [
             {
                 "role": "user",
-                "content": prompt + "\n" + full_content
+                "content": prompt.text + "\n" + full_content
             }
         ]
         
-        completion = client.chat.completions.create(
-            model="mixtral-8x7b-32768",
+        completion = await chat_completion(**route("extract-url", prompt, dict(
+            model=URL_MODEL,
             messages=messages,
             temperature=0.3, # we are using low temp as doesn't need to think too much and to avoid hallucinations
-            max_completion_tokens=1024,
+            max_completion_tokens=URL_COMPLETION_TOKENS,
             top_p=1,
             stream=False,
             stop=None
-        )
+        ), escalate=not INGREDIENTS_MENTIONED.search(content)))
         
         result = completion.choices[0].message.content
         
-        # Try to parse the response first
-        try:
-            parsed_result = eval(result)
+        # Try to parse the response locally first (fences, quotes, trailing commas...)
+        with span("url.parse_local"):
+            parsed_result = parse_product_json(result)
+        if parsed_result is not None:
             return {
                 "status": "success",
                 **parsed_result
             }
-        except:
-            # If failed to parse, try to parse with AI
-            ai_parsed = await parse_with_ai(result)
-            if ai_parsed["status"] == "success":
-                return ai_parsed
-            
-            # If AI parsing also fails, return raw response
-            return {
-                "status": "not_parsed",
-                "raw_response": result,
-                "message": "Could not parse AI response, returning raw output"
-            }
+
+        # If failed to parse, try to parse with AI
+        ai_parsed = await parse_with_ai(result)
+        if ai_parsed["status"] == "success":
+            PARSE_TIERS.inc(tier="llm")
+            return ai_parsed
+        
+        # If AI parsing also fails, return raw response
+        PARSE_TIERS.inc(tier="failed")
+        return {
+            "status": "not_parsed",
+            "raw_response": result,
+            "message": "Could not parse AI response, returning raw output"
+        }
         
+    except Overloaded:
+        raise
     except Exception as e:
         return {
             "status": "error",
@@ -229,7 +407,9 @@ if the status is:
            "title": "Product Name",
            "ingredients": ["ing1", "ing2"],
            "ai_generated": true|false
-       }
+       },
+       "tier": "static"|"browser",
+       "cache": "HIT"|"STALE"|"MISS"
    }
    - if ai_generated is true, it means the ingredients are generated by the AI and not present in the original product page
    - if ai_generated is false, it means the ingredients are present in the original product page
@@ -1,30 +1,80 @@
-import os
-import sys
-from fastapi import FastAPI
-# Module for CORS
-from fastapi.middleware.cors import CORSMiddleware
-# Routes are declared in this Directory
-from app.api.routes import app_router
-from dotenv import load_dotenv
-
-# Check if running in dev container or Vercel only
-if not (os.getenv('IS_DEVCONTAINER') or os.getenv('VERCEL')):
-    print("\nThis application can only run inside a dev container or on Vercel\n")
-    # Forcefully exit the app
-    sys.exit(1)
-
-app = FastAPI(title="VeriTrust Backend")
-
-# To enable cors
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # TODO: replace with frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"]
-)
-
-# Include the router
-app.include_router(app_router)
-
-load_dotenv()  # This loads the environment variables from .env
\ No newline at end of file
+import os
+import sys
+from dotenv import load_dotenv
+
+# .env first: the app modules read their settings when they are imported
+load_dotenv()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+# Module for CORS
+from fastapi.middleware.cors import CORSMiddleware
+# Routes are declared in this Directory
+from app.api.routes import app_router
+# Shared LLM client
+from app.api.llm import init_llm_client, close_llm_client
+# Warm browser pool for /extract-url
+from app.api.url.browser_pool import init_browser_pool, close_browser_pool
+from app.api.url.static_fetch import close_http_client
+# Explore dataset kept in memory
+from app.api.explore import explore_store
+# Async jobs (/extract-url/jobs)
+from app.api.jobs import job_queue
+# Thread / process pools for blocking work, event loop stall detector
+from app.api.offload import init_offload, close_offload
+# Prompt templates, read once
+from app.api.prompts import init_prompts
+# Ingredient knowledge base for the claim checks
+from app.api.ingredients import init_ingredient_index
+# gzip / brotli and ETags for large bodies
+from app.api.compression import CompressionMiddleware
+# Timing spans, /metrics histograms and trace export
+from app.api.tracing import TracingMiddleware, trace_exporter
+
+# Check if running in dev container or Vercel only
+if not (os.getenv('IS_DEVCONTAINER') or os.getenv('VERCEL')):
+    print("\nThis application can only run inside a dev container or on Vercel\n")
+    # Forcefully exit the app
+    sys.exit(1)
+
+# Long lived resources are created once on startup and closed on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_offload()
+    init_prompts()
+    await init_llm_client()
+    await init_browser_pool()
+    await explore_store.start()
+    await init_ingredient_index()
+    await job_queue.start()
+    await trace_exporter.start()
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await explore_store.stop()
+        await close_offload()
+        await close_browser_pool()
+        await close_http_client()
+        await close_llm_client()
+        await trace_exporter.stop()
+
+app = FastAPI(title="VeriTrust Backend", lifespan=lifespan)
+
+# Compress large bodies, answer If-None-Match with 304
+app.add_middleware(CompressionMiddleware)
+
+# To enable cors
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"], # TODO: replace with frontend URL
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"]
+)
+
+# Added last so it is the outermost: the request span covers everything above
+app.add_middleware(TracingMiddleware)
+
+# Include the router
+app.include_router(app_router)
@@ -0,0 +1,75 @@
+"""
+Runs the app for benchmarks, with an event loop lag probe.
+
+Same app as app.main, plus two routes for the driver (bench/run.py):
+- POST /__bench/reset: start (or restart) measuring
+- GET /__bench: loop lag since the reset (p50 / p99 / max ms) and this process's RSS
+
+The probe sleeps PROBE_INTERVAL and records how late it wakes up: anything blocking
+the loop (CPU work, sync IO) shows up as lag.
+
+    IS_DEVCONTAINER=1 GROQ_BASE_URL=http://127.0.0.1:9100 python -m bench.app_runner --port 9000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Optional
+
+import psutil
+import uvicorn
+
+from app.main import app
+
+PROBE_INTERVAL = 0.01
+
+lags: List[float] = []
+_probe: Optional[asyncio.Task] = None
+
+
+async def probe():
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(time.perf_counter() - started - PROBE_INTERVAL, 0.0))
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+@app.post("/__bench/reset", include_in_schema=False)
+async def bench_reset():
+    global _probe
+    lags.clear()
+    if _probe is None or _probe.done():
+        _probe = asyncio.ensure_future(probe())
+    return {"ok": True}
+
+
+@app.get("/__bench", include_in_schema=False)
+async def bench_stats():
+    return {
+        "loop_lag_ms": {
+            "p50": round(percentile(lags, 0.5) * 1000, 3),
+            "p99": round(percentile(lags, 0.99) * 1000, 3),
+            "max": round(max(lags, default=0.0) * 1000, 3),
+            "samples": len(lags),
+        },
+        "rss_mb": round(psutil.Process().memory_info().rss / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
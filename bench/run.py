@@ -0,0 +1,466 @@
+"""
+Offline benchmark / load test for every route.
+
+Starts the stubs (fake Groq + recorded product pages, bench/stubs.py) and the app
+(bench/app_runner.py) as subprocesses, then drives each route with --concurrency
+clients for --duration seconds (after --warmup seconds that are not counted) and
+reports per route:
+- throughput (requests/s), errors (HTTP >= 400, exceptions, or a 200 with an error body)
+- latency p50 / p95 / p99 / max, and time to first byte (streams)
+- RSS of the app and its children (Chromium) while the route runs
+- event loop lag of the app while the route runs
+
+Results are saved as JSON (bench/results/<time>-<commit>.json by default). With
+--compare OLD.json, routes whose p95 / throughput / error rate got worse by more than
+--threshold are listed and the exit code is 1, so it can gate a change.
+
+    python -m bench.run                                 # every route, 16 clients, 10 s each
+    python -m bench.run --routes manual-check,extract-url --concurrency 64 --duration 30
+    python -m bench.run --latency-ms 800 --rate-limit-rate 0.05 --compare bench/results/base.json
+    python -m bench.run --app-env LLM_CACHE_SAMPLED=1 --app-env ADMISSION_QUEUE=16
+
+Request bodies are unique by default (every LLM call is a cache miss). --variants N
+cycles through N different bodies per route instead, to measure the cached paths.
+Nothing leaves the machine: the app's GROQ_BASE_URL points at the stub, /extract-url
+fetches the stub's pages and the explore dataset is a generated local file.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import psutil
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+PAGES = ["granola-amazon", "biscuits-flipkart", "juice-d2c"]
+IMAGE_COUNT = 32
+JOB_POLL_SECONDS = 0.05
+
+CLAIMS = [
+    "High protein, no refined sugar, 100% natural",
+    "Boosts immunity, rich in vitamin C",
+    "Sugar free, suitable for diabetics",
+    "Gluten free, high fibre, no preservatives",
+    "Made with whole wheat, no maida",
+]
+INGREDIENTS = [
+    "Rolled oats, dates, whey protein concentrate, almonds, honey, dark chocolate (sugar, cocoa solids), salt",
+    "Whole wheat flour, refined wheat flour, palm oil, sugar, oats, invert sugar syrup, INS 503(ii), milk solids",
+    "Cucumber, spinach, green apple, celery, lemon, ginger",
+    "Maltitol, cocoa butter, milk solids, soy lecithin, sucralose, vanilla",
+    "Rice flour, corn starch, sunflower oil, salt, potassium sorbate, natural flavours",
+]
+HISTORY = [
+    ["Is this muesli healthy?", "It is high in protein and fibre but has some added sugar."],
+    ["How much sugar?", "About 14 g per 100 g, 3 g of it added."],
+    ["Is that a lot?", "It is moderate, below most breakfast cereals."],
+    ["What about the chocolate?", "The chunks add sugar and saturated fat."],
+    ["Any allergens?", "Milk, soy and almonds, may contain peanuts."],
+    ["Can kids eat it?", "Yes, in normal portions, it has no caffeine beyond a trace from cocoa."],
+    ["Is it vegan?", "No, it contains whey and honey."],
+    ["Cheaper alternatives?", "Plain rolled oats with fruit and nuts are cheaper and have no added sugar."],
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def summary_ms(values: List[float]) -> Dict:
+    return {
+        "p50": round(percentile(values, 0.50) * 1000, 2),
+        "p95": round(percentile(values, 0.95) * 1000, 2),
+        "p99": round(percentile(values, 0.99) * 1000, 2),
+        "max": round(max(values, default=0.0) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def make_images() -> List[bytes]:
+    # distinct label-like pictures (different pixels, so different cache keys)
+    images = []
+    rng = random.Random(7)
+    for i in range(IMAGE_COUNT):
+        image = Image.new("RGB", (1600, 1200), (rng.randint(150, 255), rng.randint(150, 255), rng.randint(150, 255)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randint(0, 1500), rng.randint(0, 1100)
+            draw.rectangle([x, y, x + rng.randint(40, 400), y + rng.randint(20, 200)],
+                           fill=(rng.randint(0, 120), rng.randint(0, 120), rng.randint(0, 120)))
+        draw.text((80, 80), f"INGREDIENTS {i}: oats, dates, whey, almonds", fill=(0, 0, 0))
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=90)
+        images.append(output.getvalue())
+    return images
+
+
+def make_explore_data(path: str, count: int = 5000):
+    rng = random.Random(3)
+    words = ["oats", "muesli", "juice", "biscuits", "protein", "bar", "chips", "cola", "ghee", "honey", "tea"]
+    verdicts = ["Accurate", "Partially accurate", "Misleading", "Inaccurate"]
+    data = [
+        {
+            "product_name": f"{rng.choice(words).title()} {rng.choice(words)} {i}",
+            "verdict": rng.choice(verdicts),
+            "trustability_score": round(rng.uniform(0, 10), 1),
+            "claims": rng.choice(CLAIMS),
+            "ingredients": rng.choice(INGREDIENTS),
+        }
+        for i in range(count)
+    ]
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+
+def health_profile(n: int) -> Dict:
+    return {
+        "age": 20 + n % 50, "height": 150 + n % 40, "weight": 50 + n % 50, "gender": "female" if n % 2 else "male",
+        "activity_level": ["sedentary", "light", "moderate", "active"][n % 4],
+        "medical_conditions": "", "medications": "", "diet": f"Vegetarian, sweets {n % 7} times a week",
+        "sleep": 5 + n % 4, "stress": 1 + n % 10, "exercise": "Walks 30 minutes",
+    }
+
+
+class Scenario:
+    def __init__(self, name: str, method: str, path: str, build: Callable[["Context", int], Dict],
+                 covers: List[str] = (), run: Optional[Callable] = None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.build = build  # (context, n) -> httpx request kwargs (url, json, params, files...)
+        self.covers = [f"{method} {path}", *covers]
+        self.run = run
+
+
+class Context:
+    def __init__(self, stubs_url: str, images: List[bytes]):
+        self.stubs_url = stubs_url
+        self.images = images
+
+
+def claims(n: int) -> Dict:
+    return {"claims": f"{CLAIMS[n % len(CLAIMS)]} (#{n})", "ingredients": INGREDIENTS[n % len(INGREDIENTS)]}
+
+
+def page_url(ctx: Context, n: int) -> str:
+    return f"{ctx.stubs_url}/pages/{PAGES[n % len(PAGES)]}?v={n}"
+
+
+async def run_job(client: httpx.AsyncClient, ctx: Context, n: int) -> httpx.Response:
+    """Submits an /extract-url job and polls it until it is finished."""
+    response = await client.post("/extract-url/jobs", json={"url": page_url(ctx, n)}, headers={"X-Client-Id": f"bench-{n % 8}"})
+    if response.status_code != 202:
+        return response
+    location = response.headers["location"]
+    while True:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        response = await client.get(location)
+        if response.status_code != 200 or response.json()["status"] in ("done", "failed"):
+            return response
+
+
+SCENARIOS = [
+    Scenario("root", "GET", "/", lambda ctx, n: {}),
+    Scenario("health", "GET", "/health", lambda ctx, n: {}),
+    Scenario("stats", "GET", "/stats", lambda ctx, n: {}),
+    Scenario("stats-admission", "GET", "/stats/admission", lambda ctx, n: {}),
+    Scenario("get-from-s3", "GET", "/get-from-s3", lambda ctx, n: {}),
+    Scenario("get-from-s3-page", "GET", "/get-from-s3",
+             lambda ctx, n: {"params": {"page": 1 + n % 20, "page_size": 50, "q": ["oats", "juice", "bar"][n % 3]}}),
+    Scenario("check-image", "POST", "/check-image",
+             lambda ctx, n: {"files": {"file": (f"label-{n}.jpg", ctx.images[n % len(ctx.images)], "image/jpeg")}}),
+    Scenario("extract-url", "POST", "/extract-url", lambda ctx, n: {"json": {"url": page_url(ctx, n)}}),
+    Scenario("extract-url-jobs", "POST", "/extract-url/jobs", None, covers=["GET /jobs/{job_id}"], run=run_job),
+    Scenario("manual-check", "POST", "/manual-check", lambda ctx, n: {"json": claims(n)}),
+    Scenario("manual-check-stream", "POST", "/manual-check", lambda ctx, n: {"json": claims(n), "params": {"stream": "true"}}),
+    Scenario("manual-check-batch", "POST", "/manual-check/batch", lambda ctx, n: {"json": [claims(n * 10 + i) for i in range(10)]}),
+    Scenario("check-raw", "POST", "/check-raw",
+             lambda ctx, n: {"params": {"raw_text": f"Claims: {CLAIMS[n % 5]} #{n}. Ingredients: {INGREDIENTS[n % 5]}"}}),
+    Scenario("check-raw-batch", "POST", "/check-raw/batch",
+             lambda ctx, n: {"json": [f"Claims: {CLAIMS[i % 5]} #{n}-{i}. Ingredients: {INGREDIENTS[i % 5]}" for i in range(10)]}),
+    Scenario("suggestions", "POST", "/suggestions", lambda ctx, n: {"json": claims(n)}),
+    Scenario("suggestions-batch", "POST", "/suggestions/batch", lambda ctx, n: {"json": [claims(n * 5 + i) for i in range(5)]}),
+    Scenario("check-health", "POST", "/check-health", lambda ctx, n: {"json": health_profile(n)}),
+    Scenario("check-health-metrics", "POST", "/check-health/metrics", lambda ctx, n: {"json": [health_profile(n + i) for i in range(20)]}),
+    Scenario("chat", "POST", "/chat",
+             lambda ctx, n: {"json": {"question": f"Would you buy it? (#{n})", "previous_convo": HISTORY[: n % len(HISTORY) + 1]}}),
+]
+
+
+def has_error_body(body: bytes) -> bool:
+    # the single endpoints report some failures inside a 200
+    return b'"extracted-text":"Error' in body or b'"status":"error"' in body or b"event: error" in body
+
+
+async def drive(client: httpx.AsyncClient, ctx: Context, scenario: Scenario, concurrency: int,
+                duration: float, warmup: float, variants: int, counter: List[int]) -> Dict:
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def one(n: int):
+        nonlocal errors
+        begin = time.perf_counter()
+        first = None
+        try:
+            if scenario.run is not None:
+                response = await scenario.run(client, ctx, n)
+                body = response.content
+            else:
+                kwargs = scenario.build(ctx, n)
+                chunks = []
+                async with client.stream(scenario.method, scenario.path, **kwargs) as response:
+                    async for chunk in response.aiter_raw():
+                        if first is None:
+                            first = time.perf_counter()
+                        chunks.append(chunk)
+                body = b"".join(chunks)
+            status = str(response.status_code)
+            failed = response.status_code >= 400 or has_error_body(body)
+        except httpx.HTTPError as e:
+            status, failed = type(e).__name__, True
+        end = time.perf_counter()
+        if begin < measure_from:
+            return
+        statuses[status] = statuses.get(status, 0) + 1
+        errors += failed
+        latencies.append(end - begin)
+        if first is not None:
+            ttfbs.append(first - begin)
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            counter[0] += 1
+            await one(counter[0] % variants if variants else counter[0])
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - measure_from
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "status": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": summary_ms(latencies),
+        "ttfb_ms": summary_ms(ttfbs),
+    }
+
+
+async def sample_rss(pid: Optional[int], samples: List[float], stop: asyncio.Event):
+    if pid is None:
+        return
+    process = psutil.Process(pid)
+    while not stop.is_set():
+        try:
+            total = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            samples.append(total / 2 ** 20)
+        except psutil.Error:
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def uncovered_routes(client: httpx.AsyncClient) -> List[str]:
+    schema = (await client.get("/openapi.json")).json()
+    routes = {f"{method.upper()} {path}" for path, methods in schema["paths"].items() for method in methods}
+    covered = {route for scenario in SCENARIOS for route in scenario.covers}
+    return sorted(routes - covered)
+
+
+async def benchmark(args, app_url: str, stubs_url: str, app_pid: Optional[int]) -> Dict:
+    ctx = Context(stubs_url, make_images())
+    selected = [s for s in SCENARIOS if args.routes == "all" or s.name in args.routes.split(",")]
+    limits = httpx.Limits(max_connections=args.concurrency + 8, max_keepalive_connections=args.concurrency + 8)
+    results = {}
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        missing = await uncovered_routes(client)
+        if missing:
+            print(f"No scenario for: {', '.join(missing)}")
+        counter = [0]
+        for scenario in selected:
+            # only there when the app runs under bench.app_runner
+            probing = (await client.post("/__bench/reset")).status_code == 200
+            rss: List[float] = []
+            stop = asyncio.Event()
+            sampler = asyncio.ensure_future(sample_rss(app_pid, rss, stop))
+            result = await drive(client, ctx, scenario, args.concurrency, args.duration, args.warmup,
+                                 args.variants, counter)
+            stop.set()
+            await sampler
+            probe = (await client.get("/__bench")).json() if probing else {"rss_mb": 0.0, "loop_lag_ms": {"p99": 0.0}}
+            result["rss_mb"] = {
+                "max": round(max(rss, default=probe["rss_mb"]), 1),
+                "mean": round(sum(rss) / len(rss), 1) if rss else probe["rss_mb"],
+            }
+            result["loop_lag_ms"] = probe["loop_lag_ms"]
+            results[scenario.name] = result
+            latency = result["latency_ms"]
+            print(f"{scenario.name:22} {result['throughput_rps']:8.1f} req/s  p50 {latency['p50']:8.1f}  "
+                  f"p95 {latency['p95']:8.1f}  p99 {latency['p99']:8.1f} ms  errors {result['errors']:4}  "
+                  f"rss {result['rss_mb']['max']:7.1f} MB  lag p99 {result['loop_lag_ms']['p99']:6.1f} ms")
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'route':22} {'req/s':>19} {'p95 ms':>21} {'error rate':>17}")
+    for name, result in new["routes"].items():
+        before = old["routes"].get(name)
+        if before is None:
+            continue
+        rps = (before["throughput_rps"], result["throughput_rps"])
+        p95 = (before["latency_ms"]["p95"], result["latency_ms"]["p95"])
+        err = (before["error_rate"], result["error_rate"])
+        print(f"{name:22} {rps[0]:8.1f} -> {rps[1]:8.1f} {p95[0]:9.1f} -> {p95[1]:9.1f} {err[0]:7.3f} -> {err[1]:7.3f}")
+        if rps[0] and rps[1] < rps[0] * (1 - threshold):
+            regressions.append(f"{name}: throughput {rps[0]} -> {rps[1]} req/s")
+        if p95[0] and p95[1] > p95[0] * (1 + threshold):
+            regressions.append(f"{name}: p95 {p95[0]} -> {p95[1]} ms")
+        if err[1] > err[0] + 0.01:
+            regressions.append(f"{name}: error rate {err[0]} -> {err[1]}")
+    return regressions
+
+
+def wait_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start in {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default="all", help="comma separated scenario names (default: all)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per route")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds per route before measuring")
+    parser.add_argument("--variants", type=int, default=0, help="distinct bodies per route (0 = all unique)")
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request")
+    parser.add_argument("--latency-ms", type=float, default=300, help="fake Groq time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=500, help="fake Groq generation speed")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of broken JSON answers")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429 answers")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="extra app settings")
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--stubs-port", type=int, default=9100)
+    parser.add_argument("--base-url", help="benchmark an app that is already running (run it with bench.app_runner)")
+    parser.add_argument("--output", help="results file (default bench/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression (default 0.15)")
+    args = parser.parse_args()
+
+    stubs_url = f"http://127.0.0.1:{args.stubs_port}"
+    app_url = args.base_url or f"http://127.0.0.1:{args.app_port}"
+    processes = []
+    workdir = tempfile.mkdtemp(prefix="veritrust-bench-")
+    try:
+        processes.append(subprocess.Popen([
+            sys.executable, "-m", "bench.stubs", "--port", str(args.stubs_port),
+            "--latency-ms", str(args.latency_ms), "--tokens-per-second", str(args.tokens_per_second),
+            "--malformed-rate", str(args.malformed_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+        ], cwd=ROOT))
+        wait_ready(f"{stubs_url}/pages", processes[-1])
+
+        app_pid = None
+        if not args.base_url:
+            explore_path = os.path.join(workdir, "explore.json")
+            make_explore_data(explore_path)
+            env = {
+                **os.environ,
+                "IS_DEVCONTAINER": "1",
+                "GROQ_API_KEY": "bench",
+                "GROQ_BASE_URL": stubs_url,
+                "BROWSER_POOL_SIZE": "0",
+                "EXPLORE_DATA_PATH": explore_path,
+                "JOBS_DB": os.path.join(workdir, "jobs.sqlite3"),
+                # the job clients are told apart by X-Client-Id
+                "JOBS_TRUST_CLIENT_ID": "1",
+            }
+            env.update(item.split("=", 1) for item in args.app_env)
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "bench.app_runner", "--port", str(args.app_port)], cwd=ROOT, env=env,
+            ))
+            app_pid = processes[-1].pid
+            wait_ready(f"{app_url}/health", processes[-1])
+
+        started = time.time()
+        routes = asyncio.run(benchmark(args, app_url, stubs_url, app_pid))
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            },
+            "routes": routes,
+        }
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['meta']['commit']}.json")
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
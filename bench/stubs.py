@@ -0,0 +1,251 @@
+"""
+Local stand-ins for the services the app calls, for benchmarks.
+
+- /openai/v1/chat/completions: fake Groq API (point GROQ_BASE_URL at this server).
+  Answers look like what each prompt asks for (product JSON, health JSON, batch
+  results, extracted text...), normal or streamed, with:
+  - --latency-ms: time to the first token (+-30% jitter)
+  - --tokens-per-second: generation speed after that
+  - --malformed-rate: share of JSON answers that come back broken (half of them only
+    need the local repair, the other half need the AI parse step)
+  - --rate-limit-rate: share of calls answered 429 with Retry-After
+  - --decommissioned: models answered 400 model_decommissioned, like Groq does for
+    retired models (exercises the fallbacks in app/api/resilience.py)
+- /pages/<name>: the recorded product pages in bench/pages (with ETags, query strings are
+  ignored so ?v=N gives distinct URLs for the app's page cache)
+
+    python -m bench.stubs --port 9100 --latency-ms 400
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+settings = {
+    "latency_ms": 300.0,
+    "tokens_per_second": 500.0,
+    "malformed_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "decommissioned": set(),
+}
+
+app = FastAPI()
+
+
+def prompt_text(messages) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+def has_image(messages) -> bool:
+    return any(
+        isinstance(m.get("content"), list) and any(p.get("type") == "image_url" for p in m["content"])
+        for m in messages
+    )
+
+
+VERDICT = {
+    "verdict": "Partially accurate",
+    "why": "The ingredients support the protein claim, the 'no refined sugar' claim is contradicted "
+           "by sugar in the chocolate chunks and cranberries.",
+    "detailed_analysis": {
+        "High protein": "Supported, whey and nuts give 17 g per 100 g.",
+        "No refined sugar": "Misleading, the chocolate and cranberries contain added sugar.",
+    },
+}
+
+SUGGESTION = {
+    "harmful_ingredients": [
+        {"ingredient": "Palm oil", "reason": "High in saturated fat", "alternative": "Cold pressed groundnut oil"},
+        {"ingredient": "Invert sugar syrup", "reason": "Added sugar", "alternative": "Dates"},
+    ],
+    "healthier_products": [
+        {"name": "Plain rolled oats", "why": "No added sugar or fat"},
+    ],
+}
+
+HEALTH = {
+    "general_assessment": "Overall health is fair. Weight and activity are reasonable, sleep could improve.",
+    "health_risks": [{"risk": "High sugar intake", "severity": "Medium", "description": "Frequent sweets in the diet"}],
+    "recommendations": [
+        {"category": "Diet", "suggestion": "Replace sweetened snacks with fruit and nuts", "importance": "Important"},
+        {"category": "Exercise", "suggestion": "Add two strength sessions a week", "importance": "Helpful"},
+    ],
+    "lifestyle_changes": [
+        {"area": "Sleep", "current_status": "6 hours", "target": "7-8 hours", "timeframe": "4 weeks"},
+    ],
+    "overall_status": "Fair",
+}
+
+
+def product_answer(text: str) -> dict:
+    match = re.search(r"Website Title:\s*(.+)", text)
+    title = match.group(1).strip() if match else "Unknown product"
+    ingredients = None
+    match = re.search(r"Ingredients?\s*:?\s*(.{20,600}?)(?:\.\s|Allergen|$)", text.split("Page Content:")[-1], re.I | re.S)
+    if match:
+        ingredients = [part.strip() for part in re.split(r",(?![^(]*\))", match.group(1)) if part.strip()][:20]
+    return {"status": "success", "product_info": {
+        "title": title, "ingredients": ingredients, "ai_generated": ingredients is None,
+    }}
+
+
+def answer_for(body: dict) -> tuple:
+    """(answer text, is JSON)"""
+    messages = body.get("messages", [])
+    text = prompt_text(messages)
+    if has_image(messages):
+        return "$ INGREDIENTS: Rolled oats, dates, whey protein, almonds, honey, salt. Net wt 700 g $", False
+    if "BATCH MODE" in text:
+        count = len(re.findall(r"^Request \d+:", text, re.M))
+        return json.dumps({"results": [VERDICT] * count}), True
+    if "product information extractor" in text or "specialized JSON parser" in text:
+        return json.dumps(product_answer(text)), True
+    if "health assessment" in text:
+        return json.dumps(HEALTH), True
+    if "recommendation system" in text:
+        return json.dumps(SUGGESTION), True
+    if "running summary" in text:
+        return "The user asked about muesli claims. The assistant said the protein claim holds and the sugar claim is misleading.", False
+    if "verification system" in text:
+        return json.dumps(VERDICT), True
+    return json.dumps({"answer": "Based on the ingredients, the claim is partially supported."}), True
+
+
+def break_json(answer: str) -> str:
+    if random.random() < 0.5:
+        # fences and a trailing comma, json_repair.py fixes this
+        return "Here is the JSON:\n```json\n" + answer[:-1] + ",}\n```"
+    # cut off, only the AI parse step can do anything with it
+    return answer[: len(answer) * 2 // 3]
+
+
+def completion_id() -> str:
+    return "chatcmpl-" + hashlib.sha1(os.urandom(8)).hexdigest()[:24]
+
+
+def pieces(answer: str):
+    # ~4 characters per token
+    return [answer[i:i + 4] for i in range(0, len(answer), 4)]
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if body.get("model") in settings["decommissioned"]:
+        return JSONResponse(
+            {"error": {"message": f"The model `{body['model']}` has been decommissioned and is no longer supported.",
+                       "type": "invalid_request_error", "code": "model_decommissioned"}},
+            status_code=400,
+        )
+    if random.random() < settings["rate_limit_rate"]:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (fake)", "type": "tokens", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after": "1"},
+        )
+
+    answer, is_json = answer_for(body)
+    if is_json and random.random() < settings["malformed_rate"]:
+        answer = break_json(answer)
+
+    model = body.get("model", "fake")
+    tokens = pieces(answer)
+    prompt_tokens = len(prompt_text(body.get("messages", []))) // 4
+    first_token = settings["latency_ms"] / 1000 * random.uniform(0.7, 1.3)
+    per_token = 1.0 / settings["tokens_per_second"]
+    created = int(time.time())
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+             "total_tokens": prompt_tokens + len(tokens)}
+
+    if not body.get("stream"):
+        await asyncio.sleep(first_token + per_token * len(tokens))
+        return {
+            "id": completion_id(), "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                         "finish_reason": "stop", "logprobs": None}],
+            "usage": usage,
+        }
+
+    async def events():
+        chunk_id = completion_id()
+        await asyncio.sleep(first_token)
+        for piece in tokens:
+            chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(per_token)
+        chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+_pages = {}
+
+
+def load_pages():
+    for name in sorted(os.listdir(PAGES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(PAGES_DIR, name), "rb") as file:
+                body = file.read()
+            _pages[name[:-5]] = (body, '"' + hashlib.sha256(body).hexdigest()[:16] + '"')
+
+
+@app.get("/pages")
+async def list_pages():
+    return sorted(_pages)
+
+
+@app.get("/pages/{name}")
+async def get_page(name: str, request: Request):
+    if name not in _pages:
+        return Response(status_code=404)
+    body, etag = _pages[name]
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="text/html; charset=utf-8", headers={"ETag": etag})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"])
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"])
+    parser.add_argument("--malformed-rate", type=float, default=settings["malformed_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=settings["rate_limit_rate"])
+    parser.add_argument("--decommissioned", default="", help="comma separated models answered 400")
+    args = parser.parse_args()
+    settings.update(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        malformed_rate=args.malformed_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        decommissioned={m.strip() for m in args.decommissioned.split(",") if m.strip()},
+    )
+    load_pages()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import asyncio
+import itertools
+
+import pytest
+
+from app.api import admission
+from app.api.admission import AdaptiveLimiter, Overloaded
+
+MIXED = [0.4, 4.0] * 200
+
+
+def busy_release(limiter: AdaptiveLimiter, latency, overloaded=False):
+    # one call ending while every slot is taken, the case where the limit may grow
+    limiter.in_flight = limiter.capacity
+    limiter.release(latency, overloaded)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_mixed_latencies_dont_shrink_a_shared_limit(clock):
+    # a 50/50 mix of small and large model calls, no errors
+    shared = AdaptiveLimiter("test-shared", 64, latency_signal=False)
+    for latency in MIXED:
+        clock[0] += latency
+        busy_release(shared, latency)
+    assert shared.limit == 64
+
+
+def test_slowdown_cuts_a_per_model_limit():
+    per_model = AdaptiveLimiter("test-model", 32)
+    for _ in range(admission.WARMUP_SAMPLES + 1):
+        busy_release(per_model, 0.4)
+    busy_release(per_model, 4.0)
+    assert per_model.limit == pytest.approx(32 * admission.LATENCY_BACKOFF)
+
+
+def test_overload_halves_the_limit_once_per_round_trip():
+    shared = AdaptiveLimiter("test-shared", 64, latency_signal=False)
+    for _ in range(5):
+        busy_release(shared, 0.5, overloaded=True)
+    assert shared.limit == 32
+
+
+def test_limit_grows_only_when_used():
+    limiter = AdaptiveLimiter("test-grow", 64, initial=10)
+    limiter.in_flight = 1
+    limiter.release(0.5, False)
+    assert limiter.limit == 10
+    busy_release(limiter, 0.5)
+    assert limiter.limit == pytest.approx(10.1)
+
+
+def test_slot_reports_timeouts_as_overload():
+    limiter = AdaptiveLimiter("test-timeout", 8, latency_signal=False)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            async with limiter.slot():
+                raise asyncio.TimeoutError()
+        with pytest.raises(ValueError):
+            async with limiter.slot():
+                raise ValueError("bad request")
+
+    asyncio.run(run())
+    assert (limiter.limit, limiter.in_flight) == (4, 0)
+
+
+def test_waiters_are_served_in_order():
+    limiter = AdaptiveLimiter("test-fifo", 1, latency_signal=False)
+    order = []
+
+    async def one(index):
+        async with limiter.slot():
+            order.append(index)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(one(i) for i in range(4)))
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3]
+    assert limiter.in_flight == 0 and not limiter.waiters
+
+
+def test_full_queue_and_long_waits_are_shed():
+    limiter = AdaptiveLimiter("test-shed", 1, wait=0.05, queue_size=1, latency_signal=False)
+    counter = itertools.count()
+
+    async def hold():
+        async with limiter.slot():
+            await asyncio.sleep(0.2)
+
+    async def wait_for_slot():
+        await asyncio.sleep(0)
+        async with limiter.slot():
+            next(counter)
+
+    async def run():
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(wait_for_slot())
+        await asyncio.sleep(0.01)
+        # the one waiting spot is taken
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.status_code == 503 and int(shed.value.headers["Retry-After"]) >= 1
+        # and that waiter gives up after ADMISSION_WAIT
+        with pytest.raises(Overloaded):
+            await waiter
+        await holder
+
+    asyncio.run(run())
+    assert next(counter) == 0
+    assert limiter.in_flight == 0 and not limiter.waiters
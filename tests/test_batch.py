@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.batch import BATCH_MAX_ITEMS, check_raw_batch, manual_check_batch, pack_key, suggestions_batch
+from app.api.cache import cache_key
+from app.api.model_router import route_version
+from app.api.endpoints import MANUAL_CHECK_MODEL
+
+
+def test_packed_answers_have_keys_of_their_own():
+    # a packed answer comes from another prompt, it must not be served to /manual-check
+    data = {"claims": "sugar free", "ingredients": "oats"}
+    single = cache_key("manual-check", route_version("manual-check", MANUAL_CHECK_MODEL), "v1", data)
+    assert pack_key("manual-check", "v1", data) != single
+    assert pack_key("manual-check", "v1", data) == pack_key("manual-check", "v1", dict(data))
+    assert pack_key("manual-check", "v1", data) != pack_key("check-raw", "v1", data)
+    assert pack_key("manual-check", "v1", data) != pack_key("manual-check", "v2", data)
+
+
+@pytest.mark.parametrize("endpoint", [manual_check_batch, check_raw_batch, suggestions_batch])
+def test_oversized_batches_are_rejected(endpoint):
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(endpoint(["x"] * (BATCH_MAX_ITEMS + 1)))
+    assert rejected.value.status_code == 413
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.api.url.browser_pool import BrowserPool, PooledBrowser
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.closed = False
+
+    def on(self, event, handler):
+        pass
+
+    def is_connected(self):
+        return not self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv("BROWSER_POOL_SIZE", "1")
+    monkeypatch.setenv("BROWSER_RECYCLE_RSS_MB", "1")
+    monkeypatch.delenv("BROWSER_MAX_BROWSERS", raising=False)
+    pool = BrowserPool()
+    pool.launched = []
+
+    async def start():
+        pass
+
+    async def launch():
+        pooled = PooledBrowser(FakeBrowser())
+        pool.launched.append(pooled)
+        return pooled
+
+    monkeypatch.setattr(pool, "start", start)
+    monkeypatch.setattr(pool, "_launch", launch)
+    # Chromium over its memory budget the whole time
+    monkeypatch.setattr(pool, "_chromium_rss", lambda: 2 * 1024 * 1024)
+    return pool
+
+
+def alive(pool):
+    return [b for b in pool.launched if b.browser.is_connected()]
+
+
+def test_memory_pressure_retires_one_browser_at_a_time(pool):
+    async def run():
+        held = [await pool._acquire_browser() for _ in range(20)]
+        assert len(alive(pool)) <= pool.max_browsers == 2
+        for pooled in held:
+            await pool._release_browser(pooled)
+
+    asyncio.run(run())
+    assert len(alive(pool)) <= 2
+
+
+def test_draining_browser_is_replaced_once_it_is_idle(pool):
+    async def run():
+        first = await pool._acquire_browser()
+        # over the memory budget: the next page goes to a fresh browser
+        second = await pool._acquire_browser()
+        assert second is not first and first.retiring
+        await pool._release_browser(first)
+        assert first.browser.closed
+        await pool._release_browser(second)
+        # the fresh one is retired next, now that nothing else is draining
+        third = await pool._acquire_browser()
+        assert third is not second and second.retiring
+        await pool._release_browser(third)
+
+    asyncio.run(run())
+    assert len(alive(pool)) == 1
+
+
+def test_pages_go_to_the_newest_browser_when_every_one_is_draining(pool):
+    pool.recycle_pages = 1
+
+    async def run():
+        held = [await pool._acquire_browser() for _ in range(5)]
+        # the oldest ones get no new pages, so they can drain
+        assert held[-1] is held[-2]
+        assert len(alive(pool)) == 2
+
+    asyncio.run(run())
@@ -0,0 +1,104 @@
+import asyncio
+
+from app.api import cache
+from app.api.cache import MISSING, ResultCache, TTLCache, cache_key, should_cache
+
+
+def counting(value="verdict", error=None):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if error is not None:
+            raise error
+        return value
+
+    return compute, calls
+
+
+def test_miss_then_hit():
+    results = ResultCache("test")
+    compute, calls = counting()
+
+    async def run():
+        first = await results.get_or_compute("key", compute, "manual-check")
+        second = await results.get_or_compute("key", compute, "manual-check")
+        return first, second
+
+    assert asyncio.run(run()) == (("verdict", "MISS"), ("verdict", "HIT"))
+    assert len(calls) == 1
+
+
+def test_concurrent_misses_compute_once():
+    results = ResultCache("test")
+    compute, calls = counting()
+
+    async def run():
+        return await asyncio.gather(*(results.get_or_compute("key", compute, "manual-check") for _ in range(5)))
+
+    assert asyncio.run(run()) == [("verdict", "MISS")] * 5
+    assert len(calls) == 1
+
+
+def test_errors_and_bypass_are_not_stored():
+    results = ResultCache("test")
+    failing, _ = counting(error=RuntimeError("groq down"))
+    compute, calls = counting()
+
+    async def run():
+        try:
+            await results.get_or_compute("key", failing, "manual-check")
+        except RuntimeError:
+            pass
+        assert await results.get("key") is MISSING
+        assert await results.get_or_compute("key", compute, "suggestions", enabled=False) == ("verdict", "BYPASS")
+        assert await results.get("key") is MISSING
+
+    asyncio.run(run())
+
+
+def test_sqlite_tier_is_shared(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    compute, calls = counting({"verdict": "misleading"})
+
+    async def run():
+        await ResultCache("test", db_path=path).get_or_compute("key", compute, "manual-check")
+        # another worker, empty memory tier
+        return await ResultCache("test", db_path=path).get_or_compute("key", compute, "manual-check")
+
+    assert asyncio.run(run()) == ({"verdict": "misleading"}, "HIT")
+    assert len(calls) == 1
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    entries = TTLCache(max_entries=2, ttl=10)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+    # "b" was the least recently used
+    assert (entries.get("a"), entries.get("b"), entries.get("c")) == (1, MISSING, 3)
+    now[0] += 11
+    assert entries.get("a") is MISSING
+
+
+def test_cache_key_depends_on_every_part():
+    base = cache_key("manual-check", "model", "v1", {"claims": "vegan"})
+    assert base == cache_key("manual-check", "model", "v1", {"claims": "  VEGAN "})
+    assert len({
+        base,
+        cache_key("check-raw", "model", "v1", {"claims": "vegan"}),
+        cache_key("manual-check", "other-model", "v1", {"claims": "vegan"}),
+        cache_key("manual-check", "model", "v2", {"claims": "vegan"}),
+        cache_key("manual-check", "model", "v1", {"claims": "vegetarian"}),
+    }) == 5
+
+
+def test_only_deterministic_calls_are_cached_by_default(monkeypatch):
+    monkeypatch.delenv("LLM_CACHE_SAMPLED", raising=False)
+    assert should_cache(0) and not should_cache(0.7)
+    monkeypatch.setenv("LLM_CACHE_SAMPLED", "1")
+    assert should_cache(0.7)
@@ -0,0 +1,57 @@
+import pytest
+
+from app.api.health_metrics import DEFAULT_ACTIVITY_FACTOR, activity_factor, merge_metrics
+
+
+@pytest.mark.parametrize("level, factor", [
+    ("Sedentary", 1.2),
+    ("inactive", 1.2),
+    ("not active", 1.2),
+    ("non-active", 1.2),
+    ("not very active", 1.375),
+    ("lightly active", 1.375),
+    ("very light exercise", 1.375),
+    ("moderately active", 1.55),
+    ("moderate", 1.55),
+    ("active", 1.725),
+    ("very active", 1.725),
+    ("highly active", 1.725),
+    ("extra active", 1.9),
+    ("extremely active", 1.9),
+    ("athlete", 1.9),
+    # whole words only
+    ("proactive", DEFAULT_ACTIVITY_FACTOR),
+    ("interactive gamer", DEFAULT_ACTIVITY_FACTOR),
+    ("", DEFAULT_ACTIVITY_FACTOR),
+    (None, DEFAULT_ACTIVITY_FACTOR),
+])
+def test_activity_factor(level, factor):
+    assert activity_factor(level) == factor
+
+
+METRICS = {
+    "bmi": {"value": 31.2, "category": "obese"},
+    "risk_flags": [{"risk": "Obesity", "reason": "BMI 31.2"}],
+    "bmr": 1700, "tdee": 2337, "activity_factor": 1.375, "sleep": "adequate", "stress": "moderate",
+}
+
+
+def test_merge_metrics_drops_the_risks_already_flagged():
+    narrative = {"general_assessment": "ok", "health_risks": [{"risk": "obesity"}, {"risk": "Low sleep"}]}
+    merged = merge_metrics(narrative, METRICS)
+    assert merged["health_risks"] == METRICS["risk_flags"] + [{"risk": "Low sleep"}]
+    assert merged["general_assessment"] == "ok"
+    assert narrative["health_risks"] == [{"risk": "obesity"}, {"risk": "Low sleep"}]
+
+
+@pytest.mark.parametrize("narrative, assessment", [
+    ("Eat more vegetables.", {"general_assessment": "Eat more vegetables."}),
+    (["Eat more vegetables."], {"general_assessment": ["Eat more vegetables."]}),
+    (None, {}),
+    ([], {}),
+])
+def test_merge_metrics_keeps_a_narrative_that_is_not_an_object(narrative, assessment):
+    merged = merge_metrics(narrative, METRICS)
+    assert {key: merged[key] for key in assessment} == assessment
+    assert merged["health_risks"] == METRICS["risk_flags"]
+    assert merged["metrics"]["tdee"] == 2337
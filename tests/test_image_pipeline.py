@@ -0,0 +1,49 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.api.cache import cache_key
+from app.api.image_pipeline import MAX_SIDE, preprocess
+
+
+def label(text: str, size=(800, 600), **save_options) -> bytes:
+    # black text on white, the case a perceptual hash can't tell apart
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).text((40, 40), text, fill="black")
+    output = io.BytesIO()
+    image.save(output, format="PNG", **save_options)
+    return output.getvalue()
+
+
+def test_different_labels_get_different_digests():
+    _, first = preprocess(label("INGREDIENTS: oats, whey, almonds"))
+    _, second = preprocess(label("INGREDIENTS: rice, soy, peanuts"))
+    assert first != second
+
+
+def test_same_picture_gets_the_same_digest_whatever_the_metadata():
+    from PIL import PngImagePlugin
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Software", "phone camera")
+    _, plain = preprocess(label("INGREDIENTS: oats"))
+    _, tagged = preprocess(label("INGREDIENTS: oats", pnginfo=info))
+    assert plain == tagged
+
+
+def test_large_images_are_downscaled():
+    jpeg, _ = preprocess(label("INGREDIENTS: oats", size=(4000, 3000)))
+    import base64
+    with Image.open(io.BytesIO(base64.b64decode(jpeg))) as image:
+        assert max(image.size) == MAX_SIDE
+        assert image.format == "JPEG"
+
+
+def test_not_an_image_is_rejected():
+    with pytest.raises(Exception):
+        preprocess(b"definitely not an image")
+
+
+def test_cache_key_ignores_case_and_spacing_of_text_inputs():
+    assert cache_key("manual-check", "m", "v", {"claims": "Sugar  Free"}) == cache_key("manual-check", "m", "v", {"claims": "sugar free"})
+    assert cache_key("manual-check", "m", "v", "x") != cache_key("check-raw", "m", "v", "x")
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from app.api.ingredients import get_ingredient_index, screen, split_ingredients
+
+
+@pytest.fixture(scope="module")
+def index():
+    return get_ingredient_index()
+
+
+def test_split_ingredients_includes_bracketed_items():
+    assert split_ingredients("Emulsifier (E322, soy), Sugar") == ["Emulsifier", "E322", "soy", "Sugar"]
+
+
+@pytest.mark.parametrize("text, name, how", [
+    ("Sugar", "Sugar", "exact"),
+    ("skimmed milk powder", "Milk", "exact"),
+    ("INS 621", "Monosodium glutamate", "e_number"),
+    ("E621", "Monosodium glutamate", "e_number"),
+    ("milk chocolate", "Milk", "phrase"),
+    ("monosodium glutamte", "Monosodium glutamate", "fuzzy"),
+])
+def test_match(index, text, name, how):
+    entry, found_how = index.match(text)
+    assert (entry["name"], found_how) == (name, how)
+
+
+@pytest.mark.parametrize("text", ["coconut milk", "cocoa butter", "sugar alcohol", "sugar free syrup", "milk thistle"])
+def test_other_things_named_like_an_ingredient_dont_match(index, text):
+    assert index.match(text) is None
+
+
+@pytest.mark.parametrize("claims, ingredients", [
+    ("dairy free", "coconut milk, sugar"),
+    ("sugar free", "sugar alcohol, oats"),
+    ("sugar free", "sugar free syrup, oats"),
+    ("no added sugar", "fruit sugar from dates, oats"),
+    ("vegan", "milk chocolate, oats"),
+])
+def test_guesses_never_decide_locally(claims, ingredients):
+    assert screen(claims, ingredients)["verdict"] is None
+
+
+def test_partial_match_goes_to_the_llm_as_a_doubt():
+    result = screen("no added sugar", "fruit sugar from dates, oats")
+    assert result["checks"][0]["contradicted_by"] == []
+    assert result["checks"][0]["possibly_contradicted_by"] == ["fruit sugar from dates (Fructose?)"]
+    assert "may be contradicted by fruit sugar from dates" in result["context"]
+
+
+@pytest.mark.parametrize("claims, ingredients, offender", [
+    ("dairy free", "milk solids, oats", "Milk"),
+    ("sugar free", "oats, Sugar", "Sugar"),
+    ("no MSG", "salt, INS 621", "Monosodium glutamate"),
+])
+def test_exact_contradiction_is_decided_locally(claims, ingredients, offender):
+    result = screen(claims, ingredients)
+    verdict = json.loads(result["verdict"])
+    assert verdict["verdict"] == "misleading"
+    assert offender in verdict["why"]
+    assert result["context"] == ""
+
+
+def test_claims_that_are_not_free_from_claims_go_to_the_llm():
+    # "high protein" can't be checked locally, so the whole answer is the model's
+    assert screen("high protein, sugar free", "whey, sugar")["verdict"] is None
+
+
+def test_consistent_claims_are_not_decided_locally():
+    assert screen("gluten free", "rice, salt")["verdict"] is None
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.api import jobs
+from app.api.jobs import JobQueue, JobStore, job_view
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 2)
+    queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), workers=0)
+    queue.store = JobStore(queue.path)
+    return queue
+
+
+def run_once(queue, results):
+    async def handler(payload):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def run():
+        jobs.HANDLERS["test"] = handler
+        try:
+            job = queue.store.claim(queue.owner)
+            await queue._run(job)
+        finally:
+            del jobs.HANDLERS["test"]
+
+    asyncio.run(run())
+
+
+def test_error_result_is_retried_then_failed(queue):
+    job_id = queue.store.add("test", "client", 5, {"url": "x"}, None)
+    results = [{"status": "error", "content": "AI processing error: boom"}] * 2
+
+    run_once(queue, results)
+    job = queue.store.get(job_id)
+    assert (job["status"], job["attempts"]) == ("queued", 1)
+
+    run_once(queue, results)
+    view = job_view(queue.store.get(job_id))
+    assert (view["status"], view["attempts"]) == ("failed", 2)
+    assert view["error"] == "AI processing error: boom"
+    assert "result" not in view
+
+
+def test_retry_can_succeed(queue):
+    job_id = queue.store.add("test", "client", 5, {"url": "x"}, None)
+    results = [RuntimeError("browser crashed"), {"status": "success", "product_info": {"title": "Oat bar"}}]
+
+    run_once(queue, results)
+    run_once(queue, results)
+    view = job_view(queue.store.get(job_id))
+    assert view["status"] == "done"
+    assert view["result"]["product_info"] == {"title": "Oat bar"}
+
+
+def test_not_parsed_is_a_result(queue):
+    # the AI answered, the job did its work
+    job_id = queue.store.add("test", "client", 5, {"url": "x"}, None)
+    run_once(queue, [{"status": "not_parsed", "raw_response": "..."}])
+    assert queue.store.get(job_id)["status"] == "done"
@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.url import parseJson, url_logic
+from app.api.url.json_repair import PARSE_TIERS, parse_product_json
+
+
+def tiers():
+    return {sample["labels"]["tier"]: sample["value"] for sample in PARSE_TIERS.snapshot()}
+
+
+def counted(before, after):
+    return {tier: after[tier] - before.get(tier, 0) for tier in after if after[tier] != before.get(tier, 0)}
+
+
+@pytest.mark.parametrize("text, tier", [
+    ('```json\n{"product_info": {"title": "Oat bar", "ingredients": ["oats"]}}\n```', "direct"),
+    ('Here you go: {"title": "Oat bar", "ingredients": ["oats"]} hope it helps', "direct"),
+    ("{'product_info': {'title': 'Oat bar', 'ingredients': ['oats',], 'ai_generated': False}}", "repaired"),
+    ('{"product_info": {“title”: “Oat bar”, "ingredients": null,}}', "repaired"),
+])
+def test_parse_product_json(text, tier):
+    before = tiers()
+    assert parse_product_json(text)["product_info"]["title"] == "Oat bar"
+    assert counted(before, tiers()) == {tier: 1}
+
+
+def test_not_a_product_needs_the_ai():
+    assert parse_product_json("Sorry, I can't read this page.") is None
+    assert parse_product_json('{"name": "Oat bar"}') is None
+
+
+def test_llm_repair_is_counted_once(monkeypatch):
+    answers = iter(["not json at all", '{"product_info": {"title": "Oat bar", "ingredients": ["oats"]}}'])
+
+    async def chat_completion(**kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=next(answers)))])
+
+    monkeypatch.setattr(url_logic, "chat_completion", chat_completion)
+    monkeypatch.setattr(parseJson, "chat_completion", chat_completion)
+    before = tiers()
+    result = asyncio.run(url_logic.process_with_ai("Ingredients: oats", "Oat bar"))
+    assert result["status"] == "success"
+    assert counted(before, tiers()) == {"llm": 1}
+
+
+@pytest.mark.parametrize("text, info", [
+    ('{"product_info": {"title": null, "ingredients": ["oats"]}}', {"title": None, "ingredients": ["oats"]}),
+    ('{"product_info": {"ingredients": ["oats"]}}', {"title": None, "ingredients": ["oats"]}),
+    ('{"product_info": {"title": "Oat bar", "ingredients": "oats, dates , salt,"}}', {"title": "Oat bar", "ingredients": ["oats", "dates", "salt"]}),
+    ('{"product_info": {"title": "Oat bar", "ingredients": ""}}', {"title": "Oat bar", "ingredients": None}),
+])
+def test_near_misses_are_coerced(text, info):
+    before = tiers()
+    parsed = parse_product_json(text)["product_info"]
+    assert {key: parsed[key] for key in info} == info
+    assert counted(before, tiers()) == {"direct": 1}
+
+
+def test_missing_title_comes_from_the_page(monkeypatch):
+    async def chat_completion(**kwargs):
+        content = '{"product_info": {"title": null, "ingredients": "oats, dates"}}'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(url_logic, "chat_completion", chat_completion)
+    result = asyncio.run(url_logic.process_with_ai("Ingredients: oats, dates", "Oat bar"))
+    assert result["product_info"] == {"title": "Oat bar", "ingredients": ["oats", "dates"], "ai_generated": False}
@@ -0,0 +1,87 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from app.api import admission, llm
+from app.api.llm import LLMClient
+
+# breakers and model stats live as long as the process, every test gets models of its own
+_names = itertools.count()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.setenv("GROQ_MAX_CONCURRENCY", "2")
+    monkeypatch.setattr(admission, "_limiters", {})
+    return LLMClient()
+
+
+def model():
+    return f"test-llm-{next(_names)}"
+
+
+def test_admitted_takes_and_gives_back_every_slot(client):
+    name = model()
+
+    async def run():
+        async with client.admitted(name):
+            per_model = admission.limiter(f"llm:{name}", 1)
+            assert (per_model.in_flight, client.limiter.in_flight, client.semaphore._value) == (1, 1, 1)
+        with pytest.raises(ValueError):
+            async with client.admitted(name):
+                raise ValueError("bad request")
+        return per_model
+
+    per_model = asyncio.run(run())
+    assert (per_model.in_flight, client.limiter.in_flight, client.semaphore._value) == (0, 0, 2)
+
+
+def test_admitted_caps_completions_in_flight(client):
+    name = model()
+    running, most = 0, 0
+
+    async def one():
+        nonlocal running, most
+        async with client.admitted(name):
+            running += 1
+            most = max(most, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def run():
+        await asyncio.gather(*(one() for _ in range(6)))
+
+    asyncio.run(run())
+    assert most == 2
+
+
+def test_chat_completion_uses_the_shared_client(client, monkeypatch):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+
+    monkeypatch.setattr(client.client.chat.completions, "create", create)
+    monkeypatch.setattr(llm, "_llm_client", client)
+    name = model()
+
+    async def run():
+        first = await llm.chat_completion(model=name, messages=[])
+        second = await llm.chat_completion(model=name, messages=[])
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.choices[0].message.content == second.choices[0].message.content == "ok"
+    assert calls == [{"model": name, "messages": []}] * 2
+    assert llm.get_llm_client() is client
+
+
+def test_close_forgets_the_client(client, monkeypatch):
+    monkeypatch.setattr(llm, "_llm_client", client)
+    asyncio.run(llm.close_llm_client())
+    assert llm._llm_client is None
+    assert client.http_client.is_closed
@@ -0,0 +1,91 @@
+import itertools
+
+import pytest
+
+from app.api import model_router
+from app.api.model_router import choose, route_context, route_version
+from app.api.resilience import breaker
+
+# breakers and stats live as long as the process, every test gets models of its own
+_names = itertools.count()
+
+
+@pytest.fixture
+def routes(monkeypatch):
+    small, large, text_only = (f"test-{kind}-{next(_names)}" for kind in ("small", "large", "text"))
+    config = {
+        "models": {
+            small: {"context": 8192, "json": True},
+            large: {"context": 131072, "json": True},
+            text_only: {"context": 131072, "json": False},
+        },
+        "tasks": {
+            "summary": {"tiers": [{"model": small, "max_input_tokens": 1000}, {"model": large}]},
+            "plain": {"tiers": [{"model": text_only, "max_input_tokens": 1000}, {"model": large}]},
+        },
+    }
+    monkeypatch.setattr(model_router, "_routes", config)
+    return config
+
+
+def request(json_mode=False, max_tokens=500):
+    body = {"model": "unused", "messages": [{"role": "user", "content": "x"}], "max_tokens": max_tokens}
+    if json_mode:
+        body["response_format"] = {"type": "json_object"}
+    return body
+
+
+def test_short_input_takes_the_first_tier(routes):
+    assert choose(routes["tasks"]["summary"], request(), 300, 200, False) == (0, "size", [])
+
+
+def test_long_input_takes_the_larger_tier(routes):
+    assert choose(routes["tasks"]["summary"], request(), 300, 5000, False)[:2] == (1, "size")
+
+
+def test_ambiguous_input_is_escalated(routes):
+    assert choose(routes["tasks"]["summary"], request(), 300, 200, True)[:2] == (1, "escalated")
+
+
+def test_input_over_the_context_skips_the_model(routes):
+    route = routes["tasks"]["summary"]
+    # under max_input_tokens, but the answer doesn't fit the small model's context
+    tier, reason, skipped = choose(route, request(max_tokens=8000), 300, 900, False)
+    assert (tier, reason) == (1, "context")
+    assert skipped == [f"{route['tiers'][0]['model']}: context"]
+
+
+def test_json_mode_excludes_models_without_it(routes):
+    assert choose(routes["tasks"]["plain"], request(json_mode=True), 300, 200, False)[0] == 1
+    assert choose(routes["tasks"]["plain"], request(), 300, 200, False)[0] == 0
+
+
+def test_open_breaker_moves_to_a_healthy_tier(routes):
+    route = routes["tasks"]["summary"]
+    small = route["tiers"][0]["model"]
+    breaker(small).failure(unavailable=True)
+    tier, reason, skipped = choose(route, request(), 300, 200, False)
+    assert (tier, reason) == (1, "unhealthy")
+    assert skipped == [f"{small}: circuit open"]
+
+
+def test_all_unhealthy_keeps_the_choice(routes):
+    route = routes["tasks"]["summary"]
+    for tier in route["tiers"]:
+        breaker(tier["model"]).failure(unavailable=True)
+    assert choose(route, request(), 300, 200, False)[:2] == (0, "size")
+
+
+def test_route_version(routes):
+    assert route_version("not-routed", "fixed-model") == "fixed-model"
+    version = route_version("summary", "unused")
+    assert version.startswith("route:")
+    routes["models"][routes["tasks"]["summary"]["tiers"][1]["model"]]["context"] = 32768
+    assert route_version("summary", "unused") != version
+
+
+def test_route_context_is_the_smallest_tier(routes):
+    # any tier can end up serving the request, the content has to fit all of them
+    assert route_context("summary", "unused") == 8192
+    assert route_context("not-routed", routes["tasks"]["summary"]["tiers"][1]["model"]) == 131072
+    assert route_context("not-routed", "unknown-model") == model_router.DEFAULT_CONTEXT
@@ -0,0 +1,41 @@
+import pytest
+
+from app.api.url.page_cache import normalize_url
+
+
+@pytest.mark.parametrize("url, normalized", [
+    # Amazon: any product URL -> /dp/<ASIN>
+    ("https://www.Amazon.in/Yoga-Bar-Muesli/dp/B07ABCDEFG/ref=sr_1_3?tag=x&th=1", "https://www.amazon.in/dp/B07ABCDEFG"),
+    ("https://amazon.com/gp/product/b07abcdefg?psc=1", "https://www.amazon.com/dp/B07ABCDEFG"),
+    ("https://m.amazon.co.uk/gp/aw/d/B07ABCDEFG", "https://www.amazon.co.uk/dp/B07ABCDEFG"),
+    # pasted without a scheme
+    ("www.amazon.in/dp/B07ABCDEFG", "https://www.amazon.in/dp/B07ABCDEFG"),
+    ("  shop.example.com/p/1?utm_source=x ", "https://shop.example.com/p/1"),
+    ("//shop.example.com/p/1", "https://shop.example.com/p/1"),
+    # other Amazon pages lose Amazon's tracking params only
+    ("https://www.amazon.in/s?k=muesli&ref=nb_sb&sr=8-1&utm_source=x", "https://www.amazon.in/s?k=muesli"),
+    # Flipkart: pid is the product
+    ("https://www.flipkart.com/muesli/p/itm123?pid=ABC&lid=LST1&otracker=search", "https://www.flipkart.com/muesli/p/itm123?pid=ABC"),
+    ("https://www.flipkart.com/search?q=oats&otracker=search&fm=x", "https://www.flipkart.com/search?q=oats"),
+    # click ids go everywhere, fragments too
+    ("https://Shop.Example.com/p/1?b=2&a=1&utm_medium=mail&gclid=z&fbclid=y#reviews", "https://shop.example.com/p/1?a=1&b=2"),
+    ("https://shop.example.com/p/1?msclkid=abc&a=1", "https://shop.example.com/p/1?a=1"),
+])
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+@pytest.mark.parametrize("url", [
+    # shop specific params are pages of their own elsewhere
+    "https://shop.example.com/p/1?store=blr&th=1",
+    "https://shop.example.com/p/1?sr=2&tag=vegan",
+    # not Flipkart, just ends like it
+    "https://notflipkart.com/p?lid=2&pid=1",
+    # not Amazon either
+    "https://amazon.evil.com/dp/B07ABCDEFG?tag=x",
+    "https://www.amazon.example.co.uk/dp/B07ABCDEFG?tag=x",
+    # short links are not resolved
+    "https://amzn.in/d/abc123",
+])
+def test_other_sites_keep_their_params(url):
+    assert normalize_url(url) == url
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from playwright.async_api import Error as PlaywrightError
+
+from app.api.url import page_load
+from app.api.url.page_load import is_blocked_host, wait_for_content
+
+
+class FakePage:
+    def __init__(self, states, closed=False):
+        self.states = list(states)
+        self.closed = closed
+        self.polls = 0
+
+    async def evaluate(self, script, args):
+        self.polls += 1
+        # the last state stays on the page
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        if isinstance(state, Exception):
+            raise state
+        return state
+
+    def is_closed(self):
+        return self.closed
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(page_load, "POLL_INTERVAL", 0.001)
+
+
+def test_navigation_mid_poll_keeps_waiting():
+    destroyed = PlaywrightError("Execution context was destroyed, most likely because of a navigation")
+    page = FakePage([destroyed, destroyed, {"length": 5000, "found": True}])
+    asyncio.run(wait_for_content(page, "content"))
+    assert page.polls == 3
+
+
+def test_closed_page_still_fails():
+    page = FakePage([PlaywrightError("Target page, context or browser has been closed")], closed=True)
+    with pytest.raises(PlaywrightError):
+        asyncio.run(wait_for_content(page, "content"))
+
+
+def test_stable_text_ends_the_wait():
+    page = FakePage([{"length": 100, "found": False}, {"length": 900, "found": False}])
+    asyncio.run(wait_for_content(page, "content"))
+    assert page.polls == 2 + page_load.STABLE_POLLS
+
+
+def test_blocked_hosts_include_subdomains():
+    assert is_blocked_host("stats.g.doubleclick.net")
+    assert is_blocked_host("WWW.Google-Analytics.com")
+    assert not is_blocked_host("notdoubleclick.net")
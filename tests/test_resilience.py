@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.api import resilience
+from app.api.admission import MAX_RETRY_AFTER, Overloaded
+from app.api.resilience import OPEN, breaker, call
+
+# breakers and model stats live as long as the process, every test gets models of its own
+_names = itertools.count()
+
+
+class GroqError(Exception):
+    def __init__(self, status_code, message="", headers=None):
+        super().__init__(message or f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+@pytest.fixture(autouse=True)
+def quick_retries(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_BASE", 0.001)
+    monkeypatch.setattr(resilience, "RETRY_MAX", 0.01)
+    monkeypatch.setattr(resilience, "RETRIES", 2)
+
+
+def model():
+    return f"test-resilience-{next(_names)}"
+
+
+def fake(answers):
+    # attempt(kwargs, kind): one answer (or error) per call, every call recorded
+    calls = []
+
+    async def attempt(kwargs, kind):
+        calls.append((kwargs["model"], kind))
+        answer = answers(kwargs["model"]) if callable(answers) else answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return attempt, calls
+
+
+def test_rate_limit_is_retried():
+    name = model()
+    attempt, calls = fake([GroqError(429), GroqError(503), "ok"])
+    assert asyncio.run(call(attempt, {"model": name})) == "ok"
+    assert calls == [(name, "first"), (name, "retry"), (name, "retry")]
+    assert breaker(name).failures == 0
+
+
+def test_huge_retry_after_is_capped():
+    # an hour long Retry-After would have used up the whole deadline
+    attempt, calls = fake([GroqError(429, headers={"retry-after": "3600"}), "ok"])
+    started = time.monotonic()
+    assert asyncio.run(call(attempt, {"model": model()}, deadline=5)) == "ok"
+    assert time.monotonic() - started < 1
+
+
+def test_bad_request_is_not_retried():
+    attempt, calls = fake([GroqError(400, "messages: field required"), "ok"])
+    with pytest.raises(GroqError):
+        asyncio.run(call(attempt, {"model": model()}))
+    assert len(calls) == 1
+
+
+def test_failing_model_falls_back(monkeypatch):
+    primary, fallback = model(), model()
+    monkeypatch.setattr(resilience, "FALLBACKS_BY_MODEL", {primary: fallback})
+    attempt, calls = fake(lambda name: GroqError(503) if name == primary else f"from {name}")
+    assert asyncio.run(call(attempt, {"model": primary})) == f"from {fallback}"
+    assert [name for name, _ in calls] == [primary] * 3 + [fallback]
+
+
+def test_decommissioned_model_opens_its_breaker_and_falls_back(monkeypatch):
+    primary, fallback = model(), model()
+    monkeypatch.setattr(resilience, "FALLBACKS_BY_MODEL", {primary: fallback})
+    gone = GroqError(400, "The model has been decommissioned and is no longer supported")
+    attempt, calls = fake(lambda name: gone if name == primary else "ok")
+    assert asyncio.run(call(attempt, {"model": primary})) == "ok"
+    assert breaker(primary).state == OPEN
+    # the next call skips it without trying
+    calls.clear()
+    assert asyncio.run(call(attempt, {"model": primary})) == "ok"
+    assert calls == [(fallback, "first")]
+
+
+def test_every_model_failing_is_a_bounded_503():
+    attempt, calls = fake(lambda name: GroqError(429, headers={"retry-after": "3600"}))
+    with pytest.raises(Overloaded) as shed:
+        asyncio.run(call(attempt, {"model": model()}))
+    assert shed.value.status_code == 503
+    assert shed.value.retry_after == MAX_RETRY_AFTER
+    assert shed.value.headers["Retry-After"] == str(MAX_RETRY_AFTER)
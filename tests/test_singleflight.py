@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.api.singleflight import SingleFlight
+
+
+def counting(result="done", error=None, delay=0.02):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return fn, calls
+
+
+def test_concurrent_identical_requests_share_one_call():
+    flights = SingleFlight("test")
+    fn, calls = counting()
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("key", fn) for _ in range(5)), flights.do("other", fn))
+        return results
+
+    assert asyncio.run(run()) == ["done"] * 6
+    assert len(calls) == 2
+    assert flights.in_flight() == 0
+
+
+def test_done_work_is_not_reused():
+    flights = SingleFlight("test")
+    fn, calls = counting()
+
+    async def run():
+        await flights.do("key", fn)
+        await flights.do("key", fn)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight("test")
+    fn, calls = counting(error=RuntimeError("browser crashed"))
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", fn) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 1 and flights.in_flight() == 0
+
+
+def test_a_cancelled_waiter_doesnt_cancel_the_work():
+    flights = SingleFlight("test")
+    fn, calls = counting(delay=0.05)
+
+    async def run():
+        leaving = asyncio.ensure_future(flights.do("key", fn))
+        staying = asyncio.ensure_future(flights.do("key", fn))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    assert asyncio.run(run()) == "done"
+    assert len(calls) == 1
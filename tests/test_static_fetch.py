@@ -0,0 +1,60 @@
+from app.api.url.static_fetch import TIER_MISSES, DomainTierCache, TextExtractor, domain_of
+
+
+def extract(html: str) -> TextExtractor:
+    parser = TextExtractor()
+    # fed in pieces, like the streamed download
+    for start in range(0, len(html), 7):
+        parser.feed(html[start:start + 7])
+    parser.close()
+    return parser
+
+
+def test_text_extractor_drops_page_chrome():
+    page = extract(
+        "<html><head><title>Oat  Bar</title><style>p{}</style></head><body>"
+        "<nav><ul><li>Home</li></ul></nav><div role='banner'>Sale!</div>"
+        "<div class='advertisement'><div>Buy</div></div>"
+        "<p>Ingredients:<br>oats, dates</p><script>var x = '<p>';</script><footer>About</footer>"
+        "</body></html>"
+    )
+    assert page.title == "Oat Bar"
+    assert page.text == "Ingredients: oats, dates"
+
+
+def test_domain_of():
+    assert domain_of("https://WWW.Example.com/p/1") == "example.com"
+    assert domain_of("https://shop.example.com") == "shop.example.com"
+
+
+def test_learned_tier_is_not_extended(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.api.url.static_fetch.time.monotonic", lambda: now[0])
+    tiers = DomainTierCache(ttl=100)
+    tiers.set("example.com", "static")
+    now[0] = 1090.0
+    tiers.set("example.com", "static")
+    assert tiers.get("example.com") == "static"
+    # expires 100s after it was learned, so the domain gets probed again
+    now[0] = 1101.0
+    assert tiers.get("example.com") is None
+
+
+def test_static_domain_moves_to_the_browser_after_misses():
+    tiers = DomainTierCache()
+    tiers.set("example.com", "static")
+    for _ in range(TIER_MISSES - 1):
+        tiers.miss("example.com")
+    assert tiers.get("example.com") == "static"
+    tiers.miss("example.com")
+    assert tiers.get("example.com") == "browser"
+
+
+def test_good_static_page_resets_the_misses():
+    tiers = DomainTierCache()
+    tiers.set("example.com", "static")
+    for _ in range(TIER_MISSES - 1):
+        tiers.miss("example.com")
+    tiers.set("example.com", "static")
+    tiers.miss("example.com")
+    assert tiers.get("example.com") == "static"